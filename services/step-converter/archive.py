@@ -0,0 +1,70 @@
+"""
+Streaming ZIP archives of conversion results.
+Entries are compressed and yielded chunk by chunk, so an archive of many
+STEP files never has to be held in memory or written to disk first.
+"""
+import io
+import zipfile
+from typing import Callable, Iterable, Iterator, List, Tuple
+
+from compression import GZIP_LEVEL
+
+
+# (name in the archive, callable returning the entry's uncompressed chunks)
+ArchiveEntry = Tuple[str, Callable[[], Iterator[bytes]]]
+
+
+class _StreamBuffer(io.RawIOBase):
+    """Write-only, unseekable sink that collects what zipfile writes until drained."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def unique_name(name: str, taken: set) -> str:
+    """Return name, or name with a numeric suffix if it is already in taken."""
+    stem, dot, ext = name.rpartition(".")
+    if not dot:
+        stem, ext = name, ""
+    candidate = name
+    counter = 2
+    while candidate in taken:
+        candidate = f"{stem}-{counter}{dot}{ext}"
+        counter += 1
+    taken.add(candidate)
+    return candidate
+
+
+def iter_zip(entries: Iterable[ArchiveEntry]) -> Iterator[bytes]:
+    """
+    Yield a deflated ZIP archive of entries as it is written.
+
+    Because the output is not seekable, sizes and CRCs follow each entry in
+    a data descriptor, which every common unzip tool understands.
+    """
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED, compresslevel=GZIP_LEVEL) as archive:
+        for name, read in entries:
+            with archive.open(name, "w") as entry:
+                for chunk in read():
+                    entry.write(chunk)
+                    data = buffer.drain()
+                    if data:
+                        yield data
+            data = buffer.drain()
+            if data:
+                yield data
+    # Central directory
+    yield buffer.drain()
@@ -0,0 +1,375 @@
+"""
+Benchmark harness for the STEP converter service.
+
+Runs a corpus of representative OpenSCAD models either directly through
+converter.convert_scad_to_step or against the HTTP API, and reports latency
+percentiles, throughput and peak memory.
+
+    python bench/bench.py direct [--stub] [--repeat 3] [--concurrency 2]
+    python bench/bench.py http --serve [--stub] [--concurrency 8] [--repeat 5]
+    python bench/bench.py http --url http://localhost:8080 --concurrency 8
+
+--stub puts the stand-in openscad and freecadcmd from bench/stub first on
+PATH so the service's own overhead can be measured without the toolchain.
+"""
+import os
+import re
+import sys
+import json
+import math
+import time
+import uuid
+import socket
+import argparse
+import threading
+import subprocess
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVICE_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, SERVICE_DIR)
+
+from converter import classify_error, convert_scad_to_step  # noqa: E402
+from resources import process_tree_rss_bytes  # noqa: E402
+
+
+DEFAULT_CORPUS_DIR = os.path.join(BENCH_DIR, "corpus")
+STUB_BIN_DIR = os.path.join(BENCH_DIR, "stub", "bin")
+# Long-poll used while waiting on the HTTP API; the server caps it at MAX_WAIT_SECONDS
+HTTP_WAIT_SECONDS = 30
+RSS_SAMPLE_INTERVAL_SECONDS = 0.1
+# Retry-After is an estimate for interactive clients; retry sooner to keep the queue full
+MAX_RETRY_DELAY_SECONDS = 1.0
+SERVER_STARTUP_TIMEOUT_SECONDS = 60
+
+
+@dataclass
+class Model:
+    name: str
+    code: str
+    expect: str = "success"  # "success" or a converter.classify_error class
+
+
+@dataclass
+class Sample:
+    model: str
+    seconds: float
+    outcome: str
+    expected: str
+    output_bytes: int = 0
+    peak_rss_bytes: Optional[int] = None  # As reported by the service per job
+
+
+@dataclass
+class RunResult:
+    samples: List[Sample]
+    wall_seconds: float
+    peak_rss_bytes: int
+    rejected: int = 0
+
+
+def load_corpus(corpus_dir: str, only: Optional[List[str]] = None) -> List[Model]:
+    """Load *.scad files; a "// expect: <class>" line marks models that should fail."""
+    models = []
+    for filename in sorted(os.listdir(corpus_dir)):
+        name, ext = os.path.splitext(filename)
+        if ext != ".scad" or (only and name not in only):
+            continue
+        with open(os.path.join(corpus_dir, filename), encoding="utf-8") as f:
+            code = f.read()
+        match = re.search(r"^//\s*expect:\s*(\S+)", code, re.M)
+        models.append(Model(name, code, match.group(1) if match else "success"))
+    return models
+
+
+def unique_code(model: Model) -> str:
+    """Append a unique comment so the result cache and coalescing do not kick in."""
+    return f"{model.code}\n// bench {uuid.uuid4()}\n"
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Nearest-rank percentile."""
+    if not values:
+        return math.nan
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1))]
+
+
+class RssSampler:
+    """Background thread tracking the peak RSS of a process tree."""
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.peak_bytes = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak_bytes = max(self.peak_bytes, process_tree_rss_bytes([self.pid]))
+            self._stop.wait(RSS_SAMPLE_INTERVAL_SECONDS)
+
+    def __enter__(self) -> "RssSampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_jobs(jobs: List[Model], concurrency: int, run_one: Callable[[Model], Sample]) -> List[Sample]:
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(run_one, jobs))
+
+
+def bench_direct(models: List[Model], args: argparse.Namespace) -> RunResult:
+    """Drive converter.convert_scad_to_step in this process."""
+
+    def run_one(model: Model) -> Sample:
+        started = time.monotonic()
+        result, error = convert_scad_to_step(model.code, pipeline=args.pipeline)
+        return Sample(
+            model=model.name,
+            seconds=time.monotonic() - started,
+            outcome=classify_error(error) if error else "success",
+            expected=model.expect,
+            output_bytes=len(result)
+        )
+
+    jobs = [model for _ in range(args.repeat) for model in models]
+    with RssSampler(os.getpid()) as sampler:
+        started = time.monotonic()
+        samples = run_jobs(jobs, args.concurrency, run_one)
+        wall = time.monotonic() - started
+    return RunResult(samples, wall, sampler.peak_bytes)
+
+
+class ApiClient:
+    def __init__(self, base_url: str, token: str):
+        self.base_url = base_url.rstrip("/")
+        self.token = token
+
+    def request(self, method: str, path: str, body: Optional[dict] = None):
+        """Returns (status, headers, body bytes); HTTP errors are returned, not raised."""
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        request = urllib.request.Request(self.base_url + path, data=data, method=method)
+        request.add_header("Accept-Encoding", "identity")
+        if data is not None:
+            request.add_header("Content-Type", "application/json")
+        if self.token:
+            request.add_header("Authorization", f"Bearer {self.token}")
+        try:
+            with urllib.request.urlopen(request, timeout=HTTP_WAIT_SECONDS + 30) as response:
+                return response.status, response.headers, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers, e.read()
+
+
+def bench_http(models: List[Model], args: argparse.Namespace, client: ApiClient) -> RunResult:
+    """Submit, wait for and download every job through the HTTP API."""
+    rejected = 0
+    lock = threading.Lock()
+
+    def run_one(model: Model) -> Sample:
+        nonlocal rejected
+        code = model.code if args.allow_cache else unique_code(model)
+        started = time.monotonic()
+        while True:
+            status, headers, body = client.request(
+                "POST", f"/convert?wait={HTTP_WAIT_SECONDS}", {"code": code, "filename": model.name}
+            )
+            if status != 503:
+                break
+            with lock:
+                rejected += 1
+            time.sleep(min(float(headers.get("Retry-After", "1")), MAX_RETRY_DELAY_SECONDS))
+        if status != 200:
+            return Sample(model.name, time.monotonic() - started, f"http_{status}", model.expect)
+
+        job_id = json.loads(body)["jobId"]
+        while True:
+            status, _, body = client.request("GET", f"/status/{job_id}?wait={HTTP_WAIT_SECONDS}")
+            if status != 200:
+                return Sample(model.name, time.monotonic() - started, f"http_{status}", model.expect)
+            job = json.loads(body)
+            if job["status"] in ("completed", "failed", "cancelled"):
+                break
+
+        output_bytes = 0
+        if job["status"] == "completed":
+            status, _, body = client.request("GET", f"/download/{job_id}")
+            outcome = "success" if status == 200 else f"http_{status}"
+            output_bytes = len(body)
+        else:
+            outcome = classify_error(job["error"] or "")
+        return Sample(
+            model=model.name,
+            seconds=time.monotonic() - started,
+            outcome=outcome,
+            expected=model.expect,
+            output_bytes=output_bytes,
+            peak_rss_bytes=job.get("peakMemoryBytes")
+        )
+
+    jobs = [model for _ in range(args.repeat) for model in models]
+    started = time.monotonic()
+    samples = run_jobs(jobs, args.concurrency, run_one)
+    return RunResult(samples, time.monotonic() - started, 0, rejected)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(env: Dict[str, str]) -> Tuple[subprocess.Popen, str]:
+    """Start the API with uvicorn on a free local port and wait until it is healthy."""
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=SERVICE_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + SERVER_STARTUP_TIMEOUT_SECONDS
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("Service exited during startup")
+        try:
+            with urllib.request.urlopen(base_url + "/health", timeout=1):
+                return process, base_url
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("Service did not become healthy in time")
+
+
+def format_bytes(value: Optional[float]) -> str:
+    if not value:
+        return "-"
+    if value < 1024 * 1024:
+        return f"{value / 1024:.1f}KB"
+    return f"{value / (1024 * 1024):.1f}MB"
+
+
+def summarize(samples: List[Sample]) -> dict:
+    latencies = [s.seconds for s in samples]
+    return {
+        "runs": len(samples),
+        "ok": sum(1 for s in samples if s.outcome == s.expected),
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "meanOutputBytes": sum(s.output_bytes for s in samples) / len(samples),
+        "maxJobRssBytes": max((s.peak_rss_bytes or 0 for s in samples), default=0) or None,
+    }
+
+
+def report(result: RunResult, args: argparse.Namespace) -> dict:
+    by_model: Dict[str, List[Sample]] = {}
+    for sample in result.samples:
+        by_model.setdefault(sample.model, []).append(sample)
+
+    rows = [(name, summarize(samples)) for name, samples in by_model.items()]
+    overall = summarize(result.samples)
+    rows.append(("all", overall))
+
+    print(f"{'model':<20} {'runs':>5} {'ok':>5} {'p50':>8} {'p95':>8} {'p99':>8} {'output':>9} {'job rss':>9}")
+    for name, row in rows:
+        print(
+            f"{name:<20} {row['runs']:>5} {row['ok']:>5} "
+            f"{row['p50']:>7.2f}s {row['p95']:>7.2f}s {row['p99']:>7.2f}s "
+            f"{format_bytes(row['meanOutputBytes']):>9} {format_bytes(row['maxJobRssBytes']):>9}"
+        )
+
+    jobs_per_minute = len(result.samples) / result.wall_seconds * 60 if result.wall_seconds else 0
+    print()
+    print(
+        f"{len(result.samples)} jobs in {result.wall_seconds:.1f}s at concurrency "
+        f"{args.concurrency}: {jobs_per_minute:.1f} jobs/min"
+    )
+    if result.peak_rss_bytes:
+        print(f"Peak RSS: {format_bytes(result.peak_rss_bytes)}")
+    if result.rejected:
+        print(f"Submissions rejected with 503 and retried: {result.rejected}")
+
+    unexpected = [s for s in result.samples if s.outcome != s.expected]
+    for sample in unexpected:
+        print(f"Unexpected outcome for {sample.model}: {sample.outcome} (expected {sample.expected})")
+
+    return {
+        "mode": args.mode,
+        "stub": args.stub,
+        "concurrency": args.concurrency,
+        "wallSeconds": result.wall_seconds,
+        "jobsPerMinute": jobs_per_minute,
+        "peakRssBytes": result.peak_rss_bytes or None,
+        "rejected": result.rejected,
+        "unexpected": len(unexpected),
+        "models": dict(rows),
+    }
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("mode", choices=["direct", "http"])
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS_DIR, help="Directory of .scad models")
+    parser.add_argument("--models", nargs="*", help="Only run these models (file names without .scad)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per model")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--stub", action="store_true", help="Use the stand-in openscad and freecadcmd")
+    parser.add_argument("--pipeline", choices=["single", "two_pass"], help="direct mode pipeline")
+    parser.add_argument("--url", default="http://localhost:8080", help="http mode service URL")
+    parser.add_argument("--serve", action="store_true", help="http mode: start a local service to benchmark")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="Extra environment for --serve, e.g. FREECAD_POOL_SIZE=0")
+    parser.add_argument("--token", default=os.environ.get("STEP_CONVERTER_API_SECRET", ""))
+    parser.add_argument("--allow-cache", action="store_true",
+                        help="http mode: submit identical code so the result cache and coalescing apply")
+    parser.add_argument("--json", metavar="PATH", help="Also write the summary as JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str]) -> int:
+    args = parse_args(argv)
+    models = load_corpus(args.corpus, args.models)
+    if not models:
+        print(f"No models found in {args.corpus}")
+        return 1
+
+    if args.stub:
+        os.environ["PATH"] = STUB_BIN_DIR + os.pathsep + os.environ.get("PATH", "")
+
+    if args.mode == "direct":
+        result = bench_direct(models, args)
+    elif args.serve:
+        env = dict(os.environ)
+        env.update(item.split("=", 1) for item in args.env)
+        server, base_url = start_server(env)
+        try:
+            with RssSampler(server.pid) as sampler:
+                result = bench_http(models, args, ApiClient(base_url, args.token))
+            result.peak_rss_bytes = sampler.peak_bytes
+        finally:
+            server.terminate()
+            server.wait()
+    else:
+        result = bench_http(models, args, ApiClient(args.url, args.token))
+
+    summary = report(result, args)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+    return 1 if summary["unexpected"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
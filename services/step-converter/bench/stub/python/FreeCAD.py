@@ -0,0 +1,33 @@
+"""Stub of the FreeCAD module: parameters and documents only."""
+
+
+class _ParameterGroup:
+    def SetString(self, name, value):
+        pass
+
+
+def ParamGet(path):
+    return _ParameterGroup()
+
+
+class Document:
+    def __init__(self, name):
+        self.Name = name
+        self.Objects = []
+
+
+_documents = {}
+
+
+def newDocument(name):
+    document = Document(name)
+    _documents[name] = document
+    return document
+
+
+def getDocument(name):
+    return _documents[name]
+
+
+def closeDocument(name):
+    _documents.pop(name, None)
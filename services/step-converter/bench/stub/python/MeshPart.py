@@ -0,0 +1,27 @@
+"""Stub of FreeCAD's MeshPart module: twelve triangles per face of the shape."""
+
+
+class Vector:
+    def __init__(self, x, y, z):
+        self.x, self.y, self.z = x, y, z
+
+    def __getitem__(self, index):
+        return (self.x, self.y, self.z)[index]
+
+
+class Mesh:
+    def __init__(self, facets):
+        self.facet_count = facets
+
+    @property
+    def Topology(self):
+        points = [Vector(0.0, 0.0, 0.0), Vector(10.0, 0.0, 0.0), Vector(0.0, 10.0, 0.0)]
+        return points, [(0, 1, 2)] * self.facet_count
+
+    def write(self, path):
+        with open(path, "w") as f:
+            f.write("solid stub\n" + "facet normal 0 0 1\nendfacet\n" * self.facet_count + "endsolid stub\n")
+
+
+def meshFromShape(Shape, **tolerances):
+    return Mesh(12 * Shape.face_count)
@@ -0,0 +1,58 @@
+"""Stub of FreeCAD's Part module: box-like shapes that export a sized STEP file."""
+
+
+class BoundBox:
+    def __init__(self, size):
+        self.XLength = self.YLength = self.ZLength = size
+        self.DiagonalLength = size * 3 ** 0.5
+
+
+class Shape:
+    def __init__(self, faces=6, volume=1000.0):
+        self.face_count = faces
+        self.Volume = volume
+
+    def isNull(self):
+        return False
+
+    def copy(self):
+        return Shape(self.face_count, self.Volume)
+
+    @property
+    def Faces(self):
+        return [None] * self.face_count
+
+    @property
+    def Solids(self):
+        return [self]
+
+    @property
+    def BoundBox(self):
+        return BoundBox(self.Volume ** (1 / 3))
+
+    def removeSplitter(self):
+        return Shape(max(6, self.face_count // 2), self.Volume)
+
+    def exportStep(self, path):
+        # Real STEP output is roughly 40 entities per face
+        with open(path, "w") as f:
+            f.write("ISO-10303-21;\nHEADER;\nFILE_NAME('stub');\nENDSEC;\nDATA;\n")
+            for index in range(self.face_count * 40):
+                f.write(f"#{index + 1}=CARTESIAN_POINT('',(0.,0.,{index}.));\n")
+            f.write("ENDSEC;\nEND-ISO-10303-21;\n")
+
+    def exportBrep(self, path):
+        with open(path, "w") as f:
+            f.write(self.exportBrepToString())
+
+    def exportBrepToString(self):
+        return f"DBRep_DrawableShape stub {self.face_count} {self.Volume!r}\n"
+
+    def importBrepFromString(self, brep):
+        _, _, faces, volume = brep.split()
+        self.face_count = int(faces)
+        self.Volume = float(volume)
+
+
+def makeCompound(shapes):
+    return Shape(sum(s.face_count for s in shapes), sum(s.Volume for s in shapes))
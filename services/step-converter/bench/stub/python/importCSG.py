@@ -0,0 +1,43 @@
+"""
+Stub of FreeCAD's OpenSCAD importer: one object per cube in the CSG file.
+Simulated import time comes from BENCH_STUB_FREECAD_SECONDS (per object).
+"""
+import os
+import re
+import time
+import subprocess
+
+import FreeCAD
+import Part
+
+
+class _Feature:
+    TypeId = "Part::Feature"
+
+    def __init__(self, name, shape):
+        self.Name = self.Label = name
+        self.Shape = shape
+        self.InList = []
+
+    def touch(self):
+        pass
+
+    def recompute(self):
+        return True
+
+
+def insert(path, document_name):
+    document = FreeCAD.getDocument(document_name)
+    if path.endswith(".scad"):
+        # Two-pass mode hands over the .scad file; evaluate it like importCSG does
+        csg_path = path[:-len(".scad")] + "_import.csg"
+        result = subprocess.run(["openscad", "-o", csg_path, path], capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr)
+        path = csg_path
+
+    with open(path) as f:
+        solids = len(re.findall(r"\bcube\(", f.read()))
+    time.sleep(solids * float(os.environ.get("BENCH_STUB_FREECAD_SECONDS", "0.02")))
+    for index in range(solids):
+        document.Objects.append(_Feature(f"Cube{index:03d}" if index else "Cube", Part.Shape()))
@@ -0,0 +1,105 @@
+"""
+Content-addressed store of the files a multi-file project shares between
+conversions: helper modules it includes or uses and assets it imports.
+Each file is kept once, named after the SHA-256 of its content, so clients
+upload only what the store is missing, and conversions hard-link the files
+into their workspace instead of writing them out again.
+"""
+import os
+import re
+import hashlib
+from typing import Iterable, List
+
+
+BLOB_SUFFIX = ".blob"
+
+_DIGEST = re.compile(r'^[0-9a-f]{64}$')
+
+
+def is_digest(value: str) -> bool:
+    """Whether value is a lowercase hex SHA-256 digest."""
+    return bool(_DIGEST.match(value))
+
+
+def blob_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class BlobStore:
+    """
+    Directory of blobs named <digest[:2]>/<digest>.blob.
+
+    Blobs are read-only once written, since workspaces hard-link them. The
+    least recently used ones are pruned once they exceed max_bytes; a
+    workspace that already linked a pruned blob keeps its copy.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest[:2], digest + BLOB_SUFFIX)
+
+    def missing(self, digests: Iterable[str]) -> List[str]:
+        """The given digests that are not stored, without duplicates."""
+        return [
+            digest for digest in dict.fromkeys(digests)
+            if not os.path.exists(self.path(digest))
+        ]
+
+    def put(self, digest: str, data: bytes) -> bool:
+        """
+        Store data under its digest; returns False if it was already stored.
+
+        Raises ValueError if data does not hash to digest.
+        """
+        if blob_digest(data) != digest:
+            raise ValueError(f"Content does not match SHA-256 {digest}")
+        path = self.path(digest)
+        if os.path.exists(path):
+            self.touch([digest])
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.chmod(tmp_path, 0o444)
+        os.replace(tmp_path, path)
+        return True
+
+    def touch(self, digests: Iterable[str]):
+        """Mark blobs as recently used so pruning keeps them."""
+        for digest in digests:
+            try:
+                os.utime(self.path(digest))
+            except OSError:
+                pass
+
+    def prune(self) -> int:
+        """Remove least recently used blobs until under max_bytes; returns the number removed."""
+        entries = []
+        for root, _dirs, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(BLOB_SUFFIX):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _mtime, size, _path in entries)
+        removed = 0
+        for _mtime, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                removed += 1
+            except OSError:
+                pass
+        return removed
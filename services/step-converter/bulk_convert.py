@@ -0,0 +1,431 @@
+"""
+Offline bulk conversion of OpenSCAD files, e.g. to re-convert an archive of
+designs after a FreeCAD or library upgrade, without going through the HTTP API.
+
+    python bulk_convert.py designs/ --output converted/
+    python bulk_convert.py --manifest files.txt --output converted/ --formats stl,glb
+    python bulk_convert.py designs/ --output converted/ --jobs 8 --max-rss 2048 --report report.jsonl
+
+Directories are searched recursively for .scad files; a manifest lists one
+path per line, relative to the manifest. Every file is converted through a
+pool of warm FreeCAD workers, sized to the machine unless --jobs is given,
+and its outputs are written to the output directory under the file's path
+relative to the current directory (its absolute path for files outside
+it). Files it includes, uses or imports from its own directory and below
+are converted with it; a file referencing one further up fails. A
+<name>.convert.json file next to them records the content
+hash they were made from, so files whose outputs are up to date are skipped
+and an interrupted run resumes where it stopped.
+
+One JSON line per file (path, status, seconds, output sizes, peak RSS and
+error) is written to the report as soon as the file is done.
+"""
+import os
+import re
+import sys
+import json
+import time
+import asyncio
+import hashlib
+import argparse
+import subprocess
+from dataclasses import dataclass
+from typing import Dict, List, Optional, TextIO, Tuple
+
+from converter import (
+    classify_error,
+    convert_scad_async,
+    normalize_formats,
+    validate_project_path,
+    workspace_pool,
+)
+from freecad_job import (
+    AUTO_REFINE_FACES,
+    AUTO_REFINE_MAX_FACES,
+    DEFAULT_MESH_DEFLECTION,
+    MESH_FORMATS,
+    REFINE_AUTO,
+    REFINE_POLICIES,
+)
+from freecad_pool import FreeCADPool, convert_scad_pooled
+from quality import EXACT, QUALITY_LEVELS, apply_quality
+from resources import process_tree_rss_bytes
+from result_cache import make_cache_key
+from scheduler import default_concurrency
+
+
+STATE_SUFFIX = ".convert.json"
+# Per-job memory assumed when sizing the pool to the machine
+JOB_MEMORY_ESTIMATE_MB = 600
+RSS_SAMPLE_INTERVAL_SECONDS = 0.2
+WORKER_MAX_JOBS = 50
+FREECAD_VERSION_TIMEOUT_SECONDS = 60
+
+# include <...>, use <...> and import()/surface() file names, relative to the including file
+_REFERENCE = re.compile(
+    r'\b(?:include|use)\s*<([^>]+)>'
+    r'|\b(?:import|surface)\s*\(\s*(?:file\s*=\s*)?"([^"]+)"'
+)
+
+
+@dataclass
+class Source:
+    path: str  # Absolute path of the .scad file
+    name: str  # Path the outputs are written under, relative to the output directory, without .scad
+
+
+@dataclass
+class Options:
+    formats: List[str]
+    mesh_deflection: float
+    refine_policy: str
+    quality: str
+    pipeline: Optional[str]
+    solid_workers: int
+    max_rss_bytes: int  # 0 = no limit
+
+
+def output_name(path: str) -> str:
+    """Where the outputs of the .scad file at path go: its path relative to the current directory, without .scad."""
+    name = os.path.relpath(path)
+    if name == os.pardir or name.startswith(os.pardir + os.sep):
+        # Outside the current directory: the absolute path below the output directory
+        name = os.path.splitdrive(path)[1].lstrip(os.sep)
+    return os.path.splitext(name)[0]
+
+
+def find_sources(inputs: List[str], manifest: Optional[str]) -> List[Source]:
+    """
+    The .scad files named by inputs and the manifest, without duplicates.
+
+    Raises ValueError if two files would write to the same outputs.
+    """
+    sources: Dict[str, Source] = {}
+
+    def add(path: str):
+        path = os.path.abspath(path)
+        sources.setdefault(path, Source(path, output_name(path)))
+
+    for entry in inputs:
+        if os.path.isdir(entry):
+            for root, dirs, files in os.walk(entry):
+                dirs.sort()
+                for filename in sorted(files):
+                    if filename.endswith(".scad"):
+                        add(os.path.join(root, filename))
+        else:
+            add(entry)
+
+    if manifest:
+        with (sys.stdin if manifest == "-" else open(manifest, encoding="utf-8")) as f:
+            lines = f.read().splitlines()
+        root = os.getcwd() if manifest == "-" else os.path.dirname(os.path.abspath(manifest))
+        for line in lines:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                add(os.path.join(root, line))
+
+    by_name: Dict[str, str] = {}
+    for source in sources.values():
+        other = by_name.setdefault(source.name, source.path)
+        if other != source.path:
+            raise ValueError(f"{other} and {source.path} would both be written to {source.name}")
+    return list(sources.values())
+
+
+def referenced_files(scad_path: str) -> Dict[str, str]:
+    """
+    Files below scad_path's directory that it includes, uses or imports,
+    recursively, as {project path: absolute path}. These are placed next to
+    the code in its workspace. References that do not resolve to a file are
+    left to OpenSCAD's library path, and absolute ones to the file system.
+
+    Raises ValueError for a relative reference to an existing file outside
+    scad_path's directory, which the workspace cannot provide, or one that
+    is not a valid project path.
+    """
+    base = os.path.dirname(scad_path)
+    found: Dict[str, str] = {}
+    pending = [scad_path]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(current, encoding="utf-8", errors="replace") as f:
+                text = f.read()
+        except OSError:
+            continue
+        for match in _REFERENCE.finditer(text):
+            reference = match.group(1) or match.group(2)
+            target = os.path.normpath(os.path.join(os.path.dirname(current), reference))
+            relative = os.path.relpath(target, base).replace(os.sep, "/")
+            if relative in found or os.path.isabs(reference) or not os.path.isfile(target):
+                continue
+            if relative.split("/")[0] == os.pardir:
+                raise ValueError(
+                    f"{current} references {reference}, outside {base}; "
+                    f"convert a copy with the file moved inside that directory"
+                )
+            error = validate_project_path(relative)
+            if error:
+                raise ValueError(f"{current} references {reference}: {error}")
+            found[relative] = target
+            if target.endswith(".scad"):
+                pending.append(target)
+    return found
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def freecad_version() -> str:
+    """Version reported by freecadcmd, so that upgrading FreeCAD invalidates earlier outputs."""
+    try:
+        result = subprocess.run(
+            ["freecadcmd", "--version"],
+            capture_output=True,
+            text=True,
+            timeout=FREECAD_VERSION_TIMEOUT_SECONDS
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return "unknown"
+    match = re.search(r"\d+\.\d+(?:\.\d+)?", result.stdout)
+    return match.group(0) if match and result.returncode == 0 else "unknown"
+
+
+def source_key(code: str, files: Dict[str, str], options: Options, version: str) -> str:
+    """Content hash of everything a file's outputs depend on."""
+    return make_cache_key(
+        code,
+        files={path: file_digest(target) for path, target in files.items()},
+        formats=options.formats,
+        mesh_deflection=(
+            options.mesh_deflection if any(fmt in MESH_FORMATS for fmt in options.formats) else None
+        ),
+        refine=options.refine_policy,
+        auto_refine_faces=(
+            [AUTO_REFINE_FACES, AUTO_REFINE_MAX_FACES] if options.refine_policy == REFINE_AUTO else None
+        ),
+        quality=options.quality,
+        pipeline=options.pipeline,
+        freecad=version
+    )
+
+
+def output_paths(output_dir: str, source: Source, formats: List[str]) -> Tuple[Dict[str, str], str]:
+    """({format: output path}, state file path) of a source."""
+    stem = os.path.join(output_dir, source.name)
+    return {fmt: f"{stem}.{fmt}" for fmt in formats}, stem + STATE_SUFFIX
+
+
+def up_to_date(paths: Dict[str, str], state_path: str, key: str) -> bool:
+    try:
+        with open(state_path, encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return state.get("key") == key and all(os.path.exists(path) for path in paths.values())
+
+
+def write_file(path: str, data: bytes):
+    """Write data to path atomically, so an interrupted run never leaves a partial output."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+async def watch_rss(pids: List[int], max_bytes: int, task: asyncio.Task, usage: dict):
+    """Track the peak RSS of a conversion's processes, cancelling it beyond max_bytes."""
+    while True:
+        await asyncio.sleep(RSS_SAMPLE_INTERVAL_SECONDS)
+        rss = process_tree_rss_bytes(pids)
+        usage["peak"] = max(usage["peak"], rss)
+        if max_bytes and rss > max_bytes:
+            usage["exceeded"] = True
+            task.cancel()
+            return
+
+
+async def convert_source(
+    source: Source,
+    output_dir: str,
+    options: Options,
+    version: str,
+    force: bool,
+    pool: Optional[FreeCADPool]
+) -> dict:
+    """Convert one file unless its outputs are up to date; returns its report line."""
+    record = {"path": source.path, "output": source.name, "status": "skipped"}
+    started = time.monotonic()
+    try:
+        with open(source.path, encoding="utf-8") as f:
+            code = f.read()
+    except (OSError, UnicodeDecodeError) as e:
+        record.update(status="failed", error=f"Cannot read file: {e}", errorClass="read_error")
+        return record
+
+    try:
+        files = referenced_files(source.path)
+    except ValueError as e:
+        record.update(status="failed", error=str(e), errorClass="outside_reference")
+        return record
+    key = source_key(code, files, options, version)
+    paths, state_path = output_paths(output_dir, source, options.formats)
+    if not force and up_to_date(paths, state_path, key):
+        return record
+
+    pids: List[int] = []
+    usage = {"peak": 0, "exceeded": False}
+    kwargs = dict(
+        on_process=pids.append,
+        solid_workers=options.solid_workers,
+        files=files or None
+    )
+    scad_code = apply_quality(code, options.quality)
+    if pool is not None:
+        conversion = asyncio.ensure_future(convert_scad_pooled(
+            pool, scad_code, options.formats, options.mesh_deflection,
+            options.refine_policy, options.pipeline, **kwargs
+        ))
+    else:
+        conversion = asyncio.ensure_future(convert_scad_async(
+            scad_code, options.formats, options.mesh_deflection,
+            options.refine_policy, options.pipeline, **kwargs
+        ))
+    watcher = asyncio.ensure_future(watch_rss(pids, options.max_rss_bytes, conversion, usage))
+    try:
+        artifacts, error = await conversion
+    except asyncio.CancelledError:
+        if not usage["exceeded"]:
+            raise
+        artifacts, error = {}, f"Exceeded --max-rss of {options.max_rss_bytes // (1024 * 1024)}MB"
+    finally:
+        watcher.cancel()
+
+    record["seconds"] = round(time.monotonic() - started, 3)
+    record["peakRssBytes"] = usage["peak"] or None
+    if error:
+        error_class = "max_rss" if usage["exceeded"] else classify_error(error)
+        record.update(status="failed", error=error, errorClass=error_class)
+        return record
+
+    for fmt, data in artifacts.items():
+        write_file(paths[fmt], data)
+    record.update(status="converted", outputs={fmt: len(data) for fmt, data in artifacts.items()})
+    # Written last: outputs without a state file are converted again
+    write_file(state_path, json.dumps({"key": key, "source": source.path}).encode("utf-8"))
+    return record
+
+
+async def run(sources: List[Source], args: argparse.Namespace, options: Options, report: TextIO) -> Dict[str, int]:
+    """Convert sources args.jobs at a time, writing report lines as files finish."""
+    version = freecad_version()
+    pool = None
+    if not args.no_pool:
+        pool = FreeCADPool(
+            size=args.jobs,
+            max_jobs_per_worker=WORKER_MAX_JOBS,
+            max_rss_bytes=options.max_rss_bytes or sys.maxsize
+        )
+        try:
+            await pool.start()
+        except Exception as e:
+            await pool.close()
+            pool = None
+            print(f"Warning: FreeCAD worker pool unavailable, using one process per file: {e}", file=sys.stderr)
+
+    counts = {"converted": 0, "skipped": 0, "failed": 0}
+    slots = asyncio.Semaphore(args.jobs)
+
+    async def convert(source: Source):
+        async with slots:
+            try:
+                record = await convert_source(source, args.output, options, version, args.force, pool)
+            except Exception as e:
+                record = {"path": source.path, "output": source.name, "status": "failed",
+                          "error": str(e), "errorClass": "unknown"}
+        counts[record["status"]] += 1
+        report.write(json.dumps(record) + "\n")
+        report.flush()
+
+    try:
+        await asyncio.gather(*(convert(source) for source in sources))
+    finally:
+        if pool is not None:
+            await pool.close()
+        workspace_pool.close()
+    return counts
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("inputs", nargs="*", help=".scad files or directories to search recursively")
+    parser.add_argument("--manifest", metavar="PATH", help="File listing .scad paths, one per line; - reads stdin")
+    parser.add_argument("--output", "-o", required=True, help="Directory the outputs are written to")
+    parser.add_argument("--formats", default="step", help="Comma-separated output formats; STEP is always produced")
+    parser.add_argument("--mesh-deflection", type=float, default=DEFAULT_MESH_DEFLECTION)
+    parser.add_argument("--refine", choices=REFINE_POLICIES, default="auto")
+    parser.add_argument("--quality", choices=QUALITY_LEVELS, default=EXACT)
+    parser.add_argument("--pipeline", choices=["single", "two_pass"])
+    parser.add_argument("--solid-workers", type=int, default=1)
+    parser.add_argument("--jobs", "-j", type=int, default=0,
+                        help="Files converted at once; defaults to what the CPUs and memory allow")
+    parser.add_argument("--max-rss", type=int, default=0, metavar="MB",
+                        help="Fail a file whose processes exceed this RSS, and recycle workers above it")
+    parser.add_argument("--no-pool", action="store_true", help="Start a fresh freecadcmd per file")
+    parser.add_argument("--force", action="store_true", help="Convert files whose outputs are up to date")
+    parser.add_argument("--report", metavar="PATH", help="Write the JSONL report here instead of stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str]) -> int:
+    args = parse_args(argv)
+    if not args.inputs and not args.manifest:
+        print("Nothing to convert: pass .scad files, directories or --manifest", file=sys.stderr)
+        return 2
+    try:
+        formats = normalize_formats(args.formats.split(","))
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    if args.jobs <= 0:
+        args.jobs = default_concurrency(JOB_MEMORY_ESTIMATE_MB * 1024 * 1024)
+    options = Options(
+        formats=formats,
+        mesh_deflection=args.mesh_deflection,
+        refine_policy=args.refine,
+        quality=args.quality,
+        pipeline=args.pipeline,
+        solid_workers=args.solid_workers,
+        max_rss_bytes=args.max_rss * 1024 * 1024
+    )
+
+    try:
+        sources = find_sources(args.inputs, args.manifest)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    print(f"Converting {len(sources)} files with {args.jobs} jobs into {args.output}", file=sys.stderr)
+    started = time.monotonic()
+    report = open(args.report, "a", encoding="utf-8") if args.report else sys.stdout
+    try:
+        counts = asyncio.run(run(sources, args, options, report))
+    finally:
+        if report is not sys.stdout:
+            report.close()
+    print(
+        f"{counts['converted']} converted, {counts['skipped']} up to date, {counts['failed']} failed "
+        f"in {time.monotonic() - started:.1f}s",
+        file=sys.stderr
+    )
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
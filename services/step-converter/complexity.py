@@ -0,0 +1,271 @@
+"""
+Static cost estimate of OpenSCAD code, computed before it is queued.
+Lexes the source and weighs the operations known to dominate conversion
+time (minkowski, hull, BOSL2 sweeps, curved primitives at high $fn) by the
+loops they are nested in. The score routes a job to the fast or heavy lane.
+"""
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from quality import QUALITY_LIMITS
+
+
+FAST_LANE = "fast"
+HEAVY_LANE = "heavy"
+
+# Fragments per circle at OpenSCAD's defaults ($fa=12) for larger radii
+DEFAULT_FRAGMENTS = 30
+# Iterations assumed for a loop whose range is not made of literals
+DEFAULT_LOOP_ITERATIONS = 10
+MAX_LOOP_ITERATIONS = 1_000_000
+
+# Calls by (weight, exponent): cost is weight * (fragments / DEFAULT_FRAGMENTS) ** exponent,
+# so a cube costs 1 and curved geometry grows with resolution
+CALL_COSTS: Dict[str, Tuple[float, int]] = {
+    'cube': (1, 0), 'square': (1, 0), 'polygon': (1, 0), 'polyhedron': (1, 0),
+    'text': (2, 0), 'linear_extrude': (2, 0),
+    'union': (1, 0), 'difference': (2, 0), 'intersection': (2, 0),
+    'circle': (1, 1), 'cylinder': (1, 1), 'rotate_extrude': (2, 1),
+    'sphere': (2, 2),
+    'import': (20, 0), 'surface': (20, 0),
+    'hull': (10, 1),
+    'minkowski': (100, 2),
+    # BOSL2
+    'cuboid': (2, 1), 'prismoid': (1, 0), 'rounded_prism': (5, 1),
+    'cyl': (1, 1), 'xcyl': (1, 1), 'ycyl': (1, 1), 'zcyl': (1, 1),
+    'tube': (2, 1), 'teardrop': (1, 1), 'pie_slice': (1, 1),
+    'spheroid': (2, 2), 'onion': (2, 2), 'torus': (2, 2),
+    'vnf_polyhedron': (5, 0),
+}
+SWEEP_CALLS = (
+    'path_sweep', 'path_sweep2d', 'sweep', 'skin', 'rotate_sweep',
+    'linear_sweep', 'offset_sweep', 'spiral_sweep', 'path_extrude',
+)
+SWEEP_COST = (25.0, 1)
+
+_TOKEN = re.compile(
+    r'//[^\n]*|/\*.*?(?:\*/|$)|"(?:\\.|[^"\\])*"?'
+    r'|\$?[A-Za-z_][A-Za-z0-9_]*'
+    r'|(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?'
+    r'|==|\S',
+    re.S
+)
+
+
+@dataclass
+class ComplexityEstimate:
+    score: float
+    minkowski: int = 0
+    hull: int = 0
+    sweeps: int = 0
+    loop_iterations: int = 1  # Largest product of nested loop ranges around a shape
+    fragments: float = DEFAULT_FRAGMENTS  # Finest circle resolution the code asks for
+
+    def lane(self, heavy_score: float) -> str:
+        return HEAVY_LANE if self.score >= heavy_score else FAST_LANE
+
+
+def _tokens(code: str) -> List[str]:
+    """Identifiers, numbers and punctuation of code, without comments, strings or library paths."""
+    tokens = []
+    skip_path = False
+    for match in _TOKEN.finditer(code):
+        token = match.group()
+        if token.startswith(('//', '/*', '"')):
+            continue
+        if skip_path:
+            if token == '>':
+                skip_path = False
+            continue
+        if token == '<' and tokens and tokens[-1] in ('include', 'use'):
+            skip_path = True
+            continue
+        tokens.append(token)
+    return tokens
+
+
+def _number(tokens: List[str], index: int) -> Tuple[Optional[float], int]:
+    """Parse an optionally negated numeric literal at index; returns (value, next index)."""
+    sign = 1.0
+    if index < len(tokens) and tokens[index] in ('-', '+'):
+        sign = -1.0 if tokens[index] == '-' else 1.0
+        index += 1
+    if index < len(tokens):
+        try:
+            return sign * float(tokens[index]), index + 1
+        except ValueError:
+            pass
+    return None, index
+
+
+def _closing(tokens: List[str], index: int) -> int:
+    """Index of the bracket closing the one at index (or len(tokens))."""
+    depth = 0
+    for position in range(index, len(tokens)):
+        if tokens[position] in ('(', '[', '{'):
+            depth += 1
+        elif tokens[position] in (')', ']', '}'):
+            depth -= 1
+            if depth == 0:
+                return position
+    return len(tokens)
+
+
+def _range_iterations(tokens: List[str]) -> int:
+    """Iterations of a loop variable's value: a [start:end], [start:step:end] or [a, b, ...] literal."""
+    if len(tokens) < 2 or tokens[0] != '[' or tokens[-1] != ']':
+        return DEFAULT_LOOP_ITERATIONS
+    inner = tokens[1:-1]
+    values = []
+    index = 0
+    while index < len(inner):
+        value, index = _number(inner, index)
+        if value is None:
+            break
+        values.append(value)
+        if index < len(inner) and inner[index] == ':':
+            index += 1
+        else:
+            break
+    if index == len(inner) and len(values) in (2, 3):
+        start, end = values[0], values[-1]
+        step = values[1] if len(values) == 3 else 1.0
+        if step == 0 or (end - start) / step < 0:
+            return 0
+        return int((end - start) / step) + 1
+
+    # A list literal iterates over its top-level elements
+    depth = 0
+    elements = 1 if inner else 0
+    for token in inner:
+        if token in ('(', '[', '{'):
+            depth += 1
+        elif token in (')', ']', '}'):
+            depth -= 1
+        elif token == ':' and depth == 0:
+            return DEFAULT_LOOP_ITERATIONS
+        elif token == ',' and depth == 0:
+            elements += 1
+    return elements
+
+
+def _loop_iterations(header: List[str]) -> int:
+    """Iterations of a for() header, the product over all its loop variables."""
+    iterations = 1
+    index = 0
+    while index < len(header):
+        if index + 1 < len(header) and header[index + 1] == '=' and header[index] not in ('(', ','):
+            start = index + 2
+            end = start
+            depth = 0
+            while end < len(header):
+                if header[end] in ('(', '[', '{'):
+                    depth += 1
+                elif header[end] in (')', ']', '}'):
+                    depth -= 1
+                elif header[end] == ',' and depth == 0:
+                    break
+                end += 1
+            iterations *= _range_iterations(header[start:end])
+            index = end
+        index += 1
+    return iterations
+
+
+def _fragments(name: str, value: float) -> Optional[float]:
+    """Fragments per circle implied by assigning value to a special variable."""
+    if name == '$fn':
+        return value if value >= 3 else None
+    if name == '$fa' and value > 0:
+        return 360.0 / value
+    return None  # $fs depends on the radius
+
+
+def estimate_complexity(code: str, quality: Optional[str] = None) -> ComplexityEstimate:
+    """
+    Estimate the relative conversion cost of code; a lone cube scores 1.
+
+    Each geometry call costs according to CALL_COSTS, multiplied by the
+    iterations of the for loops it is nested in. The resolution is the
+    finest $fn (or 360/$fa) assigned anywhere, capped by the limits of
+    quality. Calls inside module bodies count once, however often the
+    module is instantiated.
+    """
+    tokens = _tokens(code)
+    limits = QUALITY_LIMITS.get(quality) if quality else None
+
+    fragments = float(DEFAULT_FRAGMENTS)
+    for index, token in enumerate(tokens):
+        if token in ('$fn', '$fa') and index + 1 < len(tokens) and tokens[index + 1] == '=':
+            value, _ = _number(tokens, index + 2)
+            implied = _fragments(token, value) if value is not None else None
+            if implied is not None:
+                fragments = max(fragments, implied)
+    if limits is not None:
+        fragments = min(fragments, limits.max_fn, 360.0 / limits.min_fa)
+    fragments = max(fragments, float(DEFAULT_FRAGMENTS))
+    resolution = fragments / DEFAULT_FRAGMENTS
+
+    estimate = ComplexityEstimate(score=0.0, fragments=fragments)
+    # Enclosing loops as (iterations, brace depth, whether the body is braced)
+    loops: List[Tuple[int, int, bool]] = []
+    multiplier = 1
+    depth = paren = square = 0
+    index = 0
+    while index < len(tokens):
+        token = tokens[index]
+        following = tokens[index + 1] if index + 1 < len(tokens) else ''
+        previous = tokens[index - 1] if index else ''
+
+        if token in ('for', 'intersection_for') and following == '(' and paren == 0 and square == 0:
+            close = _closing(tokens, index + 1)
+            iterations = _loop_iterations(tokens[index + 2:close])
+            braced = close + 1 < len(tokens) and tokens[close + 1] == '{'
+            loops.append((iterations, depth + 1 if braced else depth, braced))
+            multiplier = min(multiplier * iterations, MAX_LOOP_ITERATIONS)
+            estimate.loop_iterations = max(estimate.loop_iterations, multiplier)
+            index = close + 1
+            continue
+
+        if following == '(' and previous not in ('module', 'function'):
+            if token in SWEEP_CALLS:
+                weight, exponent = SWEEP_COST
+                estimate.sweeps += 1
+            else:
+                weight, exponent = CALL_COSTS.get(token, (0, 0))
+                if token == 'minkowski':
+                    estimate.minkowski += 1
+                elif token == 'hull':
+                    estimate.hull += 1
+            estimate.score += weight * resolution ** exponent * multiplier
+
+        ended = None
+        if token == '(':
+            paren += 1
+        elif token == ')':
+            paren = max(0, paren - 1)
+        elif token == '[':
+            square += 1
+        elif token == ']':
+            square = max(0, square - 1)
+        elif token == '{':
+            depth += 1
+        elif token == '}':
+            while loops and loops[-1][2] and loops[-1][1] == depth:
+                loops.pop()
+            depth = max(0, depth - 1)
+            ended = depth
+        elif token == ';' and paren == 0 and square == 0:
+            ended = depth
+        if ended is not None:
+            # The statement ends, and with it the loops without braces around it
+            while loops and not loops[-1][2] and loops[-1][1] == ended:
+                loops.pop()
+            multiplier = 1
+            for iterations, _depth, _braced in loops:
+                multiplier = min(multiplier * iterations, MAX_LOOP_ITERATIONS)
+        index += 1
+
+    estimate.score = round(max(estimate.score, 1.0), 1)
+    return estimate
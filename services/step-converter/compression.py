@@ -0,0 +1,145 @@
+"""
+Compression of completed STEP results.
+Results are compressed once when a job completes and served in that form to
+clients that accept it; other clients get a recoded or decompressed stream.
+"""
+import zlib
+from typing import BinaryIO, Dict, Iterator, List, Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+IDENTITY = "identity"
+GZIP = "gzip"
+ZSTD = "zstd"
+
+# STEP is verbose ASCII; moderate levels already get most of the 5-10x ratio
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 9
+CHUNK_SIZE = 64 * 1024
+# zlib window bits selecting the gzip container
+_GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+FILE_SUFFIXES = {IDENTITY: "", GZIP: ".gz", ZSTD: ".zst"}
+
+
+def supported_encodings() -> List[str]:
+    """Content codings this process can produce, best first."""
+    return [ZSTD, GZIP] if zstandard is not None else [GZIP]
+
+
+def resolve_encoding(name: str) -> str:
+    """
+    Map a RESULT_COMPRESSION setting to a content coding.
+
+    "auto" picks zstd when the zstandard module is installed and gzip
+    otherwise; "none" stores results uncompressed.
+    """
+    name = (name or "auto").lower()
+    if name == "auto":
+        return supported_encodings()[0]
+    if name == "none":
+        return IDENTITY
+    if name == ZSTD and zstandard is None:
+        print("Warning: zstandard is not installed, compressing results with gzip")
+        return GZIP
+    if name not in FILE_SUFFIXES:
+        raise ValueError(f"Unknown result compression: {name}")
+    return name
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == GZIP:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, _GZIP_WBITS)
+        return compressor.compress(data) + compressor.flush()
+    if encoding == ZSTD:
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return data
+
+
+def iter_decompress(source: BinaryIO, encoding: str) -> Iterator[bytes]:
+    """Yield the uncompressed content of a stored result in chunks."""
+    if encoding == ZSTD:
+        yield from zstandard.ZstdDecompressor().read_to_iter(source, read_size=CHUNK_SIZE)
+        return
+
+    decompressor = zlib.decompressobj(_GZIP_WBITS) if encoding == GZIP else None
+    while True:
+        chunk = source.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        if decompressor is not None:
+            chunk = decompressor.decompress(chunk)
+        if chunk:
+            yield chunk
+    if decompressor is not None:
+        tail = decompressor.flush()
+        if tail:
+            yield tail
+
+
+def iter_recode(source: BinaryIO, encoding: str, target: str) -> Iterator[bytes]:
+    """Yield a stored result re-encoded with another content coding."""
+    if target == encoding:
+        yield from iter(lambda: source.read(CHUNK_SIZE), b'')
+        return
+    if target == IDENTITY:
+        yield from iter_decompress(source, encoding)
+        return
+
+    if target == ZSTD:
+        compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+    else:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, _GZIP_WBITS)
+    for chunk in iter_decompress(source, encoding):
+        out = compressor.compress(chunk)
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+def _parse_accept_encoding(header: str) -> Dict[str, float]:
+    """Parse an Accept-Encoding header into {coding: qvalue}."""
+    accepted = {}
+    for item in header.split(","):
+        coding, _, params = item.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def negotiate(accept_encoding: Optional[str], stored: str) -> str:
+    """
+    Pick the content coding for a response from a stored result.
+
+    The stored coding wins whenever the client accepts it, since it can be
+    sent without recompression; otherwise the client's best supported
+    coding is used, and identity as the last resort.
+    """
+    if not accept_encoding:
+        return IDENTITY
+    accepted = _parse_accept_encoding(accept_encoding)
+    wildcard = accepted.get("*", 0.0)
+
+    def quality(coding: str) -> float:
+        return accepted.get(coding, wildcard)
+
+    if stored != IDENTITY and quality(stored) > 0:
+        return stored
+    candidates = [c for c in supported_encodings() if quality(c) > 0]
+    if not candidates:
+        return IDENTITY
+    return max(candidates, key=quality)
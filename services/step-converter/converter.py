@@ -1,13 +1,292 @@
 """
 FreeCAD OpenSCAD to STEP conversion module.
-Uses FreeCAD's OpenSCAD workbench to interpret CSG and produce B-Rep STEP output.
+Uses FreeCAD's OpenSCAD workbench to interpret CSG and produce B-Rep STEP output,
+plus optional BREP and mesh formats from the same shape.
 """
 import os
 import sys
+import json
+import mmap
+import time
+import signal
+import asyncio
 import tempfile
 import shutil
+import posixpath
+import threading
 import subprocess
-from typing import Tuple, Optional
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from csg import CsgParseError, parse_csg, tree_dimension
+from freecad_job import (
+    DEFAULT_MESH_DEFLECTION,
+    OUTPUT_FORMATS,
+    PROFILE_JSON,
+    PROFILE_STATS,
+    REFINE_ALWAYS,
+    REFINE_NEVER,
+    REFINE_PREFIX,
+    STEP,
+    TIMINGS_PREFIX,
+)
+from output_buffer import OutputBuffer
+from workspace_pool import WorkspacePool
+
+
+# "single" evaluates OpenSCAD once to CSG and hands that to FreeCAD.
+# "two_pass" is the original flow: an STL pre-validation run, then FreeCAD
+# re-evaluating the .scad file through importCSG.
+CONVERSION_PIPELINE = os.environ.get("CONVERSION_PIPELINE", "single")
+
+# Directory of cached subtree B-Reps for incremental imports in the single
+# pipeline; empty disables the cache
+SUBTREE_CACHE_DIR = os.environ.get("SUBTREE_CACHE_DIR", "")
+
+# Where conversion workspaces are created, ideally a tmpfs; empty uses the
+# system temp directory. Up to WORKSPACE_POOL_SIZE of them are reused.
+WORKSPACE_DIR = os.environ.get("WORKSPACE_DIR", "")
+WORKSPACE_POOL_SIZE = int(os.environ.get("WORKSPACE_POOL_SIZE", "8"))
+
+SERVICE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+workspace_pool = WorkspacePool(WORKSPACE_DIR or tempfile.gettempdir(), WORKSPACE_POOL_SIZE)
+
+FREECAD_TIMEOUT_SECONDS = 300  # 5 minute timeout
+FREECAD_TIMEOUT_ERROR = "FreeCAD conversion timed out (exceeded 5 minutes)"
+FREECAD_NOT_FOUND_ERROR = "FreeCAD (freecadcmd) not found. Is FreeCAD installed?"
+OPENSCAD_NOT_FOUND_ERROR = "OpenSCAD (openscad) not found. Is OpenSCAD installed?"
+NO_VALID_SHAPES_ERROR = "No valid 3D geometry was produced. Check your OpenSCAD code for errors."
+
+TWO_D_OBJECT_MESSAGE = "Top level object is a 2D object"
+TWO_D_OBJECT_ERROR = (
+    "The model is a 2D object and cannot be exported to STEP format. "
+    "STEP files require 3D geometry. Try adding linear_extrude() or "
+    "rotate_extrude() to convert 2D shapes to 3D."
+)
+
+# Bump whenever a pipeline change alters the produced STEP output, so that
+# cached results from older versions are not served.
+PIPELINE_VERSION = "3"
+
+# Where a profiled conversion keeps OpenSCAD's output, next to freecad_job's profile files
+OPENSCAD_LOG = "openscad.log"
+# OpenSCAD output kept in a profile is trimmed to this many trailing characters
+MAX_PROFILE_OUTPUT_CHARS = 64 * 1024
+
+# Subdirectory of a workspace holding a multi-file project, with the
+# submitted code as its input.scad so relative includes and imports resolve
+PROJECT_DIR = "project"
+MAX_PROJECT_PATH_LENGTH = 255
+
+
+# Called with the pid of every subprocess a conversion starts, for resource accounting
+ProcessCallback = Callable[[int], None]
+# Called with the name of each conversion phase as it starts
+PhaseCallback = Callable[[str], None]
+# Called with (phase, seconds) as phase durations become known
+TimingCallback = Callable[[str, float], None]
+# Called with the refine decision and face counts freecad_job reports
+RefineCallback = Callable[[dict], None]
+# Called with a profiled conversion's measurements and its cProfile stats file
+ProfileCallback = Callable[[dict, Optional[bytes]], None]
+
+# Signature shared by run_freecad_script_async and the worker pool's FreeCAD stage:
+# (workspace, refine_policy, on_process, on_phase) -> (succeeded, stdout, stderr)
+FreeCADStage = Callable[
+    ["ConversionWorkspace", str, Optional[ProcessCallback], Optional[PhaseCallback]],
+    Awaitable[Tuple[bool, str, str]]
+]
+
+# Conversion phases, in order; the last three are reported by freecad_job
+PHASE_OPENSCAD = "openscad"
+PHASE_FREECAD_IMPORT = "freecad_import"
+PHASE_REFINE = "refine"
+PHASE_EXPORT = "export"
+# Timing-only name for the whole FreeCAD stage, including process startup
+PHASE_FREECAD = "freecad"
+# Prefix of the stderr lines a one-off freecadcmd process announces phases with
+PHASE_PREFIX = "PHASE: "
+
+
+def classify_error(error: str) -> str:
+    """Map a conversion error message to a short error class for metrics."""
+    if error == TWO_D_OBJECT_ERROR:
+        return "2d_object"
+    if error.startswith("OpenSCAD error:"):
+        return "openscad_error"
+    if error == NO_VALID_SHAPES_ERROR:
+        return "no_valid_shapes"
+    if error == FREECAD_TIMEOUT_ERROR or (error.startswith("OpenSCAD") and "timed out" in error):
+        return "timeout"
+    if error in (FREECAD_NOT_FOUND_ERROR, OPENSCAD_NOT_FOUND_ERROR):
+        return "not_found"
+    return "other"
+
+
+def parse_freecad_timings(stdout: str) -> Dict[str, float]:
+    """Extract the phase timings freecad_job prints from a FreeCAD stage's stdout."""
+    for line in reversed(stdout.splitlines()):
+        if line.startswith(TIMINGS_PREFIX):
+            try:
+                return json.loads(line[len(TIMINGS_PREFIX):])
+            except ValueError:
+                break
+    return {}
+
+
+def parse_freecad_refine(stdout: str) -> Optional[dict]:
+    """Extract the refine decision freecad_job prints from a FreeCAD stage's stdout."""
+    for line in reversed(stdout.splitlines()):
+        if line.startswith(REFINE_PREFIX):
+            try:
+                return json.loads(line[len(REFINE_PREFIX):])
+            except ValueError:
+                break
+    return None
+
+
+def run_process(
+    args: List[str],
+    timeout: float,
+    cwd: str,
+    on_process: Optional[ProcessCallback] = None
+) -> subprocess.CompletedProcess:
+    """
+    Equivalent of subprocess.run(capture_output=True, text=True) that reports
+    the child's pid through on_process once it has started. Only the end of
+    each stream is kept, see OutputBuffer.
+    """
+    stdout, stderr = OutputBuffer(), OutputBuffer()
+    with subprocess.Popen(
+        args,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        cwd=cwd
+    ) as process:
+        if on_process:
+            on_process(process.pid)
+        readers = [
+            threading.Thread(target=_drain_pipe, args=(process.stdout, stdout), daemon=True),
+            threading.Thread(target=_drain_pipe, args=(process.stderr, stderr), daemon=True),
+        ]
+        for reader in readers:
+            reader.start()
+        try:
+            process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+            raise
+        finally:
+            for reader in readers:
+                reader.join()
+    return subprocess.CompletedProcess(args, process.returncode, stdout.getvalue(), stderr.getvalue())
+
+
+# Bytes read from a pipe at a time
+PIPE_CHUNK_BYTES = 64 * 1024
+
+
+def _drain_pipe(pipe, buffer: OutputBuffer):
+    """Feed a pipe into buffer until the writer closes it."""
+    while True:
+        data = os.read(pipe.fileno(), PIPE_CHUNK_BYTES)
+        if not data:
+            return
+        buffer.feed(data)
+
+
+# Longest stderr line the async runner hands to watch_line in one piece;
+# longer lines, e.g. from a large echo(), are checked in pieces of this size
+MAX_OUTPUT_LINE_BYTES = 1024 * 1024
+
+
+def is_openscad_fatal_line(line: str) -> bool:
+    """Whether an OpenSCAD stderr line means the run cannot produce a usable result."""
+    return "ERROR:" in line or TWO_D_OBJECT_MESSAGE in line
+
+
+def kill_process_tree(process: "asyncio.subprocess.Process"):
+    """Kill a process started by run_process_async together with its children."""
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+async def run_process_async(
+    args: List[str],
+    timeout: float,
+    cwd: str,
+    on_process: Optional[ProcessCallback] = None,
+    watch_line: Optional[Callable[[str], bool]] = None
+) -> subprocess.CompletedProcess:
+    """
+    Async counterpart of run_process that reads stderr as it is written.
+
+    watch_line sees every stderr line; returning True marks it fatal. The
+    child runs in its own session so its whole process tree can be killed:
+    at the first fatal line (the result then holds the output up to that
+    line), on timeout (raising TimeoutExpired) and when the calling task is
+    cancelled. As with run_process, only the end of each stream is kept.
+    """
+    process = await asyncio.create_subprocess_exec(
+        *args,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        cwd=cwd,
+        start_new_session=True
+    )
+    if on_process:
+        on_process(process.pid)
+
+    stdout, stderr = OutputBuffer(), OutputBuffer()
+
+    async def read_stdout():
+        while True:
+            data = await process.stdout.read(PIPE_CHUNK_BYTES)
+            if not data:
+                return
+            stdout.feed(data)
+
+    async def read_stderr():
+        pending = b''
+        while True:
+            data = await process.stderr.read(PIPE_CHUNK_BYTES)
+            lines = (pending + data).splitlines(keepends=True)
+            pending = b''
+            if data and lines and not lines[-1].endswith((b'\n', b'\r')):
+                pending = lines.pop()
+                if len(pending) > MAX_OUTPUT_LINE_BYTES:
+                    lines.append(pending)
+                    pending = b''
+            for raw_line in lines:
+                line = raw_line.decode('utf-8', errors='replace')
+                stderr.write(line)
+                if watch_line and watch_line(line):
+                    kill_process_tree(process)
+                    return
+            if not data:
+                return
+
+    try:
+        await asyncio.wait_for(asyncio.gather(read_stdout(), read_stderr()), timeout)
+        await process.wait()
+    except asyncio.TimeoutError:
+        kill_process_tree(process)
+        await process.wait()
+        raise subprocess.TimeoutExpired(args, timeout)
+    except BaseException:
+        kill_process_tree(process)
+        raise
+
+    return subprocess.CompletedProcess(
+        args,
+        process.returncode,
+        stdout.getvalue(),
+        stderr.getvalue()
+    )
 
 
 def validate_scad_code(code: str) -> Optional[str]:
@@ -49,7 +328,65 @@ def validate_scad_code(code: str) -> Optional[str]:
     return None
 
 
-def validate_is_3d_object(scad_code: str) -> Optional[str]:
+def validate_project_path(path: str) -> Optional[str]:
+    """
+    Check a project file's path, relative to the submitted code.
+
+    Returns None if valid, or an error message for absolute paths, paths
+    leaving the project, non-normalized paths and the code's own name.
+    """
+    if not path or len(path) > MAX_PROJECT_PATH_LENGTH:
+        return f"Project paths must be 1 to {MAX_PROJECT_PATH_LENGTH} characters"
+    if '\\' in path or '\0' in path:
+        return f"Invalid project path: {path}"
+    if path.startswith('/') or posixpath.normpath(path) != path or path.split('/')[0] == '..':
+        return f"Project path must be relative and normalized, without '..': {path}"
+    if path == "input.scad":
+        return "Project path input.scad is reserved for the submitted code"
+    return None
+
+
+# 2 minute timeouts for the OpenSCAD runs
+VALIDATION_TIMEOUT_SECONDS = 120
+EVALUATION_TIMEOUT_SECONDS = 120
+
+
+def _validation_error(result: subprocess.CompletedProcess, stl_path: str) -> Optional[str]:
+    """Interpret the STL pre-validation run; None means valid 3D."""
+    # Check stderr for 2D object warning
+    if TWO_D_OBJECT_MESSAGE in result.stderr:
+        return TWO_D_OBJECT_ERROR
+
+    # Check for other OpenSCAD errors
+    if result.returncode != 0:
+        # Extract meaningful error from stderr
+        stderr = result.stderr.strip()
+        # Look for actual errors (not warnings)
+        error_lines = [
+            line for line in stderr.split('\n')
+            if 'ERROR' in line or 'error' in line.lower()
+        ]
+        if error_lines:
+            return f"OpenSCAD error: {error_lines[0]}"
+        # If STL wasn't created, there's an issue
+        if not os.path.exists(stl_path):
+            return f"OpenSCAD failed to generate geometry: {stderr[:500]}"
+
+    # Verify STL was created and has content
+    if not os.path.exists(stl_path):
+        return "OpenSCAD produced no output - model may be empty or invalid"
+
+    stl_size = os.path.getsize(stl_path)
+    if stl_size < 100:  # Minimal valid STL is larger than this
+        return "OpenSCAD produced empty or invalid geometry"
+
+    return None  # Valid 3D object
+
+
+def validate_is_3d_object(
+    scad_code: str,
+    on_process: Optional[ProcessCallback] = None
+) -> Optional[str]:
     """
     Pre-validate that the OpenSCAD code produces a 3D object, not 2D.
 
@@ -58,7 +395,7 @@ def validate_is_3d_object(scad_code: str) -> Optional[str]:
 
     Returns None if valid 3D, or an error message if 2D or invalid.
     """
-    temp_dir = tempfile.mkdtemp(prefix="scad_validate_")
+    temp_dir = workspace_pool.acquire()
     scad_path = os.path.join(temp_dir, "input.scad")
     stl_path = os.path.join(temp_dir, "output.stl")
 
@@ -68,294 +405,678 @@ def validate_is_3d_object(scad_code: str) -> Optional[str]:
             f.write(scad_code)
 
         # Try to export to STL - this will fail for 2D objects
-        result = subprocess.run(
+        result = run_process(
             ['openscad', '-o', stl_path, scad_path],
-            capture_output=True,
-            text=True,
-            timeout=120,  # 2 minute timeout for validation
-            cwd=temp_dir
+            timeout=VALIDATION_TIMEOUT_SECONDS,
+            cwd=temp_dir,
+            on_process=on_process
         )
+        return _validation_error(result, stl_path)
 
-        # Check stderr for 2D object warning
-        if "Top level object is a 2D object" in result.stderr:
-            return (
-                "The model is a 2D object and cannot be exported to STEP format. "
-                "STEP files require 3D geometry. Try adding linear_extrude() or "
-                "rotate_extrude() to convert 2D shapes to 3D."
-            )
+    except subprocess.TimeoutExpired:
+        return "OpenSCAD validation timed out"
+    except FileNotFoundError:
+        # OpenSCAD not available for pre-validation, skip this check
+        return None
+    except Exception as e:
+        # Don't block conversion on validation errors
+        print(f"Warning: Pre-validation failed: {e}", file=sys.stderr)
+        return None
+    finally:
+        workspace_pool.release(temp_dir)
 
-        # Check for other OpenSCAD errors
-        if result.returncode != 0:
-            # Extract meaningful error from stderr
-            stderr = result.stderr.strip()
-            # Look for actual errors (not warnings)
-            error_lines = [
-                line for line in stderr.split('\n')
-                if 'ERROR' in line or 'error' in line.lower()
-            ]
-            if error_lines:
-                return f"OpenSCAD error: {error_lines[0]}"
-            # If STL wasn't created, there's an issue
-            if not os.path.exists(stl_path):
-                return f"OpenSCAD failed to generate geometry: {stderr[:500]}"
-
-        # Verify STL was created and has content
-        if not os.path.exists(stl_path):
-            return "OpenSCAD produced no output - model may be empty or invalid"
 
-        stl_size = os.path.getsize(stl_path)
-        if stl_size < 100:  # Minimal valid STL is larger than this
-            return "OpenSCAD produced empty or invalid geometry"
+async def validate_is_3d_object_async(
+    scad_code: str,
+    on_process: Optional[ProcessCallback] = None,
+    files: Optional[Dict[str, str]] = None
+) -> Optional[str]:
+    """
+    Async validate_is_3d_object that stops OpenSCAD at its first fatal line.
+    files are linked next to the code as for the conversion itself.
+    """
+    temp_dir = workspace_pool.acquire()
+    code_dir = os.path.join(temp_dir, PROJECT_DIR) if files else temp_dir
+    scad_path = os.path.join(code_dir, "input.scad")
+    stl_path = os.path.join(temp_dir, "output.stl")
 
-        return None  # Valid 3D object
+    try:
+        if files:
+            link_project_files(code_dir, files)
+        with open(scad_path, 'w', encoding='utf-8') as f:
+            f.write(scad_code)
+
+        result = await run_process_async(
+            ['openscad', '-o', stl_path, scad_path],
+            timeout=VALIDATION_TIMEOUT_SECONDS,
+            cwd=code_dir,
+            on_process=on_process,
+            watch_line=is_openscad_fatal_line
+        )
+        return _validation_error(result, stl_path)
 
     except subprocess.TimeoutExpired:
         return "OpenSCAD validation timed out"
     except FileNotFoundError:
         # OpenSCAD not available for pre-validation, skip this check
         return None
+    except ValueError as e:
+        # A project file is gone; the conversion could not link it either
+        return f"Conversion error: {e}"
     except Exception as e:
         # Don't block conversion on validation errors
         print(f"Warning: Pre-validation failed: {e}", file=sys.stderr)
         return None
     finally:
-        try:
-            shutil.rmtree(temp_dir)
-        except Exception:
-            pass
+        workspace_pool.release(temp_dir)
 
 
-def convert_scad_to_step(
-    scad_code: str,
-    refine_shape: bool = True
-) -> Tuple[bytes, Optional[str]]:
+def evaluate_scad_to_csg(
+    scad_path: str,
+    csg_path: str,
+    on_process: Optional[ProcessCallback] = None
+) -> Optional[str]:
     """
-    Convert OpenSCAD code to STEP format using FreeCAD.
+    Evaluate OpenSCAD code once, emitting the CSG tree that FreeCAD imports.
 
-    This function:
-    1. Pre-validates that the code produces 3D geometry
-    2. Writes the .scad code to a temp file
-    3. Uses FreeCAD's Python API to import and export
-    4. Returns the STEP file content
+    CSG export skips CGAL rendering, so this is much cheaper than the STL
+    pre-validation run. 2D and empty models are detected from the emitted
+    tree, and OpenSCAD errors from the same run's stderr.
 
-    Args:
-        scad_code: OpenSCAD source code string
-        refine_shape: Whether to refine the shape (merge coplanar faces)
+    Returns None if the CSG describes 3D geometry, or an error message.
+    """
+    try:
+        result = run_process(
+            ['openscad', '-o', csg_path, scad_path],
+            timeout=EVALUATION_TIMEOUT_SECONDS,
+            cwd=os.path.dirname(scad_path),
+            on_process=on_process
+        )
+    except subprocess.TimeoutExpired:
+        return "OpenSCAD evaluation timed out"
+    except FileNotFoundError:
+        return OPENSCAD_NOT_FOUND_ERROR
+    return _csg_error(result, csg_path)
 
-    Returns:
-        Tuple of (step_bytes, error_message)
-        If successful, error_message is None
+
+async def evaluate_scad_to_csg_async(
+    scad_path: str,
+    csg_path: str,
+    on_process: Optional[ProcessCallback] = None,
+    log_path: str = ""
+) -> Optional[str]:
     """
-    # Pre-validate that the code produces 3D geometry
-    validation_error = validate_is_3d_object(scad_code)
-    if validation_error:
-        return b'', validation_error
+    Async evaluate_scad_to_csg that stops OpenSCAD at its first fatal line.
+    With a log_path, OpenSCAD's output is saved there.
+    """
+    try:
+        result = await run_process_async(
+            ['openscad', '-o', csg_path, scad_path],
+            timeout=EVALUATION_TIMEOUT_SECONDS,
+            cwd=os.path.dirname(scad_path),
+            on_process=on_process,
+            watch_line=is_openscad_fatal_line
+        )
+    except subprocess.TimeoutExpired:
+        return "OpenSCAD evaluation timed out"
+    except FileNotFoundError:
+        return OPENSCAD_NOT_FOUND_ERROR
+    if log_path:
+        with open(log_path, 'w', encoding='utf-8') as f:
+            f.write(result.stderr)
+    return _csg_error(result, csg_path)
 
-    temp_dir = tempfile.mkdtemp(prefix="scad_convert_")
-    scad_path = os.path.join(temp_dir, "input.scad")
-    step_path = os.path.join(temp_dir, "output.step")
-    freecad_script = os.path.join(temp_dir, "convert.py")
+
+def _csg_error(result: subprocess.CompletedProcess, csg_path: str) -> Optional[str]:
+    """Interpret the CSG evaluation run; None means the CSG describes 3D geometry."""
+    stderr = result.stderr.strip()
+    error_lines = [line for line in stderr.split('\n') if 'ERROR' in line]
+    if error_lines:
+        return f"OpenSCAD error: {error_lines[0].strip()}"
+
+    if result.returncode != 0 or not os.path.exists(csg_path):
+        return f"OpenSCAD failed to generate geometry: {stderr[:500]}"
+
+    with open(csg_path, 'r', encoding='utf-8', errors='replace') as f:
+        csg_text = f.read()
 
+    try:
+        dimension = tree_dimension(parse_csg(csg_text))
+    except CsgParseError as e:
+        # Let FreeCAD have a go; its importer is the final authority
+        print(f"Warning: Could not parse CSG output: {e}", file=sys.stderr)
+        return None
+
+    if dimension == 2:
+        return TWO_D_OBJECT_ERROR
+    if dimension is None:
+        return "OpenSCAD produced no output - model may be empty or invalid"
+
+    return None
+
+
+@dataclass
+class ConversionWorkspace:
+    """Temp directory holding one conversion's inputs and outputs."""
+    temp_dir: str
+    scad_path: str
+    import_path: str
+    output_paths: Dict[str, str]  # Format -> output file; always includes STEP
+    mesh_deflection: float = DEFAULT_MESH_DEFLECTION
+    solid_workers: int = 1  # Processes FreeCAD refines independent solids in
+    profile: bool = False  # Whether to leave profile files in temp_dir
+
+    @property
+    def step_path(self) -> str:
+        return self.output_paths[STEP]
+
+    @property
+    def profile_dir(self) -> str:
+        """Directory freecad_job writes its profile to; empty when not profiling."""
+        return self.temp_dir if self.profile else ""
+
+
+def normalize_formats(formats: Optional[Sequence[str]]) -> List[str]:
+    """
+    Validate requested output formats, returning them deduplicated with STEP first.
+
+    STEP is always produced. Raises ValueError for unknown formats.
+    """
+    unknown = [fmt for fmt in formats or () if fmt not in OUTPUT_FORMATS]
+    if unknown:
+        raise ValueError(
+            f"Unsupported output format(s): {', '.join(unknown)}. "
+            f"Supported: {', '.join(OUTPUT_FORMATS)}"
+        )
+    requested = set(formats or ())
+    return [STEP] + [fmt for fmt in OUTPUT_FORMATS if fmt != STEP and fmt in requested]
+
+
+def prepare_conversion(
+    scad_code: str,
+    pipeline: Optional[str] = None,
+    on_process: Optional[ProcessCallback] = None
+) -> Tuple[Optional[ConversionWorkspace], Optional[str]]:
+    """
+    Write the code to a temp workspace and run the OpenSCAD stage.
+
+    Returns (workspace, None) ready for FreeCAD, or (None, error_message).
+    The caller owns the workspace and must pass it to cleanup_workspace().
+    """
+    pipeline = pipeline or CONVERSION_PIPELINE
+    if pipeline == "two_pass":
+        # Pre-validate that the code produces 3D geometry
+        validation_error = validate_is_3d_object(scad_code, on_process)
+        if validation_error:
+            return None, validation_error
+
+    workspace = _create_workspace()
     try:
         # Write OpenSCAD code to temp file
-        with open(scad_path, 'w', encoding='utf-8') as f:
+        with open(workspace.scad_path, 'w', encoding='utf-8') as f:
             f.write(scad_code)
 
-        # Create FreeCAD conversion script
-        script_content = f'''
-import sys
-import os
+        if pipeline != "two_pass":
+            # In two-pass mode importCSG runs OpenSCAD on the .scad file itself
+            workspace.import_path = os.path.join(workspace.temp_dir, "input.csg")
+            csg_error = evaluate_scad_to_csg(workspace.scad_path, workspace.import_path, on_process)
+            if csg_error:
+                cleanup_workspace(workspace)
+                return None, csg_error
 
-# Add FreeCAD lib path
-freecad_paths = [
-    "/usr/lib/freecad/lib",
-    "/usr/lib/freecad-python3/lib",
-    "/usr/share/freecad/lib",
-    "/usr/share/freecad/Mod",
-]
-for p in freecad_paths:
-    if os.path.exists(p) and p not in sys.path:
-        sys.path.insert(0, p)
+        return workspace, None
 
-# Set FreeCAD home for module loading
-os.environ["FREECAD_USER_HOME"] = "/tmp"
+    except Exception as e:
+        cleanup_workspace(workspace)
+        return None, f"Conversion error: {str(e)}"
 
-import FreeCAD
-import Part
 
-# Configure OpenSCAD executable path before importing importCSG
-FreeCAD.ParamGet("User parameter:BaseApp/Preferences/Mod/OpenSCAD").SetString("openscadexecutable", "/usr/bin/openscad")
+async def prepare_conversion_async(
+    scad_code: str,
+    pipeline: Optional[str] = None,
+    on_process: Optional[ProcessCallback] = None,
+    formats: Sequence[str] = (STEP,),
+    mesh_deflection: float = DEFAULT_MESH_DEFLECTION,
+    solid_workers: int = 1,
+    profile: bool = False,
+    files: Optional[Dict[str, str]] = None
+) -> Tuple[Optional[ConversionWorkspace], Optional[str]]:
+    """
+    Async prepare_conversion for the given output formats; cancelling it kills
+    OpenSCAD and removes the workspace. A profiled workspace keeps OpenSCAD's
+    output in OPENSCAD_LOG (not in two-pass mode, where FreeCAD runs it).
 
-import importCSG
+    files ({project path: source file}) are hard-linked into the workspace
+    next to the code, see link_project_files.
+    """
+    pipeline = pipeline or CONVERSION_PIPELINE
+    if pipeline == "two_pass":
+        validation_error = await validate_is_3d_object_async(scad_code, on_process, files)
+        if validation_error:
+            return None, validation_error
 
-# Create document
-doc = FreeCAD.newDocument("ConversionDoc")
+    workspace = _create_workspace(formats, mesh_deflection, solid_workers, profile, bool(files))
+    try:
+        if files:
+            link_project_files(os.path.dirname(workspace.scad_path), files)
+        with open(workspace.scad_path, 'w', encoding='utf-8') as f:
+            f.write(scad_code)
 
-try:
-    # Import OpenSCAD file
-    importCSG.insert("{scad_path}", doc.Name)
+        if pipeline != "two_pass":
+            workspace.import_path = os.path.join(workspace.temp_dir, "input.csg")
+            log_path = os.path.join(workspace.temp_dir, OPENSCAD_LOG) if profile else ""
+            csg_error = await evaluate_scad_to_csg_async(
+                workspace.scad_path, workspace.import_path, on_process, log_path
+            )
+            if csg_error:
+                cleanup_workspace(workspace)
+                return None, csg_error
 
-    # Collect all shapes
-    refine = {refine_shape}
-    shapes = []
-    for obj in doc.Objects:
-        if hasattr(obj, 'Shape') and obj.Shape and not obj.Shape.isNull():
-            shape = obj.Shape.copy()
-            # Check if shape has actual geometry (volume > 0 or has faces)
-            has_geometry = False
-            try:
-                if hasattr(shape, 'Volume') and shape.Volume > 1e-9:
-                    has_geometry = True
-                elif hasattr(shape, 'Faces') and len(shape.Faces) > 0:
-                    has_geometry = True
-                elif hasattr(shape, 'Solids') and len(shape.Solids) > 0:
-                    has_geometry = True
-            except:
-                pass
-
-            if not has_geometry:
-                print(f"WARNING: Shape has no geometry (Volume=0, no faces)", file=sys.stderr)
-                continue
-
-            if refine:
-                try:
-                    shape = shape.removeSplitter()
-                except:
-                    pass
-            shapes.append(shape)
-
-    if not shapes:
-        print("ERROR: No valid shapes found. This usually means:", file=sys.stderr)
-        print("  - OpenSCAD code has syntax errors", file=sys.stderr)
-        print("  - Missing library imports (e.g., BOSL2 is not installed)", file=sys.stderr)
-        print("  - The model produces no geometry", file=sys.stderr)
-        sys.exit(1)
-
-    # Combine shapes
-    if len(shapes) == 1:
-        final_shape = shapes[0]
-    else:
-        final_shape = Part.makeCompound(shapes)
+        return workspace, None
 
-    # Verify final shape has geometry
-    try:
-        bbox = final_shape.BoundBox
-        if bbox.DiagonalLength < 1e-6:
-            print("ERROR: Final shape has zero size bounding box", file=sys.stderr)
-            sys.exit(1)
-        print(f"Shape bounding box: {{bbox.XLength:.2f}} x {{bbox.YLength:.2f}} x {{bbox.ZLength:.2f}}")
     except Exception as e:
-        print(f"WARNING: Could not compute bounding box: {{e}}", file=sys.stderr)
+        cleanup_workspace(workspace)
+        return None, f"Conversion error: {str(e)}"
+    except BaseException:
+        cleanup_workspace(workspace)
+        raise
+
+
+def _create_workspace(
+    formats: Sequence[str] = (STEP,),
+    mesh_deflection: float = DEFAULT_MESH_DEFLECTION,
+    solid_workers: int = 1,
+    profile: bool = False,
+    project: bool = False
+) -> ConversionWorkspace:
+    temp_dir = workspace_pool.acquire()
+    code_dir = os.path.join(temp_dir, PROJECT_DIR) if project else temp_dir
+    scad_path = os.path.join(code_dir, "input.scad")
+    return ConversionWorkspace(
+        temp_dir=temp_dir,
+        scad_path=scad_path,
+        import_path=scad_path,
+        output_paths={fmt: os.path.join(temp_dir, f"output.{fmt}") for fmt in normalize_formats(formats)},
+        mesh_deflection=mesh_deflection,
+        solid_workers=solid_workers,
+        profile=profile
+    )
+
+
+def link_project_files(directory: str, files: Dict[str, str]):
+    """
+    Hard-link files ({project path: source file}) into directory, copying
+    them where the source is on another filesystem. Raises ValueError for a
+    source that no longer exists.
+    """
+    for path, source in files.items():
+        target = os.path.join(directory, *path.split('/'))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            os.link(source, target)
+        except FileNotFoundError:
+            raise ValueError(f"Project file {path} is no longer stored; upload it again")
+        except OSError:
+            shutil.copyfile(source, target)
+
+
+def read_profile(workspace: ConversionWorkspace) -> Tuple[dict, Optional[bytes]]:
+    """
+    Read the profile files a profiled conversion left in its workspace.
+
+    Returns ({"openscadOutput": ..., "freecad": ...}, pstats file bytes),
+    leaving out whatever the conversion did not get far enough to write.
+    """
+    profile = {}
+    stats = None
+    try:
+        log_path = os.path.join(workspace.temp_dir, OPENSCAD_LOG)
+        if os.path.exists(log_path):
+            with open(log_path, 'r', encoding='utf-8', errors='replace') as f:
+                profile["openscadOutput"] = f.read()[-MAX_PROFILE_OUTPUT_CHARS:]
+        json_path = os.path.join(workspace.temp_dir, PROFILE_JSON)
+        if os.path.exists(json_path):
+            with open(json_path, 'r', encoding='utf-8') as f:
+                profile["freecad"] = json.load(f)
+        stats_path = os.path.join(workspace.temp_dir, PROFILE_STATS)
+        if os.path.exists(stats_path):
+            with open(stats_path, 'rb') as f:
+                stats = f.read()
+    except (OSError, ValueError) as e:
+        print(f"Warning: Could not read profile: {e}", file=sys.stderr)
+    return profile, stats
+
+
+def cleanup_workspace(workspace: ConversionWorkspace):
+    """Empty a conversion's temp directory and return it to workspace_pool."""
+    workspace_pool.release(workspace.temp_dir)
+
+
+def run_freecad_script(
+    workspace: ConversionWorkspace,
+    refine_policy: str,
+    on_process: Optional[ProcessCallback] = None
+) -> Tuple[bool, str, str]:
+    """
+    Run the FreeCAD stage in a fresh freecadcmd process.
+
+    Returns (succeeded, stdout, stderr). Raises subprocess.TimeoutExpired or
+    FileNotFoundError like subprocess.run.
+    """
+    freecad_script = _write_freecad_script(workspace, refine_policy)
+
+    # Run FreeCAD Python script
+    # Use freecadcmd or freecad with -c flag for headless mode
+    result = run_process(
+        ['freecadcmd', freecad_script],
+        timeout=FREECAD_TIMEOUT_SECONDS,
+        cwd=workspace.temp_dir,
+        on_process=on_process
+    )
+    return result.returncode == 0, result.stdout, result.stderr
+
+
+async def run_freecad_script_async(
+    workspace: ConversionWorkspace,
+    refine_policy: str,
+    on_process: Optional[ProcessCallback] = None,
+    on_phase: Optional[PhaseCallback] = None
+) -> Tuple[bool, str, str]:
+    """
+    Async run_freecad_script; the default FreeCADStage.
+
+    Phases announced on stderr are passed to on_phase as they happen, and a
+    2D model stops FreeCAD immediately.
+    """
+    freecad_script = _write_freecad_script(workspace, refine_policy)
+
+    def watch_line(line: str) -> bool:
+        if line.startswith(PHASE_PREFIX):
+            if on_phase:
+                on_phase(line[len(PHASE_PREFIX):].strip())
+            return False
+        return TWO_D_OBJECT_MESSAGE in line
+
+    result = await run_process_async(
+        ['freecadcmd', freecad_script],
+        timeout=FREECAD_TIMEOUT_SECONDS,
+        cwd=workspace.temp_dir,
+        on_process=on_process,
+        watch_line=watch_line
+    )
+    return result.returncode == 0, result.stdout, result.stderr
+
 
-    # Export to STEP
-    final_shape.exportStep("{step_path}")
+def _write_freecad_script(workspace: ConversionWorkspace, refine_policy: str) -> str:
+    freecad_script = os.path.join(workspace.temp_dir, "convert.py")
 
-    if not os.path.exists("{step_path}"):
-        print("ERROR: STEP file not created", file=sys.stderr)
-        sys.exit(1)
+    # The script only bootstraps; the conversion itself lives in freecad_job.py
+    script_content = f'''
+import sys
+sys.path.insert(0, {SERVICE_DIR!r})
+
+import freecad_job
+
+
+def announce_phase(phase):
+    print({PHASE_PREFIX!r} + phase, file=sys.stderr, flush=True)
 
-    print("SUCCESS")
 
-finally:
-    FreeCAD.closeDocument(doc.Name)
+freecad_job.setup_freecad()
+if not freecad_job.run_job(
+    {workspace.import_path!r},
+    {workspace.output_paths!r},
+    {refine_policy!r},
+    on_phase=announce_phase,
+    mesh_deflection={workspace.mesh_deflection!r},
+    subtree_cache_dir={SUBTREE_CACHE_DIR!r},
+    workers={workspace.solid_workers!r},
+    profile_dir={workspace.profile_dir!r}
+):
+    sys.exit(1)
 '''
 
-        with open(freecad_script, 'w') as f:
-            f.write(script_content)
-
-        # Run FreeCAD Python script
-        # Use freecadcmd or freecad with -c flag for headless mode
-        result = subprocess.run(
-            ['freecadcmd', freecad_script],
-            capture_output=True,
-            text=True,
-            timeout=300,  # 5 minute timeout
-            cwd=temp_dir
-        )
+    with open(freecad_script, 'w') as f:
+        f.write(script_content)
+    return freecad_script
+
+
+def _freecad_error(stdout: str, stderr: str) -> str:
+    """Classify the captured output of a failed FreeCAD stage into a user-facing error."""
+    combined = stderr.strip() + stdout.strip()
+
+    # Check for 2D object error from FreeCAD's OpenSCAD processing
+    if TWO_D_OBJECT_MESSAGE in combined:
+        return TWO_D_OBJECT_ERROR
 
-        if result.returncode != 0:
-            stderr = result.stderr.strip()
-            stdout = result.stdout.strip()
-            combined = stderr + stdout
-
-            # Check for 2D object error from FreeCAD's OpenSCAD processing
-            if "Top level object is a 2D object" in combined:
-                return b'', (
-                    "The model is a 2D object and cannot be exported to STEP format. "
-                    "STEP files require 3D geometry. Try adding linear_extrude() or "
-                    "rotate_extrude() to convert 2D shapes to 3D."
-                )
-
-            # Check for OpenSCAD syntax/semantic errors
-            if "ERROR:" in combined:
-                # Extract the first ERROR line
-                for line in combined.split('\n'):
-                    if 'ERROR:' in line:
-                        return b'', f"OpenSCAD error: {line.strip()}"
-
-            # Check for missing geometry
-            if "No valid shapes found" in combined:
-                return b'', "No valid 3D geometry was produced. Check your OpenSCAD code for errors."
-
-            # Fallback: provide a cleaner error message
-            # Extract first meaningful error line (skip warnings and cache info)
-            error_lines = []
-            for line in combined.split('\n'):
-                line = line.strip()
-                if not line:
-                    continue
-                # Skip noise lines
-                if any(skip in line for skip in [
-                    'Geometries in cache',
-                    'Geometry cache size',
-                    'CGAL Polyhedrons',
-                    'CGAL cache size',
-                    'Total rendering time',
-                    'Token',
-                    'unused tokens',
-                    'DXF libraries',
-                ]):
-                    continue
-                error_lines.append(line)
-
-            if error_lines:
-                # Return first few meaningful lines
-                error_msg = ' '.join(error_lines[:3])
-                if len(error_msg) > 300:
-                    error_msg = error_msg[:300] + '...'
-                return b'', f"Conversion failed: {error_msg}"
-
-            return b'', "FreeCAD conversion failed with unknown error"
-
-        if "SUCCESS" not in result.stdout:
-            return b'', f"FreeCAD conversion failed: {result.stderr or result.stdout}"
+    # Check for OpenSCAD syntax/semantic errors
+    if "ERROR:" in combined:
+        # Extract the first ERROR line
+        for line in combined.split('\n'):
+            if 'ERROR:' in line:
+                return f"OpenSCAD error: {line.strip()}"
 
+    # Check for missing geometry
+    if "No valid shapes found" in combined:
+        return NO_VALID_SHAPES_ERROR
+
+    # Fallback: provide a cleaner error message
+    # Extract first meaningful error line (skip warnings and cache info)
+    error_lines = []
+    for line in combined.split('\n'):
+        line = line.strip()
+        if not line:
+            continue
+        # Skip noise lines
+        if any(skip in line for skip in [
+            'Geometries in cache',
+            'Geometry cache size',
+            'CGAL Polyhedrons',
+            'CGAL cache size',
+            'Total rendering time',
+            'Token',
+            'unused tokens',
+            'DXF libraries',
+            TIMINGS_PREFIX,
+            PHASE_PREFIX,
+        ]):
+            continue
+        error_lines.append(line)
+
+    if error_lines:
+        # Return first few meaningful lines
+        error_msg = ' '.join(error_lines[:3])
+        if len(error_msg) > 300:
+            error_msg = error_msg[:300] + '...'
+        return f"Conversion failed: {error_msg}"
+
+    return "FreeCAD conversion failed with unknown error"
+
+
+def collect_results(
+    workspace: ConversionWorkspace,
+    succeeded: bool,
+    stdout: str,
+    stderr: str
+) -> Tuple[Dict[str, bytes], Optional[str]]:
+    """
+    Turn the FreeCAD stage's outcome into ({format: bytes}, error_message).
+
+    Failures are classified from the captured output into user-facing errors.
+    """
+    if not succeeded:
+        return {}, _freecad_error(stdout, stderr)
+
+    if "SUCCESS" not in stdout:
+        return {}, f"FreeCAD conversion failed: {stderr or stdout}"
+
+    artifacts = {}
+    for fmt, path in workspace.output_paths.items():
         # Verify the file was created
-        if not os.path.exists(step_path):
-            return b'', "STEP file was not created"
+        if not os.path.exists(path):
+            return {}, f"{fmt.upper()} file was not created"
+        data = read_output(path)
+        if len(data) == 0:
+            return {}, f"{fmt.upper()} file is empty"
+        artifacts[fmt] = data
 
-        # Read and return the STEP file content
-        with open(step_path, 'rb') as f:
-            step_content = f.read()
+    return artifacts, None
 
-        if len(step_content) == 0:
-            return b'', "STEP file is empty"
 
-        return step_content, None
+def read_output(path: str) -> bytes:
+    """
+    Read an output file through a memory map, copying it straight from the
+    page cache (the tmpfs itself with WORKSPACE_DIR) into the returned bytes.
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b''
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return mapped[:]
+
+
+def convert_scad_to_step(
+    scad_code: str,
+    refine_shape: bool = True,
+    pipeline: Optional[str] = None,
+    on_process: Optional[ProcessCallback] = None,
+    on_phase: Optional[PhaseCallback] = None,
+    on_timing: Optional[TimingCallback] = None
+) -> Tuple[bytes, Optional[str]]:
+    """
+    Convert OpenSCAD code to STEP format using FreeCAD.
+
+    This function:
+    1. Writes the .scad code to a temp file
+    2. Evaluates it once with OpenSCAD to CSG, rejecting 2D or empty models
+    3. Uses FreeCAD's Python API to import the CSG and export
+    4. Returns the STEP file content
+
+    Args:
+        scad_code: OpenSCAD source code string
+        refine_shape: Whether to refine the shape (merge coplanar faces)
+        pipeline: "single" or "two_pass"; defaults to CONVERSION_PIPELINE
+        on_process: Optional callback receiving the pid of each subprocess
+        on_phase: Optional callback receiving each phase as it starts. A
+            one-off freecadcmd process only reports the FreeCAD import phase
+        on_timing: Optional callback receiving (phase, seconds) per phase
+
+    Returns:
+        Tuple of (step_bytes, error_message)
+        If successful, error_message is None
+    """
+    if on_phase:
+        on_phase(PHASE_OPENSCAD)
+    started = time.monotonic()
+    workspace, error = prepare_conversion(scad_code, pipeline, on_process)
+    if on_timing:
+        on_timing(PHASE_OPENSCAD, time.monotonic() - started)
+    if error:
+        return b'', error
+
+    try:
+        if on_phase:
+            on_phase(PHASE_FREECAD_IMPORT)
+        started = time.monotonic()
+        refine_policy = REFINE_ALWAYS if refine_shape else REFINE_NEVER
+        succeeded, stdout, stderr = run_freecad_script(workspace, refine_policy, on_process)
+        if on_timing:
+            on_timing(PHASE_FREECAD, time.monotonic() - started)
+            for phase, seconds in parse_freecad_timings(stdout).items():
+                on_timing(phase, seconds)
+        artifacts, error = collect_results(workspace, succeeded, stdout, stderr)
+        return artifacts.get(STEP, b''), error
 
     except subprocess.TimeoutExpired:
-        return b'', "FreeCAD conversion timed out (exceeded 5 minutes)"
+        return b'', FREECAD_TIMEOUT_ERROR
     except FileNotFoundError:
-        return b'', "FreeCAD (freecadcmd) not found. Is FreeCAD installed?"
+        return b'', FREECAD_NOT_FOUND_ERROR
     except Exception as e:
         return b'', f"Conversion error: {str(e)}"
 
     finally:
         # Cleanup temp directory
-        try:
-            shutil.rmtree(temp_dir)
-        except Exception:
-            pass
+        cleanup_workspace(workspace)
+
+
+async def convert_scad_async(
+    scad_code: str,
+    formats: Sequence[str] = (STEP,),
+    mesh_deflection: float = DEFAULT_MESH_DEFLECTION,
+    refine_policy: str = REFINE_ALWAYS,
+    pipeline: Optional[str] = None,
+    on_process: Optional[ProcessCallback] = None,
+    on_phase: Optional[PhaseCallback] = None,
+    on_timing: Optional[TimingCallback] = None,
+    run_freecad: Optional[FreeCADStage] = None,
+    on_refine: Optional[RefineCallback] = None,
+    solid_workers: int = 1,
+    on_profile: Optional[ProfileCallback] = None,
+    files: Optional[Dict[str, str]] = None
+) -> Tuple[Dict[str, bytes], Optional[str]]:
+    """
+    Convert OpenSCAD code to STEP and the other requested formats.
+
+    Every format is exported from the same FreeCAD shape in one run; mesh
+    formats share one tessellation with mesh_deflection (mm). refine_policy
+    is one of freecad_job.REFINE_POLICIES; the decision it led to is passed
+    to on_refine. FreeCAD validates and refines independent solids in up
+    to solid_workers processes. Returns ({format: bytes}, error_message).
+
+    Unlike convert_scad_to_step this can be cancelled at any point: OpenSCAD
+    is stopped at its first fatal error instead of finishing the render, and
+    cancelling the calling task kills whichever process is running and
+    removes the workspace. run_freecad replaces the one-off freecadcmd
+    process, e.g. with a worker pool.
+
+    With on_profile, the conversion is profiled and on_profile receives
+    read_profile's results once FreeCAD is done, whether or not it succeeded.
+    files ({project path: source file}) are placed next to the code for it
+    to include, use or import.
+    """
+    run_freecad = run_freecad or run_freecad_script_async
+
+    if on_phase:
+        on_phase(PHASE_OPENSCAD)
+    started = time.monotonic()
+    workspace, error = await prepare_conversion_async(
+        scad_code, pipeline, on_process, formats, mesh_deflection, solid_workers,
+        profile=on_profile is not None, files=files
+    )
+    if on_timing:
+        on_timing(PHASE_OPENSCAD, time.monotonic() - started)
+    if error:
+        return {}, error
+
+    try:
+        if on_phase:
+            on_phase(PHASE_FREECAD_IMPORT)
+        started = time.monotonic()
+        succeeded, stdout, stderr = await run_freecad(workspace, refine_policy, on_process, on_phase)
+        if on_timing:
+            on_timing(PHASE_FREECAD, time.monotonic() - started)
+            for phase, seconds in parse_freecad_timings(stdout).items():
+                on_timing(phase, seconds)
+        refine_report = parse_freecad_refine(stdout)
+        if on_refine and refine_report is not None:
+            on_refine(refine_report)
+        # Reading back large output files is blocking I/O
+        loop = asyncio.get_running_loop()
+        if on_profile:
+            on_profile(*await loop.run_in_executor(None, read_profile, workspace))
+        return await loop.run_in_executor(
+            None, collect_results, workspace, succeeded, stdout, stderr
+        )
+
+    except (subprocess.TimeoutExpired, asyncio.TimeoutError):
+        return {}, FREECAD_TIMEOUT_ERROR
+    except FileNotFoundError:
+        return {}, FREECAD_NOT_FOUND_ERROR
+    except Exception as e:
+        return {}, f"Conversion error: {str(e)}"
+
+    finally:
+        cleanup_workspace(workspace)
 
 
 if __name__ == "__main__":
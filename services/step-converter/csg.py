@@ -0,0 +1,180 @@
+"""
+Minimal parser for the CSG files emitted by `openscad -o model.csg`.
+Used to inspect the evaluated tree (e.g. 2D vs 3D) without re-running OpenSCAD.
+Only depends on the standard library so it can also be imported inside FreeCAD.
+"""
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+
+# Nodes that always produce 2D geometry
+PRIMITIVES_2D = {'circle', 'square', 'polygon', 'text', 'projection'}
+
+# Nodes that always produce 3D geometry
+PRIMITIVES_3D = {
+    'cube', 'sphere', 'cylinder', 'polyhedron', 'surface',
+    'linear_extrude', 'rotate_extrude',
+}
+
+IMPORT_EXTENSIONS_2D = ('.dxf', '.svg')
+
+# Background (%) and disabled (*) nodes are not part of the rendered model
+NON_RENDERED_MODIFIERS = ('%', '*')
+
+
+@dataclass
+class CsgNode:
+    name: str
+    args: str = ""
+    children: List["CsgNode"] = field(default_factory=list)
+    modifier: str = ""
+
+    def to_csg(self) -> str:
+        """Serialize the subtree back to canonical single-line CSG text."""
+        head = f"{self.modifier}{self.name}({self.args})"
+        if not self.children:
+            return f"{head};"
+        inner = " ".join(child.to_csg() for child in self.children)
+        return f"{head} {{ {inner} }}"
+
+
+class CsgParseError(ValueError):
+    pass
+
+
+class _Parser:
+    def __init__(self, text: str):
+        self.text = text
+        self.pos = 0
+
+    def parse(self) -> List[CsgNode]:
+        nodes = self._statements()
+        self._skip()
+        if self.pos < len(self.text):
+            raise CsgParseError(f"Unexpected input at offset {self.pos}")
+        return nodes
+
+    def _skip(self):
+        text = self.text
+        while self.pos < len(text):
+            char = text[self.pos]
+            if char.isspace():
+                self.pos += 1
+            elif text.startswith('//', self.pos):
+                end = text.find('\n', self.pos)
+                self.pos = len(text) if end == -1 else end + 1
+            elif text.startswith('/*', self.pos):
+                end = text.find('*/', self.pos + 2)
+                self.pos = len(text) if end == -1 else end + 2
+            else:
+                break
+
+    def _statements(self) -> List[CsgNode]:
+        nodes = []
+        while True:
+            self._skip()
+            if self.pos >= len(self.text) or self.text[self.pos] == '}':
+                return nodes
+            if self.text[self.pos] == ';':
+                self.pos += 1
+                continue
+            nodes.append(self._statement())
+
+    def _statement(self) -> CsgNode:
+        text = self.text
+        # Debug modifiers (#, %, !, *) may prefix a node
+        modifier_start = self.pos
+        while self.pos < len(text) and text[self.pos] in '#%!*':
+            self.pos += 1
+        modifier = text[modifier_start:self.pos]
+        start = self.pos
+        while self.pos < len(text) and (text[self.pos].isalnum() or text[self.pos] in '_$'):
+            self.pos += 1
+        name = text[start:self.pos]
+        if not name:
+            raise CsgParseError(f"Expected node name at offset {start}")
+
+        self._skip()
+        args = ""
+        if self.pos < len(text) and text[self.pos] == '(':
+            args = self._arguments()
+
+        self._skip()
+        node = CsgNode(name=name, args=args, modifier=modifier)
+        if self.pos < len(text) and text[self.pos] == '{':
+            self.pos += 1
+            node.children = self._statements()
+            self._skip()
+            if self.pos >= len(text) or text[self.pos] != '}':
+                raise CsgParseError(f"Unterminated block for '{name}'")
+            self.pos += 1
+        elif self.pos < len(text) and text[self.pos] == ';':
+            self.pos += 1
+        return node
+
+    def _arguments(self) -> str:
+        """Consume a balanced parenthesized argument list and return its body."""
+        text = self.text
+        depth = 0
+        start = self.pos + 1
+        in_string = False
+        while self.pos < len(text):
+            char = text[self.pos]
+            if in_string:
+                if char == '\\':
+                    self.pos += 1
+                elif char == '"':
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            elif char in '([':
+                depth += 1
+            elif char in ')]':
+                depth -= 1
+                if depth == 0:
+                    self.pos += 1
+                    return text[start:self.pos - 1].strip()
+            self.pos += 1
+        raise CsgParseError("Unterminated argument list")
+
+
+def parse_csg(text: str) -> List[CsgNode]:
+    """Parse CSG source into a list of top-level nodes."""
+    return _Parser(text).parse()
+
+
+def node_dimension(node: CsgNode, memo: Optional[Dict[int, Optional[int]]] = None) -> Optional[int]:
+    """
+    Return 2 or 3 for the dimension of the geometry a node produces,
+    or None if it produces no geometry.
+
+    Callers asking about many nodes of one tree pass the same memo dict, so
+    that each subtree is only visited once.
+    """
+    if memo is not None and id(node) in memo:
+        return memo[id(node)]
+    if any(m in node.modifier for m in NON_RENDERED_MODIFIERS):
+        dimension = None
+    elif node.name in PRIMITIVES_3D:
+        dimension = 3
+    elif node.name in PRIMITIVES_2D:
+        dimension = 2
+    elif node.name == 'import':
+        args = node.args.lower()
+        dimension = 2 if any(ext in args for ext in IMPORT_EXTENSIONS_2D) else 3
+    else:
+        dimensions = {node_dimension(child, memo) for child in node.children}
+        dimension = 3 if 3 in dimensions else 2 if 2 in dimensions else None
+    if memo is not None:
+        memo[id(node)] = dimension
+    return dimension
+
+
+def tree_dimension(nodes: List[CsgNode]) -> Optional[int]:
+    """Return the dimension of a whole CSG tree (3 wins over 2)."""
+    dimensions = {node_dimension(node) for node in nodes}
+    if 3 in dimensions:
+        return 3
+    if 2 in dimensions:
+        return 2
+    return None
@@ -0,0 +1,551 @@
+"""
+FreeCAD side of the conversion: imports CSG, collects shapes and exports them
+as STEP and any other requested formats.
+Runs under FreeCAD's bundled Python, either from a per-job script executed by
+freecadcmd or inside a long-lived worker process (see freecad_worker.py).
+"""
+import os
+import sys
+import json
+import time
+import struct
+import cProfile
+import pstats
+from array import array
+from typing import Callable, Dict, Optional, Tuple
+
+import subtree_cache
+
+
+FREECAD_PATHS = [
+    "/usr/lib/freecad/lib",
+    "/usr/lib/freecad-python3/lib",
+    "/usr/share/freecad/lib",
+    "/usr/share/freecad/Mod",
+]
+
+OPENSCAD_EXECUTABLE = "/usr/bin/openscad"
+
+# Prefix of the stdout line carrying a job's phase timings as JSON
+TIMINGS_PREFIX = "TIMINGS: "
+# Prefix of the stdout line carrying the refine decision and face counts as JSON
+REFINE_PREFIX = "REFINE: "
+
+# Refine policies: merge coplanar faces always, never, or depending on size
+REFINE_ALWAYS = "always"
+REFINE_NEVER = "never"
+REFINE_AUTO = "auto"
+REFINE_POLICIES = (REFINE_ALWAYS, REFINE_NEVER, REFINE_AUTO)
+
+# Refine decisions: whole shapes, each solid on its own, or not at all
+REFINE_FULL = "full"
+REFINE_PER_SOLID = "per_solid"
+REFINE_SKIPPED = "skipped"
+
+# removeSplitter grows superlinearly with face count, which polyhedra from
+# BOSL2 or high $fn push into the thousands. Under "auto", models up to
+# AUTO_REFINE_FACES faces are refined whole; larger ones solid by solid,
+# leaving solids above AUTO_REFINE_FACES as they are; beyond
+# AUTO_REFINE_MAX_FACES refine is skipped.
+AUTO_REFINE_FACES = int(os.environ.get("AUTO_REFINE_FACES", "5000"))
+AUTO_REFINE_MAX_FACES = int(os.environ.get("AUTO_REFINE_MAX_FACES", "50000"))
+
+# Output formats, named after their file extensions. STEP and BREP are exact
+# B-Rep exports; the rest are written from one tessellation of the shape.
+STEP = "step"
+BREP = "brep"
+STL = "stl"
+THREE_MF = "3mf"
+GLB = "glb"
+OUTPUT_FORMATS = (STEP, BREP, STL, THREE_MF, GLB)
+MESH_FORMATS = (STL, THREE_MF, GLB)
+
+# Files a profiled job leaves in its profile directory
+PROFILE_JSON = "freecad_profile.json"
+PROFILE_STATS = "freecad.pstats"
+# Functions listed in the JSON profile, by cumulative time
+PROFILE_TOP_FUNCTIONS = 40
+
+# Maximum distance in mm between the tessellation and the true surface
+DEFAULT_MESH_DEFLECTION = 0.1
+MESH_ANGULAR_DEFLECTION = 0.5  # radians
+
+
+def _ignore_phase(phase: str):
+    pass
+
+
+def _shape_counts(shape) -> Dict[str, int]:
+    """Face, edge and solid counts of a shape."""
+    try:
+        return {
+            "faces": len(shape.Faces),
+            "edges": len(shape.Edges),
+            "solids": len(shape.Solids),
+        }
+    except Exception:
+        return {"faces": 0, "edges": 0, "solids": 0}
+
+
+class JobProfile:
+    """
+    Measurements of one profiled job: a cProfile of the whole job, the
+    recompute time and size of every imported object, face counts around
+    refine for every shape, and the time spent writing each format.
+    """
+
+    def __init__(self):
+        self.profiler = cProfile.Profile()
+        self.objects: list = []
+        self.shapes: list = []
+        self.exports: Dict[str, float] = {}
+
+    def time_objects(self, doc):
+        """Recompute each document object on its own, dependencies first."""
+        for obj in doc.Objects:
+            entry = {}
+            try:
+                entry["name"] = getattr(obj, 'Name', None)
+                entry["label"] = getattr(obj, 'Label', None)
+                entry["type"] = getattr(obj, 'TypeId', None)
+                obj.touch()
+                started = time.monotonic()
+                obj.recompute()
+                entry["seconds"] = time.monotonic() - started
+            except Exception as e:
+                entry["error"] = str(e)
+            if hasattr(obj, 'Shape'):
+                entry.update(_shape_counts(obj.Shape))
+            self.objects.append(entry)
+
+    def write(self, directory: str):
+        """Write PROFILE_JSON and PROFILE_STATS to directory."""
+        self.profiler.dump_stats(os.path.join(directory, PROFILE_STATS))
+        stats = pstats.Stats(self.profiler)
+        functions = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)
+        profile = {
+            "objects": self.objects,
+            "shapes": self.shapes,
+            "exports": self.exports,
+            "functions": [
+                {
+                    "function": f"{filename}:{line}({name})",
+                    "calls": calls,
+                    "seconds": total,
+                    "cumulativeSeconds": cumulative,
+                }
+                for (filename, line, name), (_primitive, calls, total, cumulative, _callers)
+                in functions[:PROFILE_TOP_FUNCTIONS]
+            ],
+        }
+        with open(os.path.join(directory, PROFILE_JSON), 'w') as f:
+            json.dump(profile, f)
+
+
+def setup_freecad():
+    """Make FreeCAD importable and configure the OpenSCAD workbench."""
+    # Add FreeCAD lib path
+    for p in FREECAD_PATHS:
+        if os.path.exists(p) and p not in sys.path:
+            sys.path.insert(0, p)
+
+    # Set FreeCAD home for module loading
+    os.environ["FREECAD_USER_HOME"] = "/tmp"
+
+    import FreeCAD
+
+    # Configure OpenSCAD executable path before importing importCSG
+    FreeCAD.ParamGet("User parameter:BaseApp/Preferences/Mod/OpenSCAD").SetString(
+        "openscadexecutable", OPENSCAD_EXECUTABLE
+    )
+
+    import Part  # noqa: F401
+    import importCSG  # noqa: F401
+
+
+def write_glb(mesh, path: str):
+    """
+    Write a FreeCAD mesh as a binary glTF file with a single unlit primitive.
+
+    Coordinates stay in millimetres; the root node scales them to metres and
+    turns OpenSCAD's Z-up into glTF's Y-up.
+    """
+    points, facets = mesh.Topology
+    positions = array('f', [c for point in points for c in (point.x, point.y, point.z)])
+    indices = array('I', [index for facet in facets for index in facet])
+    if sys.byteorder == "big":
+        positions.byteswap()
+        indices.byteswap()
+    position_bytes = positions.tobytes()
+    index_bytes = indices.tobytes()
+
+    gltf = {
+        "asset": {"version": "2.0", "generator": "step-converter"},
+        "scene": 0,
+        "scenes": [{"nodes": [0]}],
+        "nodes": [{
+            "mesh": 0,
+            "scale": [0.001, 0.001, 0.001],
+            "rotation": [-0.7071068, 0.0, 0.0, 0.7071068],
+        }],
+        "meshes": [{"primitives": [{"attributes": {"POSITION": 0}, "indices": 1}]}],
+        "buffers": [{"byteLength": len(position_bytes) + len(index_bytes)}],
+        "bufferViews": [
+            {"buffer": 0, "byteOffset": 0, "byteLength": len(position_bytes), "target": 34962},
+            {
+                "buffer": 0,
+                "byteOffset": len(position_bytes),
+                "byteLength": len(index_bytes),
+                "target": 34963,
+            },
+        ],
+        "accessors": [
+            {
+                "bufferView": 0,
+                "componentType": 5126,
+                "count": len(points),
+                "type": "VEC3",
+                "min": [min(p[i] for p in points) for i in range(3)] if points else [0, 0, 0],
+                "max": [max(p[i] for p in points) for i in range(3)] if points else [0, 0, 0],
+            },
+            {"bufferView": 1, "componentType": 5125, "count": len(indices), "type": "SCALAR"},
+        ],
+    }
+    json_chunk = json.dumps(gltf, separators=(",", ":")).encode('utf-8')
+    json_chunk += b' ' * (-len(json_chunk) % 4)
+    bin_chunk = position_bytes + index_bytes
+    bin_chunk += b'\0' * (-len(bin_chunk) % 4)
+
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<III', 0x46546C67, 2, 12 + 8 + len(json_chunk) + 8 + len(bin_chunk)))
+        f.write(struct.pack('<II', len(json_chunk), 0x4E4F534A))
+        f.write(json_chunk)
+        f.write(struct.pack('<II', len(bin_chunk), 0x004E4942))
+        f.write(bin_chunk)
+
+
+def choose_refine(policy: str, faces: int) -> str:
+    """Pick REFINE_FULL, REFINE_PER_SOLID or REFINE_SKIPPED for a model with this many faces."""
+    if policy == REFINE_NEVER:
+        return REFINE_SKIPPED
+    if policy == REFINE_ALWAYS or faces <= AUTO_REFINE_FACES:
+        return REFINE_FULL
+    if faces <= AUTO_REFINE_MAX_FACES:
+        return REFINE_PER_SOLID
+    return REFINE_SKIPPED
+
+
+def refine_shape(shape, decision: str):
+    """
+    Merge coplanar faces of a shape; failures leave it unrefined.
+
+    REFINE_PER_SOLID refines each solid separately, skipping solids with
+    more than AUTO_REFINE_FACES faces; shapes with faces outside any solid
+    are left as they are.
+    """
+    import Part
+
+    try:
+        if decision == REFINE_FULL:
+            return shape.removeSplitter()
+        solids = shape.Solids
+        if not solids or sum(len(solid.Faces) for solid in solids) != len(shape.Faces):
+            return shape
+        solids = [
+            solid.removeSplitter() if len(solid.Faces) <= AUTO_REFINE_FACES else solid
+            for solid in solids
+        ]
+        return solids[0] if len(solids) == 1 else Part.makeCompound(solids)
+    except Exception:
+        return shape
+
+
+def _has_geometry(shape) -> bool:
+    """Check if shape has actual geometry (volume > 0 or has faces)."""
+    try:
+        if hasattr(shape, 'Volume') and shape.Volume > 1e-9:
+            return True
+        elif hasattr(shape, 'Faces') and len(shape.Faces) > 0:
+            return True
+        elif hasattr(shape, 'Solids') and len(shape.Solids) > 0:
+            return True
+    except Exception:
+        pass
+    return False
+
+
+def _process_shape(shape, decision: str):
+    """Copy, validate and refine one shape; None if it has no geometry."""
+    shape = shape.copy()
+    if not _has_geometry(shape):
+        return None
+    if decision != REFINE_SKIPPED:
+        shape = refine_shape(shape, decision)
+    return shape
+
+
+def _process_brep(brep: str, decision: str) -> Tuple[Optional[str], float]:
+    """
+    _process_shape for a shape serialized as BREP text, run in a forked
+    process. Returns the processed BREP text and the seconds it took.
+    """
+    import Part
+
+    shape = Part.Shape()
+    shape.importBrepFromString(brep)
+    started = time.monotonic()
+    shape = _process_shape(shape, decision)
+    seconds = time.monotonic() - started
+    return (shape.exportBrepToString() if shape is not None else None), seconds
+
+
+def _work_units(shapes: list) -> list:
+    """Split shapes made only of several disjoint solids into those solids."""
+    units = []
+    for shape in shapes:
+        solids = shape.Solids
+        if len(solids) > 1 and sum(len(solid.Faces) for solid in solids) == len(shape.Faces):
+            units.extend(solids)
+        else:
+            units.append(shape)
+    return units
+
+
+def process_shapes(
+    shapes: list,
+    decision: str,
+    workers: int = 1,
+    profile: Optional[JobProfile] = None
+) -> Tuple[list, int]:
+    """
+    Copy, validate and refine shapes, dropping those without geometry.
+
+    With more than one worker, the shapes are split into independent solids
+    that are processed by up to that many forked processes, passing shapes
+    back and forth as BREP text. Returns (shapes, processes used).
+    A profile records the counts before and after and the time of each shape.
+    """
+    import Part
+
+    if decision == REFINE_SKIPPED:
+        # Validation alone is not worth serializing shapes for
+        workers = 1
+    units = _work_units(shapes) if workers > 1 else shapes
+    workers = min(workers, len(units))
+    results = None
+    seconds = [None] * len(units)
+    if workers > 1:
+        import multiprocessing
+
+        try:
+            # Forked children inherit the loaded FreeCAD modules
+            with multiprocessing.get_context("fork").Pool(workers) as pool:
+                breps = pool.starmap(
+                    _process_brep,
+                    [(unit.exportBrepToString(), decision) for unit in units],
+                    chunksize=1
+                )
+        except OSError as e:
+            print(f"WARNING: Processing shapes serially: {e}", file=sys.stderr)
+        else:
+            results = []
+            for index, (brep, unit_seconds) in enumerate(breps):
+                seconds[index] = unit_seconds
+                shape = None
+                if brep is not None:
+                    shape = Part.Shape()
+                    shape.importBrepFromString(brep)
+                results.append(shape)
+    if results is None:
+        workers = 1
+        results = []
+        for index, unit in enumerate(units):
+            started = time.monotonic()
+            results.append(_process_shape(unit, decision))
+            seconds[index] = time.monotonic() - started
+
+    if profile is not None:
+        for unit, shape, unit_seconds in zip(units, results, seconds):
+            profile.shapes.append({
+                "before": _shape_counts(unit),
+                "after": _shape_counts(shape) if shape is not None else None,
+                "seconds": unit_seconds,
+            })
+
+    processed = []
+    for shape in results:
+        if shape is None:
+            print("WARNING: Shape has no geometry (Volume=0, no faces)", file=sys.stderr)
+            continue
+        processed.append(shape)
+    return processed, max(workers, 1)
+
+
+def export_shape(
+    shape,
+    output_paths: Dict[str, str],
+    mesh_deflection: float,
+    timings: Dict[str, float],
+    profile: Optional[JobProfile] = None
+):
+    """
+    Write shape to every path in output_paths ({format: path}); a profile
+    records the seconds spent writing each format.
+    """
+    exports = profile.exports if profile is not None else {}
+    for fmt, method in ((STEP, "exportStep"), (BREP, "exportBrep")):
+        if fmt in output_paths:
+            started = time.monotonic()
+            getattr(shape, method)(output_paths[fmt])
+            exports[fmt] = time.monotonic() - started
+
+    if any(fmt in output_paths for fmt in MESH_FORMATS):
+        import MeshPart
+
+        started = time.monotonic()
+        mesh = MeshPart.meshFromShape(
+            Shape=shape,
+            LinearDeflection=mesh_deflection,
+            AngularDeflection=MESH_ANGULAR_DEFLECTION,
+            Relative=False
+        )
+        timings["tessellate"] = time.monotonic() - started
+        for fmt in (STL, THREE_MF, GLB):
+            if fmt in output_paths:
+                started = time.monotonic()
+                if fmt == GLB:
+                    write_glb(mesh, output_paths[fmt])
+                else:
+                    mesh.write(output_paths[fmt])
+                exports[fmt] = time.monotonic() - started
+
+
+def run_job(
+    import_path: str,
+    output_paths: Dict[str, str],
+    refine: str,
+    on_phase: Optional[Callable[[str], None]] = None,
+    mesh_deflection: float = DEFAULT_MESH_DEFLECTION,
+    subtree_cache_dir: str = "",
+    workers: int = 1,
+    profile_dir: str = ""
+) -> bool:
+    """
+    Import a CSG/SCAD file into a fresh document and export the resulting
+    shape to each of output_paths ({format: path}), refining it according
+    to the refine policy (one of REFINE_POLICIES).
+
+    With a subtree_cache_dir, a CSG file is assembled by subtree_cache from
+    cached subtree shapes where possible instead of one importCSG pass.
+    Shapes are validated and refined by up to workers processes (see
+    process_shapes).
+
+    Progress and errors are printed to stdout/stderr for the parent to
+    classify, and on_phase is called as the refine and export phases start.
+    Phase durations in seconds are printed as a TIMINGS_PREFIX line, also
+    when the job fails, and the refine decision as a REFINE_PREFIX line.
+    The document is always closed so a worker can be reused.
+
+    With a profile_dir, the job runs under cProfile, every imported object
+    is recomputed on its own to time it, and a JobProfile is written to
+    profile_dir, also when the job fails. Profiled jobs skip the subtree
+    cache so that every object is imported.
+
+    Returns True on success.
+    """
+    if on_phase is None:
+        on_phase = _ignore_phase
+
+    import FreeCAD
+    import Part
+    import importCSG
+
+    # Create document
+    doc = FreeCAD.newDocument("ConversionDoc")
+    timings = {}
+    profile = JobProfile() if profile_dir else None
+    if profile is not None:
+        subtree_cache_dir = ""
+        profile.profiler.enable()
+
+    try:
+        # Import OpenSCAD file (pre-evaluated CSG, or .scad in two-pass mode)
+        started = time.monotonic()
+        candidates = None
+        if subtree_cache_dir and import_path.endswith(".csg"):
+            try:
+                candidates = subtree_cache.import_shapes(import_path, subtree_cache_dir)
+            except Exception as e:
+                print(f"WARNING: Subtree cache failed, importing the whole file: {e}")
+        if candidates is None:
+            importCSG.insert(import_path, doc.Name)
+            candidates = subtree_cache.root_shapes(doc)
+        timings["freecad_import"] = time.monotonic() - started
+        if profile is not None:
+            profile.time_objects(doc)
+
+        # Collect all shapes
+        shapes = [candidate for candidate in candidates if candidate and not candidate.isNull()]
+        faces = sum(len(shape.Faces) for shape in shapes)
+        decision = choose_refine(refine, faces)
+        report = {
+            "policy": refine,
+            "decision": decision,
+            "faces": faces,
+            "solids": sum(len(shape.Solids) for shape in shapes),
+        }
+        if decision != REFINE_SKIPPED:
+            on_phase("refine")
+        started = time.monotonic()
+        shapes, report["workers"] = process_shapes(shapes, decision, workers, profile)
+        if decision != REFINE_SKIPPED:
+            timings["refine"] = time.monotonic() - started
+            report["refined_faces"] = sum(len(shape.Faces) for shape in shapes)
+        print(REFINE_PREFIX + json.dumps(report))
+
+        if not shapes:
+            print("ERROR: No valid shapes found. This usually means:", file=sys.stderr)
+            print("  - OpenSCAD code has syntax errors", file=sys.stderr)
+            print("  - Missing library imports (e.g., BOSL2 is not installed)", file=sys.stderr)
+            print("  - The model produces no geometry", file=sys.stderr)
+            return False
+
+        # Combine shapes
+        if len(shapes) == 1:
+            final_shape = shapes[0]
+        else:
+            final_shape = Part.makeCompound(shapes)
+
+        # Verify final shape has geometry
+        try:
+            bbox = final_shape.BoundBox
+            if bbox.DiagonalLength < 1e-6:
+                print("ERROR: Final shape has zero size bounding box", file=sys.stderr)
+                return False
+            print(f"Shape bounding box: {bbox.XLength:.2f} x {bbox.YLength:.2f} x {bbox.ZLength:.2f}")
+        except Exception as e:
+            print(f"WARNING: Could not compute bounding box: {e}", file=sys.stderr)
+
+        # Export every format from the same shape
+        on_phase("export")
+        started = time.monotonic()
+        export_shape(final_shape, output_paths, mesh_deflection, timings, profile)
+        timings["export"] = time.monotonic() - started - timings.get("tessellate", 0.0)
+
+        for fmt, path in output_paths.items():
+            if not os.path.exists(path):
+                print(f"ERROR: {fmt.upper()} file not created", file=sys.stderr)
+                return False
+
+        print("SUCCESS")
+        return True
+
+    finally:
+        if profile is not None:
+            profile.profiler.disable()
+            try:
+                profile.write(profile_dir)
+            except Exception as e:
+                print(f"WARNING: Could not write profile: {e}", file=sys.stderr)
+        print(TIMINGS_PREFIX + json.dumps(timings))
+        FreeCAD.closeDocument(doc.Name)
@@ -0,0 +1,311 @@
+"""
+Pool of long-lived FreeCAD worker processes.
+Avoids paying freecadcmd startup and module imports on every conversion.
+"""
+import os
+import json
+import socket
+import asyncio
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from converter import (
+    SERVICE_DIR,
+    FREECAD_TIMEOUT_SECONDS,
+    DEFAULT_MESH_DEFLECTION,
+    REFINE_ALWAYS,
+    SUBTREE_CACHE_DIR,
+    STEP,
+    ConversionWorkspace,
+    convert_scad_async,
+    kill_process_tree,
+    PhaseCallback,
+    ProcessCallback,
+    ProfileCallback,
+    RefineCallback,
+    TimingCallback,
+)
+from resources import process_rss_bytes
+
+
+WORKER_SCRIPT = os.path.join(SERVICE_DIR, "freecad_worker.py")
+WORKER_STARTUP_TIMEOUT_SECONDS = 120
+# Upper bound for a single protocol line (captured job output is trimmed well below this)
+MAX_MESSAGE_BYTES = 16 * 1024 * 1024
+
+
+class WorkerError(Exception):
+    pass
+
+
+class FreeCADWorker:
+    """One freecadcmd process serving jobs over a socket pair."""
+
+    def __init__(self):
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.jobs_done = 0
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+
+    async def start(self):
+        parent_sock, child_sock = socket.socketpair()
+        env = dict(os.environ)
+        env["FREECAD_WORKER_FD"] = str(child_sock.fileno())
+        env["STEP_CONVERTER_DIR"] = SERVICE_DIR
+        try:
+            self.process = await asyncio.create_subprocess_exec(
+                'freecadcmd', WORKER_SCRIPT,
+                pass_fds=(child_sock.fileno(),),
+                env=env,
+                cwd=SERVICE_DIR,
+                stdin=asyncio.subprocess.DEVNULL,
+                # Lets stop() kill OpenSCAD processes started by importCSG too
+                start_new_session=True
+            )
+        except BaseException:
+            parent_sock.close()
+            raise
+        finally:
+            child_sock.close()
+
+        self._reader, self._writer = await asyncio.open_unix_connection(
+            sock=parent_sock,
+            limit=MAX_MESSAGE_BYTES
+        )
+        try:
+            hello = await asyncio.wait_for(self._receive(), WORKER_STARTUP_TIMEOUT_SECONDS)
+        except (asyncio.TimeoutError, WorkerError):
+            await self.stop()
+            raise WorkerError("FreeCAD worker failed to start")
+        if not hello.get("ready"):
+            await self.stop()
+            raise WorkerError(f"FreeCAD worker failed to start: {hello.get('error', '')}")
+
+    async def run(
+        self,
+        request: dict,
+        timeout: float,
+        on_phase: Optional[PhaseCallback] = None
+    ) -> dict:
+        """
+        Send one job and wait for its response; kills the worker on timeout.
+
+        Phase messages sent while the job runs are passed to on_phase.
+        """
+        self._writer.write(json.dumps(request).encode('utf-8') + b'\n')
+        await self._writer.drain()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            try:
+                message = await asyncio.wait_for(self._receive(), deadline - loop.time())
+            except asyncio.TimeoutError:
+                await self.stop()
+                raise
+            if "phase" not in message:
+                break
+            if on_phase:
+                on_phase(message["phase"])
+        self.jobs_done += 1
+        return message
+
+    async def _receive(self) -> dict:
+        line = await self._reader.readline()
+        if not line:
+            raise WorkerError("FreeCAD worker exited unexpectedly")
+        return json.loads(line)
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.returncode is None
+
+    def rss_bytes(self) -> int:
+        return process_rss_bytes(self.process.pid) if self.alive else 0
+
+    async def stop(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self.alive:
+            kill_process_tree(self.process)
+        if self.process is not None:
+            await self.process.wait()
+
+
+class FreeCADPool:
+    """
+    Fixed-size pool of warm FreeCAD workers.
+
+    Each worker closes its document after every job and is replaced once it
+    has served max_jobs_per_worker jobs or its RSS exceeds max_rss_bytes.
+    """
+
+    def __init__(self, size: int, max_jobs_per_worker: int, max_rss_bytes: int):
+        self.size = size
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.max_rss_bytes = max_rss_bytes
+        self.recycled = 0
+        self.busy = 0
+        # A None entry means the pool has no workers left and wakes every waiter
+        self._idle: "asyncio.Queue[Optional[FreeCADWorker]]" = asyncio.Queue()
+        self._workers: List[FreeCADWorker] = []
+        # Replacements for recycled workers, started in the background
+        self._replacing: Set[asyncio.Task] = set()
+
+    async def start(self):
+        """Start all workers; raises if freecadcmd cannot be launched."""
+        for _ in range(self.size):
+            worker = await self._spawn()
+            self._idle.put_nowait(worker)
+
+    async def close(self):
+        for task in list(self._replacing):
+            task.cancel()
+        await asyncio.gather(*self._replacing, return_exceptions=True)
+        for worker in list(self._workers):
+            await worker.stop()
+        self._workers.clear()
+
+    async def run(
+        self,
+        request: dict,
+        timeout: float = FREECAD_TIMEOUT_SECONDS,
+        on_process: Optional[ProcessCallback] = None,
+        on_phase: Optional[PhaseCallback] = None
+    ) -> dict:
+        """
+        Run one job on the next idle worker.
+
+        Cancelling the caller kills the worker mid-job and returns at once.
+        A worker that is killed or worn out is replaced in the background,
+        so the job's result never waits for a new worker to start.
+        """
+        worker = await self._acquire()
+        # Replace workers that died while idle instead of failing the job
+        while not worker.alive:
+            await self._release(worker)
+            worker = await self._acquire()
+        if on_process:
+            on_process(worker.process.pid)
+        self.busy += 1
+        try:
+            return await worker.run(request, timeout, on_phase)
+        except (ConnectionError, WorkerError):
+            await worker.stop()
+            raise WorkerError("FreeCAD worker crashed during conversion")
+        except asyncio.CancelledError:
+            await worker.stop()
+            raise
+        finally:
+            self.busy -= 1
+            if self._reusable(worker):
+                self._idle.put_nowait(worker)
+            else:
+                task = asyncio.create_task(self._release(worker))
+                self._replacing.add(task)
+                task.add_done_callback(self._replacing.discard)
+
+    async def _acquire(self) -> FreeCADWorker:
+        worker = await self._idle.get()
+        if worker is None:
+            self._idle.put_nowait(None)
+            raise WorkerError("No FreeCAD workers available")
+        return worker
+
+    async def _spawn(self) -> FreeCADWorker:
+        worker = FreeCADWorker()
+        try:
+            await worker.start()
+        except asyncio.CancelledError:
+            await worker.stop()
+            raise
+        self._workers.append(worker)
+        return worker
+
+    def _reusable(self, worker: FreeCADWorker) -> bool:
+        """Whether a worker is alive and not yet due for recycling."""
+        return (
+            worker.alive
+            and worker.jobs_done < self.max_jobs_per_worker
+            and worker.rss_bytes() < self.max_rss_bytes
+        )
+
+    async def _release(self, worker: FreeCADWorker):
+        """Return a worker to the pool, recycling it if it is dead or worn out."""
+        if self._reusable(worker):
+            self._idle.put_nowait(worker)
+            return
+
+        await worker.stop()
+        self.recycled += 1
+        try:
+            replacement = await self._spawn()
+        except (OSError, WorkerError) as e:
+            print(f"Warning: Failed to replace FreeCAD worker: {e}")
+            replacement = None
+        self._workers.remove(worker)
+        if replacement is not None:
+            self._idle.put_nowait(replacement)
+        elif not self._workers:
+            self._idle.put_nowait(None)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._workers),
+            "busy": self.busy,
+            "recycled": self.recycled,
+        }
+
+
+async def convert_scad_pooled(
+    pool: FreeCADPool,
+    scad_code: str,
+    formats: Sequence[str] = (STEP,),
+    mesh_deflection: float = DEFAULT_MESH_DEFLECTION,
+    refine_policy: str = REFINE_ALWAYS,
+    pipeline: Optional[str] = None,
+    on_process: Optional[ProcessCallback] = None,
+    on_phase: Optional[PhaseCallback] = None,
+    on_timing: Optional[TimingCallback] = None,
+    on_refine: Optional[RefineCallback] = None,
+    solid_workers: int = 1,
+    on_profile: Optional[ProfileCallback] = None,
+    files: Optional[Dict[str, str]] = None
+) -> Tuple[Dict[str, bytes], Optional[str]]:
+    """
+    Pooled equivalent of converter.convert_scad_async.
+
+    The FreeCAD stage is handed to a warm worker, which also reports the
+    refine and export phases.
+    """
+    async def run_freecad(
+        workspace: ConversionWorkspace,
+        refine_policy: str,
+        on_process: Optional[ProcessCallback],
+        on_phase: Optional[PhaseCallback]
+    ) -> Tuple[bool, str, str]:
+        response = await pool.run({
+            "import_path": workspace.import_path,
+            "output_paths": workspace.output_paths,
+            "refine": refine_policy,
+            "mesh_deflection": workspace.mesh_deflection,
+            "subtree_cache_dir": SUBTREE_CACHE_DIR,
+            "workers": workspace.solid_workers,
+            "profile_dir": workspace.profile_dir,
+        }, on_process=on_process, on_phase=on_phase)
+        return response["ok"], response.get("stdout", ""), response.get("stderr", "")
+
+    return await convert_scad_async(
+        scad_code,
+        formats,
+        mesh_deflection,
+        refine_policy,
+        pipeline,
+        on_process=on_process,
+        on_phase=on_phase,
+        on_timing=on_timing,
+        run_freecad=run_freecad,
+        on_refine=on_refine,
+        solid_workers=solid_workers,
+        on_profile=on_profile,
+        files=files
+    )
@@ -0,0 +1,63 @@
+"""
+Long-lived FreeCAD worker, started by freecad_pool.py as `freecadcmd freecad_worker.py`.
+Loads FreeCAD once, then serves conversion jobs as newline-delimited JSON over
+the socket passed in FREECAD_WORKER_FD until the parent closes it. While a
+job runs, {"phase": ...} progress messages precede its final response.
+"""
+import os
+import sys
+import json
+import socket
+import traceback
+from contextlib import redirect_stderr, redirect_stdout
+
+sys.path.insert(0, os.environ.get("STEP_CONVERTER_DIR", "/app"))
+
+import freecad_job  # noqa: E402
+from output_buffer import OutputBuffer  # noqa: E402
+
+
+# Output captured per job is kept to this many trailing characters
+MAX_OUTPUT_CHARS = 64 * 1024
+
+
+def serve(sock: socket.socket):
+    reader = sock.makefile('rb')
+
+    def send(message: dict):
+        sock.sendall(json.dumps(message).encode('utf-8') + b'\n')
+
+    try:
+        freecad_job.setup_freecad()
+    except Exception:
+        send({"ready": False, "error": traceback.format_exc()[-MAX_OUTPUT_CHARS:]})
+        return
+    send({"ready": True, "pid": os.getpid()})
+
+    for line in reader:
+        request = json.loads(line)
+        stdout = OutputBuffer(MAX_OUTPUT_CHARS)
+        stderr = OutputBuffer(MAX_OUTPUT_CHARS)
+        with redirect_stdout(stdout), redirect_stderr(stderr):
+            try:
+                ok = freecad_job.run_job(
+                    request["import_path"],
+                    request["output_paths"],
+                    request["refine"],
+                    on_phase=lambda phase: send({"phase": phase}),
+                    mesh_deflection=request["mesh_deflection"],
+                    subtree_cache_dir=request["subtree_cache_dir"],
+                    workers=request["workers"],
+                    profile_dir=request["profile_dir"]
+                )
+            except Exception:
+                traceback.print_exc()
+                ok = False
+        send({
+            "ok": ok,
+            "stdout": stdout.getvalue(),
+            "stderr": stderr.getvalue(),
+        })
+
+
+serve(socket.socket(fileno=int(os.environ["FREECAD_WORKER_FD"])))
@@ -0,0 +1,133 @@
+"""
+Index of the jobs held by this process.
+Keeps per-status job sets, a min-heap of expiry deadlines and the total
+size of stored results current as jobs change, so health checks, expiry
+and result eviction never have to scan every job.
+"""
+import heapq
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Protocol, Set, Tuple
+
+
+class RegisteredJob(Protocol):
+    id: str
+    status: str
+    stored_sizes: Dict[str, int]
+    result_owners: Dict[str, str]  # Format -> job whose stored result this one shares
+
+
+# A stored result: (id of the job that stored it, format)
+ResultKey = Tuple[str, str]
+
+
+class JobRegistry:
+    """
+    Jobs by id, indexed by status, expiry deadline and result size.
+
+    Call update() after changing a job's status or stored results. A job
+    expires ttl_seconds after it was added; once the stored results of all
+    jobs exceed max_result_bytes (0 for no limit), evict() hands out the
+    jobs whose results were stored first. A result shared by several jobs
+    (see result_owners) counts once, until the last of them is removed.
+    """
+
+    def __init__(self, ttl_seconds: float, max_result_bytes: int = 0):
+        self.ttl_seconds = ttl_seconds
+        self.max_result_bytes = max_result_bytes
+        self.result_bytes = 0
+
+        self._jobs: Dict[str, RegisteredJob] = {}
+        self._by_status: Dict[str, Set[str]] = {}
+        # Status and stored results each job is currently counted under
+        self._indexed: Dict[str, Tuple[str, Dict[ResultKey, int]]] = {}
+        # [jobs referencing it, size] per stored result
+        self._result_refs: Dict[ResultKey, List[int]] = {}
+        # (monotonic deadline, job id); entries of removed jobs are skipped when popped
+        self._deadlines: List[Tuple[float, str]] = []
+        # Jobs holding stored results, in the order they were stored
+        self._results: "OrderedDict[str, None]" = OrderedDict()
+
+    def __contains__(self, job_id: str) -> bool:
+        return job_id in self._jobs
+
+    def __getitem__(self, job_id: str) -> RegisteredJob:
+        return self._jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[RegisteredJob]:
+        return self._jobs.get(job_id)
+
+    def add(self, job: RegisteredJob):
+        self._jobs[job.id] = job
+        heapq.heappush(self._deadlines, (time.monotonic() + self.ttl_seconds, job.id))
+        self.update(job)
+
+    def update(self, job: RegisteredJob):
+        """Re-index a job after its status or stored results changed; unknown jobs are ignored."""
+        if job.id not in self._jobs:
+            return
+        status, results = self._indexed.get(job.id, (None, {}))
+        new_results = {
+            (job.result_owners.get(fmt, job.id), fmt): size
+            for fmt, size in job.stored_sizes.items()
+        }
+        if status != job.status:
+            if status is not None:
+                self._by_status[status].discard(job.id)
+            self._by_status.setdefault(job.status, set()).add(job.id)
+        self._release(results)
+        self._retain(new_results)
+        if new_results and job.id not in self._results:
+            self._results[job.id] = None
+        self._indexed[job.id] = (job.status, new_results)
+
+    def _retain(self, results: Dict[ResultKey, int]):
+        for key, size in results.items():
+            ref = self._result_refs.setdefault(key, [0, size])
+            if ref[0] == 0:
+                self.result_bytes += size
+            ref[0] += 1
+
+    def _release(self, results: Dict[ResultKey, int]):
+        for key in results:
+            ref = self._result_refs[key]
+            ref[0] -= 1
+            if ref[0] == 0:
+                self.result_bytes -= ref[1]
+                del self._result_refs[key]
+
+    def remove(self, job_id: str) -> Optional[RegisteredJob]:
+        job = self._jobs.pop(job_id, None)
+        if job is None:
+            return None
+        status, results = self._indexed.pop(job_id)
+        self._by_status[status].discard(job_id)
+        self._release(results)
+        self._results.pop(job_id, None)
+        return job
+
+    def count(self, *statuses: str) -> int:
+        """Number of jobs in any of the given statuses."""
+        return sum(len(self._by_status.get(status, ())) for status in statuses)
+
+    def with_status(self, *statuses: str) -> List[RegisteredJob]:
+        return [self._jobs[job_id] for status in statuses for job_id in self._by_status.get(status, ())]
+
+    def expire(self) -> List[RegisteredJob]:
+        """Remove and return the jobs whose deadline has passed."""
+        now = time.monotonic()
+        expired = []
+        while self._deadlines and self._deadlines[0][0] <= now:
+            _, job_id = heapq.heappop(self._deadlines)
+            job = self.remove(job_id)
+            if job is not None:
+                expired.append(job)
+        return expired
+
+    def evict(self) -> List[RegisteredJob]:
+        """Remove and return the oldest jobs with results while results exceed the budget."""
+        evicted = []
+        while self.max_result_bytes and self.result_bytes > self.max_result_bytes and self._results:
+            job_id = next(iter(self._results))
+            evicted.append(self.remove(job_id))
+        return evicted
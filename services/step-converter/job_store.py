@@ -0,0 +1,374 @@
+"""
+Shared storage for job and batch metadata.
+Lets several uvicorn workers or replicas answer /status, /download and
+/batch for jobs another process accepted. Records are JSON-serializable
+dicts; result bytes stay in result_store and are referenced by job id.
+"""
+import os
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Iterable, Iterator, List, Optional
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+PENDING = "pending"
+PROCESSING = "processing"
+# Statuses a job can still move out of
+UNFINISHED_STATUSES = (PENDING, PROCESSING)
+SQLITE_BUSY_TIMEOUT_SECONDS = 10
+# Ids per SELECT of get_many(), well below SQLite's host parameter limit
+SQLITE_MAX_QUERY_IDS = 500
+REDIS_KEY_PREFIX = "step-converter:"
+
+
+class JobStore:
+    """
+    Interface for job and batch records shared between service processes.
+
+    Every record has "id", "status" (jobs only) and "created_at" (an ISO
+    timestamp). Status changes go through transition(), which is atomic
+    across processes, so a cancellation and a completion racing each
+    other never both win.
+    """
+
+    # Whether other processes see this store's records
+    shared = False
+
+    def create(self, record: dict):
+        """Store a new job record."""
+        raise NotImplementedError
+
+    def get(self, job_id: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    def get_many(self, job_ids: List[str]) -> List[Optional[dict]]:
+        """The records of several jobs at once, None for those that are gone."""
+        return [self.get(job_id) for job_id in job_ids]
+
+    def delete(self, job_id: str):
+        raise NotImplementedError
+
+    def transition(self, job_id: str, changes: dict, expected: Iterable[str]) -> Optional[dict]:
+        """
+        Apply changes to a job whose status is one of expected, atomically.
+
+        Returns the updated record, or None if the job is gone or has moved
+        to another status.
+        """
+        raise NotImplementedError
+
+    def claim(self, job_id: str) -> bool:
+        """Move a pending job to processing; False if it was cancelled or is gone."""
+        return self.transition(job_id, {"status": PROCESSING}, (PENDING,)) is not None
+
+    def update(self, job_id: str, changes: dict) -> bool:
+        """Record progress of an unfinished job; False once it has finished."""
+        return self.transition(job_id, changes, UNFINISHED_STATUSES) is not None
+
+    def complete(self, job_id: str, changes: dict) -> bool:
+        """Record the final status of an unfinished job; False if it already finished."""
+        return self.transition(job_id, changes, UNFINISHED_STATUSES) is not None
+
+    def put_batch(self, record: dict):
+        raise NotImplementedError
+
+    def get_batch(self, batch_id: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    def delete_expired(self, before: str) -> List[dict]:
+        """
+        Remove jobs and batches created before the ISO timestamp before.
+
+        Returns the removed job records; with several processes cleaning up,
+        each record is returned to exactly one of them.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class MemoryJobStore(JobStore):
+    """
+    Keeps records in process memory, visible to this process only.
+
+    Records are held in creation order, so expiry only visits the records
+    it removes.
+    """
+
+    def __init__(self):
+        self._jobs: "OrderedDict[str, dict]" = OrderedDict()
+        self._batches: "OrderedDict[str, dict]" = OrderedDict()
+
+    def create(self, record: dict):
+        self._jobs[record["id"]] = dict(record)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        record = self._jobs.get(job_id)
+        return dict(record) if record is not None else None
+
+    def delete(self, job_id: str):
+        self._jobs.pop(job_id, None)
+
+    def transition(self, job_id: str, changes: dict, expected: Iterable[str]) -> Optional[dict]:
+        record = self._jobs.get(job_id)
+        if record is None or record["status"] not in expected:
+            return None
+        record = {**record, **changes}
+        self._jobs[job_id] = record
+        return dict(record)
+
+    def put_batch(self, record: dict):
+        self._batches[record["id"]] = dict(record)
+
+    def get_batch(self, batch_id: str) -> Optional[dict]:
+        record = self._batches.get(batch_id)
+        return dict(record) if record is not None else None
+
+    def delete_expired(self, before: str) -> List[dict]:
+        expired = []
+        while self._jobs and next(iter(self._jobs.values()))["created_at"] < before:
+            expired.append(self._jobs.popitem(last=False)[1])
+        while self._batches and next(iter(self._batches.values()))["created_at"] < before:
+            self._batches.popitem(last=False)
+        return expired
+
+
+class SqliteJobStore(JobStore):
+    """
+    SQLite database in WAL mode, shared by the service processes of one host.
+
+    WAL lets status reads proceed while another process commits. Status
+    transitions read and write in one BEGIN IMMEDIATE transaction, which
+    serializes them across processes.
+    """
+
+    shared = True
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Connection use is serialized by the lock; executor threads may share it
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            path,
+            timeout=SQLITE_BUSY_TIMEOUT_SECONDS,
+            isolation_level=None,
+            check_same_thread=False
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # In WAL mode this only syncs at checkpoints; the data is not worth more
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_created_at ON jobs (created_at);
+            CREATE TABLE IF NOT EXISTS batches (
+                id TEXT PRIMARY KEY,
+                created_at TEXT NOT NULL,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS batches_created_at ON batches (created_at);
+        """)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._db
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def _query(self, sql: str, params: tuple = ()) -> list:
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def create(self, record: dict):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO jobs (id, status, created_at, data) VALUES (?, ?, ?, ?)",
+                (record["id"], record["status"], record["created_at"], json.dumps(record))
+            )
+
+    def get(self, job_id: str) -> Optional[dict]:
+        rows = self._query("SELECT data FROM jobs WHERE id = ?", (job_id,))
+        return json.loads(rows[0][0]) if rows else None
+
+    def get_many(self, job_ids: List[str]) -> List[Optional[dict]]:
+        records = {}
+        for start in range(0, len(job_ids), SQLITE_MAX_QUERY_IDS):
+            chunk = tuple(job_ids[start:start + SQLITE_MAX_QUERY_IDS])
+            placeholders = ", ".join("?" * len(chunk))
+            rows = self._query(f"SELECT id, data FROM jobs WHERE id IN ({placeholders})", chunk)
+            records.update((job_id, json.loads(data)) for job_id, data in rows)
+        return [records.get(job_id) for job_id in job_ids]
+
+    def delete(self, job_id: str):
+        with self._lock:
+            self._db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def transition(self, job_id: str, changes: dict, expected: Iterable[str]) -> Optional[dict]:
+        with self._transaction() as db:
+            row = db.execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            record = json.loads(row[0])
+            if record["status"] not in expected:
+                return None
+            record.update(changes)
+            db.execute(
+                "UPDATE jobs SET status = ?, data = ? WHERE id = ?",
+                (record["status"], json.dumps(record), job_id)
+            )
+            return record
+
+    def put_batch(self, record: dict):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO batches (id, created_at, data) VALUES (?, ?, ?)",
+                (record["id"], record["created_at"], json.dumps(record))
+            )
+
+    def get_batch(self, batch_id: str) -> Optional[dict]:
+        rows = self._query("SELECT data FROM batches WHERE id = ?", (batch_id,))
+        return json.loads(rows[0][0]) if rows else None
+
+    def delete_expired(self, before: str) -> List[dict]:
+        with self._transaction() as db:
+            rows = db.execute("SELECT data FROM jobs WHERE created_at < ?", (before,)).fetchall()
+            db.execute("DELETE FROM jobs WHERE created_at < ?", (before,))
+            db.execute("DELETE FROM batches WHERE created_at < ?", (before,))
+        return [json.loads(data) for (data,) in rows]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def _timestamp(iso: str) -> float:
+    """Seconds since the epoch of a naive UTC ISO timestamp."""
+    return datetime.fromisoformat(iso).replace(tzinfo=timezone.utc).timestamp()
+
+
+class RedisJobStore(JobStore):
+    """
+    Records in Redis, or any server speaking its protocol, shared across hosts.
+
+    Each record is a JSON string; sorted sets index jobs and batches by
+    creation time for expiry. Transitions WATCH the job key and are retried
+    when another client changes it before the MULTI/EXEC commits.
+    """
+
+    shared = True
+
+    def __init__(self, url: str, prefix: str = REDIS_KEY_PREFIX):
+        if redis is None:
+            raise RuntimeError("JOB_STORE=redis requires the redis module")
+        self._client = redis.Redis.from_url(url, decode_responses=True)
+        self._prefix = prefix
+        self._jobs_index = f"{prefix}jobs"
+        self._batches_index = f"{prefix}batches"
+
+    def _job_key(self, job_id: str) -> str:
+        return f"{self._prefix}job:{job_id}"
+
+    def _batch_key(self, batch_id: str) -> str:
+        return f"{self._prefix}batch:{batch_id}"
+
+    def create(self, record: dict):
+        pipe = self._client.pipeline()
+        pipe.set(self._job_key(record["id"]), json.dumps(record))
+        pipe.zadd(self._jobs_index, {record["id"]: _timestamp(record["created_at"])})
+        pipe.execute()
+
+    def get(self, job_id: str) -> Optional[dict]:
+        data = self._client.get(self._job_key(job_id))
+        return json.loads(data) if data is not None else None
+
+    def get_many(self, job_ids: List[str]) -> List[Optional[dict]]:
+        if not job_ids:
+            return []
+        values = self._client.mget([self._job_key(job_id) for job_id in job_ids])
+        return [json.loads(data) if data is not None else None for data in values]
+
+    def delete(self, job_id: str):
+        pipe = self._client.pipeline()
+        pipe.delete(self._job_key(job_id))
+        pipe.zrem(self._jobs_index, job_id)
+        pipe.execute()
+
+    def transition(self, job_id: str, changes: dict, expected: Iterable[str]) -> Optional[dict]:
+        key = self._job_key(job_id)
+        expected = tuple(expected)
+
+        def apply(pipe) -> Optional[dict]:
+            data = pipe.get(key)
+            if data is None:
+                return None
+            record = json.loads(data)
+            if record["status"] not in expected:
+                return None
+            record.update(changes)
+            pipe.multi()
+            pipe.set(key, json.dumps(record))
+            return record
+
+        return self._client.transaction(apply, key, value_from_callable=True)
+
+    def put_batch(self, record: dict):
+        pipe = self._client.pipeline()
+        pipe.set(self._batch_key(record["id"]), json.dumps(record))
+        pipe.zadd(self._batches_index, {record["id"]: _timestamp(record["created_at"])})
+        pipe.execute()
+
+    def get_batch(self, batch_id: str) -> Optional[dict]:
+        data = self._client.get(self._batch_key(batch_id))
+        return json.loads(data) if data is not None else None
+
+    def delete_expired(self, before: str) -> List[dict]:
+        cutoff = f"({_timestamp(before)}"
+        expired = []
+        for job_id in self._client.zrangebyscore(self._jobs_index, "-inf", cutoff):
+            # Whoever removes the index entry owns the record's cleanup
+            if not self._client.zrem(self._jobs_index, job_id):
+                continue
+            pipe = self._client.pipeline()
+            pipe.get(self._job_key(job_id))
+            pipe.delete(self._job_key(job_id))
+            data, _ = pipe.execute()
+            if data is not None:
+                expired.append(json.loads(data))
+        for batch_id in self._client.zrangebyscore(self._batches_index, "-inf", cutoff):
+            if self._client.zrem(self._batches_index, batch_id):
+                self._client.delete(self._batch_key(batch_id))
+        return expired
+
+    def close(self):
+        self._client.close()
+
+
+def create_job_store(backend: str, path: str = "", url: str = "") -> JobStore:
+    """Build the configured job store backend ("memory", "sqlite" or "redis")."""
+    if backend == "memory":
+        return MemoryJobStore()
+    if backend == "sqlite":
+        return SqliteJobStore(path)
+    if backend == "redis":
+        return RedisJobStore(url)
+    raise ValueError(f"Unknown job store backend: {backend}")
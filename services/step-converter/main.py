@@ -3,20 +3,72 @@ FastAPI HTTP server for OpenSCAD to STEP conversion service.
 Provides async job submission with polling for results.
 """
 import os
+import json
+import time
+import hashlib
 import uuid
 import asyncio
+import functools
+import math
 from datetime import datetime, timedelta
-from typing import Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Coroutine, Dict, List, Optional, Set, Tuple
 from enum import Enum
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, HTTPException, Header, BackgroundTasks
-from fastapi.responses import Response
+from fastapi import FastAPI, HTTPException, Header, Query, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 
-from converter import convert_scad_to_step, validate_scad_code
+from archive import ArchiveEntry, iter_zip, unique_name
+from blob_store import BlobStore, is_digest
+from compression import GZIP, IDENTITY, iter_decompress, iter_recode, negotiate, resolve_encoding
+from converter import (
+    SUBTREE_CACHE_DIR,
+    classify_error,
+    convert_scad_async,
+    normalize_formats,
+    validate_project_path,
+    validate_scad_code,
+    workspace_pool,
+)
+from freecad_job import (
+    AUTO_REFINE_FACES,
+    AUTO_REFINE_MAX_FACES,
+    BREP,
+    DEFAULT_MESH_DEFLECTION,
+    GLB,
+    MESH_FORMATS,
+    REFINE_ALWAYS,
+    REFINE_AUTO,
+    REFINE_POLICIES,
+    STEP,
+    STL,
+    THREE_MF,
+)
+from complexity import FAST_LANE, HEAVY_LANE, estimate_complexity
+from freecad_pool import FreeCADPool, convert_scad_pooled
+from job_registry import JobRegistry
+from job_store import create_job_store
+from metrics import (
+    CONTENT_TYPE as METRICS_CONTENT_TYPE,
+    CONVERSIONS,
+    INPUT_BYTES,
+    OUTPUT_BYTES,
+    PHASE_SECONDS,
+    QUEUE_WAIT_SECONDS,
+    REGISTRY,
+    ValueFunction,
+)
+from result_cache import ResultCache, make_cache_key
+from quality import EXACT, QUALITY_LEVELS, apply_quality
+from resources import cpu_limit
+from result_store import create_result_store
+from scheduler import ANONYMOUS_CLIENT, JobScheduler, JobUsage, QueueFullError, default_concurrency
+from subtree_cache import prune_cache
 
 
 # Configuration
@@ -24,7 +76,64 @@ API_SECRET = os.environ.get("STEP_CONVERTER_API_SECRET", "")
 JOB_TTL_SECONDS = int(os.environ.get("JOB_TTL_SECONDS", "300"))  # 5 minutes
 CLEANUP_INTERVAL_SECONDS = 60
 MAX_CODE_SIZE_KB = int(os.environ.get("MAX_CODE_SIZE_KB", "500"))  # 500KB
-MAX_CONCURRENT_JOBS = int(os.environ.get("MAX_CONCURRENT_JOBS", "10"))
+MAX_WAIT_SECONDS = int(os.environ.get("MAX_WAIT_SECONDS", "60"))  # Cap for ?wait= long-polls
+MAX_BATCH_ITEMS = int(os.environ.get("MAX_BATCH_ITEMS", "100"))
+EVENT_KEEPALIVE_SECONDS = 15
+JOB_MEMORY_ESTIMATE_MB = int(os.environ.get("JOB_MEMORY_ESTIMATE_MB", "600"))  # Initial per-job estimate
+# Unset derives the limit from the container's CPUs and memory
+MAX_CONCURRENT_JOBS = int(
+    os.environ.get("MAX_CONCURRENT_JOBS")
+    or default_concurrency(JOB_MEMORY_ESTIMATE_MB * 1024 * 1024)
+)
+MAX_QUEUED_JOBS = int(os.environ.get("MAX_QUEUED_JOBS", "50"))
+# Jobs whose estimated complexity reaches this score run in the heavy lane,
+# which has its own concurrency limit; MAX_CONCURRENT_JOBS is the fast lane's
+HEAVY_COMPLEXITY_SCORE = float(os.environ.get("HEAVY_COMPLEXITY_SCORE", "200"))
+HEAVY_CONCURRENT_JOBS = int(os.environ.get("HEAVY_CONCURRENT_JOBS", "1"))
+# Jobs one client may run at once across both lanes (0 = no limit)
+MAX_CLIENT_JOBS = int(os.environ.get("MAX_CLIENT_JOBS", "0"))
+MAX_CLIENT_ID_LENGTH = 128
+JOB_STORE = os.environ.get("JOB_STORE", "memory")  # "memory", "sqlite" or "redis"
+JOB_STORE_PATH = os.environ.get("JOB_STORE_PATH", "/tmp/conversions/jobs.db")
+JOB_STORE_URL = os.environ.get("JOB_STORE_URL", "redis://localhost:6379/0")
+# How often waits on jobs run by other processes re-read the job store
+JOB_POLL_SECONDS = 0.5
+RESULT_STORE = os.environ.get("RESULT_STORE", "spool")  # "spool" or "memory"
+RESULT_SPOOL_DIR = os.environ.get("RESULT_SPOOL_DIR", "/tmp/conversions/results")
+# Oldest completed jobs are dropped once their stored results exceed this (0 = no limit)
+RESULT_STORE_MAX_MB = int(os.environ.get("RESULT_STORE_MAX_MB", "1024"))
+# "auto" (zstd if installed, else gzip), "zstd", "gzip" or "none"
+RESULT_COMPRESSION = resolve_encoding(os.environ.get("RESULT_COMPRESSION", "auto"))
+RESULT_CACHE_MEMORY_MB = int(os.environ.get("RESULT_CACHE_MEMORY_MB", "128"))
+RESULT_CACHE_DIR = os.environ.get("RESULT_CACHE_DIR", "")  # empty disables the disk tier
+RESULT_CACHE_DISK_MB = int(os.environ.get("RESULT_CACHE_DISK_MB", "1024"))
+SUBTREE_CACHE_MB = int(os.environ.get("SUBTREE_CACHE_MB", "1024"))
+FREECAD_POOL_SIZE = int(os.environ.get("FREECAD_POOL_SIZE", "2"))  # 0 spawns freecadcmd per job
+FREECAD_WORKER_MAX_JOBS = int(os.environ.get("FREECAD_WORKER_MAX_JOBS", "50"))
+FREECAD_WORKER_MAX_RSS_MB = int(os.environ.get("FREECAD_WORKER_MAX_RSS_MB", "768"))
+# Default tessellation tolerance in mm for STL/3MF/glTF outputs
+MESH_DEFLECTION = float(os.environ.get("MESH_DEFLECTION", str(DEFAULT_MESH_DEFLECTION)))
+# Default refine policy: "always", "never" or "auto" (decided by face count)
+REFINE_POLICY = os.environ.get("REFINE_POLICY", "auto")
+# Processes FreeCAD validates and refines independent solids in, by default
+# and at most per conversion; the cap defaults to the container's CPU limit
+SOLID_WORKERS = int(os.environ.get("SOLID_WORKERS", "1"))
+MAX_SOLID_WORKERS = int(os.environ.get("MAX_SOLID_WORKERS", "0")) or max(1, math.floor(cpu_limit()))
+# Default quality: "draft" and "normal" clamp $fn/$fa/$fs, "exact" leaves them
+QUALITY = os.environ.get("QUALITY", EXACT)
+# Content-addressed files of multi-file projects, pruned to BLOB_STORE_MB
+BLOB_STORE_DIR = os.environ.get("BLOB_STORE_DIR", "/tmp/conversions/blobs")
+BLOB_STORE_MB = int(os.environ.get("BLOB_STORE_MB", "1024"))
+MAX_BLOB_SIZE_KB = int(os.environ.get("MAX_BLOB_SIZE_KB", "10240"))  # 10MB
+MAX_PROJECT_FILES = int(os.environ.get("MAX_PROJECT_FILES", "200"))
+
+FORMAT_MEDIA_TYPES = {
+    STEP: "application/step",
+    BREP: "application/octet-stream",
+    STL: "model/stl",
+    THREE_MF: "model/3mf",
+    GLB: "model/gltf-binary",
+}
 
 
 class JobStatus(str, Enum):
@@ -32,6 +141,16 @@ class JobStatus(str, Enum):
     PROCESSING = "processing"
     COMPLETED = "completed"
     FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+# Statuses a job never leaves
+FINISHED_STATUSES = (JobStatus.COMPLETED, JobStatus.FAILED, JobStatus.CANCELLED)
+# Phase of a job waiting for a slot; the conversion phases come from converter.py
+PHASE_QUEUED = "queued"
+# result_store formats a profiled job's profile is kept under, next to its results
+PROFILE_FORMAT = "profile.json"
+PSTATS_FORMAT = "pstats"
 
 
 @dataclass
@@ -40,20 +159,154 @@ class ConversionJob:
     status: JobStatus
     created_at: datetime
     completed_at: Optional[datetime] = None
-    result: Optional[bytes] = None
+    formats: List[str] = field(default_factory=lambda: [STEP])
+    result_sizes: Dict[str, int] = field(default_factory=dict)  # Result bytes live in result_store
+    stored_sizes: Dict[str, int] = field(default_factory=dict)  # Compressed sizes in result_store
+    result_owners: Dict[str, str] = field(default_factory=dict)  # Format -> job whose stored result is linked
     error: Optional[str] = None
     filename: str = "model"
+    cache_key: Optional[str] = None
+    leader_id: Optional[str] = None  # Set when attached to an identical in-flight job
+    peak_rss_bytes: Optional[int] = None
+    phase: Optional[str] = None
+    refine: Optional[dict] = None  # Refine decision and face counts reported by FreeCAD
+    quality: str = EXACT
+    complexity: Optional[dict] = None  # Static cost estimate, see ComplexityReport
+    lane: str = FAST_LANE
+    profile: bool = False  # Whether a profile is recorded, see GET /profile/{job_id}
+    done: asyncio.Event = field(default_factory=asyncio.Event)  # Set once the job has finished
+    changed: asyncio.Event = field(default_factory=asyncio.Event)  # Replaced after every update
+    task: Optional[asyncio.Task] = None  # Converts or waits for this job's result
+
+
+@dataclass
+class ConversionSpec:
+    """Outputs of a conversion and the cache keys derived from them."""
+    formats: List[str]  # STEP first
+    mesh_deflection: float
+    refine_policy: str
+    solid_workers: int
+    quality: str
+    complexity: dict
+    lane: str
+    profile: bool
+    files: Dict[str, str]  # Project path -> blob digest
+    cache_key: str  # Identifies the whole conversion; identical jobs coalesce on it
+    artifact_keys: Dict[str, str]  # Result cache key per format
+
+
+@dataclass
+class InflightConversion:
+    leader_id: str
+    future: "asyncio.Future[Tuple[Dict[str, bytes], Optional[str]]]"  # Resolves to (artifacts, error)
+    followers: List[str] = field(default_factory=list)  # Jobs attached to this conversion
+
+
+@dataclass
+class BatchItem:
+    filename: str
+    job_id: str  # Items with identical code share a job
 
 
-# In-memory job storage
-jobs: Dict[str, ConversionJob] = {}
-job_semaphore = asyncio.Semaphore(MAX_CONCURRENT_JOBS)
+@dataclass
+class ConversionBatch:
+    id: str
+    created_at: datetime
+    items: List[BatchItem]
+
+
+# Jobs this process runs or waits on; job_store holds the shared state of every job
+jobs = JobRegistry(
+    ttl_seconds=JOB_TTL_SECONDS,
+    max_result_bytes=RESULT_STORE_MAX_MB * 1024 * 1024
+)
+# Conversions currently running, keyed by cache key
+inflight: Dict[str, InflightConversion] = {}
+coalesced_jobs = 0
+# Strong references to running job tasks so they are not garbage collected
+job_tasks: Set[asyncio.Task] = set()
+scheduler = JobScheduler(
+    lanes={FAST_LANE: MAX_CONCURRENT_JOBS, HEAVY_LANE: HEAVY_CONCURRENT_JOBS},
+    max_queue=MAX_QUEUED_JOBS,
+    job_memory_bytes=JOB_MEMORY_ESTIMATE_MB * 1024 * 1024,
+    max_client_jobs=MAX_CLIENT_JOBS
+)
+result_cache = ResultCache(
+    max_memory_bytes=RESULT_CACHE_MEMORY_MB * 1024 * 1024,
+    disk_dir=RESULT_CACHE_DIR,
+    max_disk_bytes=RESULT_CACHE_DISK_MB * 1024 * 1024
+)
+job_store = create_job_store(JOB_STORE, JOB_STORE_PATH, JOB_STORE_URL)
+# job_store calls leave the event loop for this thread, which runs them one at
+# a time in the order they were made, so a job's updates never overtake each other
+job_store_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="job-store")
+# A spool shared with other processes must keep the results of their jobs
+result_store = create_result_store(
+    RESULT_STORE, RESULT_SPOOL_DIR, RESULT_COMPRESSION, clear=not job_store.shared
+)
+blob_store = BlobStore(BLOB_STORE_DIR, BLOB_STORE_MB * 1024 * 1024)
+# Warm FreeCAD workers, started in lifespan(); None falls back to a cold process per job
+freecad_pool: Optional[FreeCADPool] = None
+
+REGISTRY.register(ValueFunction(
+    "step_converter_queued_jobs", "Jobs waiting for an execution slot.",
+    lambda: scheduler.queued
+))
+REGISTRY.register(ValueFunction(
+    "step_converter_running_jobs", "Jobs holding an execution slot.",
+    lambda: scheduler.running
+))
+REGISTRY.register(ValueFunction(
+    "step_converter_cache_hits_total", "Submissions served from the result cache.",
+    lambda: result_cache.hits, kind="counter"
+))
+REGISTRY.register(ValueFunction(
+    "step_converter_cache_misses_total", "Submissions not found in the result cache.",
+    lambda: result_cache.misses, kind="counter"
+))
+REGISTRY.register(ValueFunction(
+    "step_converter_coalesced_jobs_total", "Submissions attached to an identical running conversion.",
+    lambda: coalesced_jobs, kind="counter"
+))
+REGISTRY.register(ValueFunction(
+    "step_converter_result_bytes", "Stored size of the results held by this process.",
+    lambda: jobs.result_bytes
+))
+REGISTRY.register(ValueFunction(
+    "step_converter_rejected_jobs_total", "Submissions rejected because the queue was full.",
+    lambda: scheduler.rejected, kind="counter"
+))
 
 
 # Request/Response models
 class ConvertRequest(BaseModel):
     code: str
     filename: Optional[str] = "model"
+    formats: Optional[List[str]] = None  # Extra output formats; STEP is always produced
+    meshDeflection: Optional[float] = None
+    refine: Optional[str] = None  # "always", "never" or "auto"
+    solidWorkers: Optional[int] = None  # Capped by MAX_SOLID_WORKERS
+    quality: Optional[str] = None  # "draft", "normal" or "exact"
+    profile: bool = False  # Record a profile, served by GET /profile/{job_id}
+    files: Optional[Dict[str, str]] = None  # Project path -> SHA-256 of an uploaded blob
+
+
+class BatchConvertRequest(BaseModel):
+    items: List[ConvertRequest]
+
+
+class BlobsRequest(BaseModel):
+    hashes: List[str]
+
+
+class MissingBlobsResponse(BaseModel):
+    missing: List[str]  # Hashes to upload before converting
+
+
+class BlobResponse(BaseModel):
+    hash: str
+    size: int
+    created: bool  # False if the blob was already stored
 
 
 class ConvertResponse(BaseModel):
@@ -61,12 +314,59 @@ class ConvertResponse(BaseModel):
     status: str
 
 
+class RefineReport(BaseModel):
+    policy: str
+    decision: str  # "full", "per_solid" or "skipped"
+    faces: int  # Before refine
+    solids: int
+    refinedFaces: Optional[int] = None
+    workers: int = 1  # Processes the solids were refined in
+
+
+class ComplexityReport(BaseModel):
+    score: float  # Relative cost; a lone cube scores 1
+    minkowski: int
+    hull: int
+    sweeps: int
+    loopIterations: int
+    fragments: float  # Finest circle resolution, capped by the quality level
+
+
 class StatusResponse(BaseModel):
     jobId: str
     status: str
     error: Optional[str] = None
     createdAt: str
     completedAt: Optional[str] = None
+    queuePosition: Optional[int] = None
+    peakMemoryBytes: Optional[int] = None
+    phase: Optional[str] = None
+    formats: List[str] = [STEP]
+    refine: Optional[RefineReport] = None
+    quality: str = EXACT
+    complexity: Optional[ComplexityReport] = None
+    lane: str = FAST_LANE
+    profile: bool = False
+
+
+class BatchItemStatus(BaseModel):
+    filename: str
+    jobId: str
+    status: str
+    error: Optional[str] = None
+
+
+class BatchStatusResponse(BaseModel):
+    batchId: str
+    status: str
+    total: int
+    completed: int
+    failed: int
+    cancelled: int
+    conversions: int  # Distinct models among the items
+    createdAt: str
+    completedAt: Optional[str] = None
+    items: List[BatchItemStatus]
 
 
 class ErrorResponse(BaseModel):
@@ -77,36 +377,126 @@ class ErrorResponse(BaseModel):
 class HealthResponse(BaseModel):
     status: str
     activeJobs: int
+    cacheHits: int
+    cacheMisses: int
+    coalescedJobs: int
+    queuedJobs: int
+    maxConcurrentJobs: int
+    resultBytes: int
+    maxResultBytes: int
+
+
+class ClientQueueStats(BaseModel):
+    client: str
+    queued: int
+    running: int
+    started: int  # Jobs that got a slot since the client was last idle for an hour
+    avgWaitSeconds: float
+    maxWaitSeconds: float
+    oldestQueuedSeconds: float
+
+
+class ClientsResponse(BaseModel):
+    maxClientJobs: int
+    clients: List[ClientQueueStats]
 
 
 async def cleanup_expired_jobs():
-    """Remove expired jobs from memory."""
+    """Remove expired jobs and batches and their results, and prune the subtree cache and blobs."""
     while True:
         await asyncio.sleep(CLEANUP_INTERVAL_SECONDS)
-        now = datetime.utcnow()
-        expired = [
-            job_id for job_id, job in jobs.items()
-            if (now - job.created_at) > timedelta(seconds=JOB_TTL_SECONDS)
-        ]
-        for job_id in expired:
-            del jobs[job_id]
-        if expired:
-            print(f"Cleaned up {len(expired)} expired jobs")
+        cutoff = datetime.utcnow() - timedelta(seconds=JOB_TTL_SECONDS)
+        expired = jobs.expire()
+        for job in expired:
+            await store_call(job_store.delete, job.id)
+            result_store.delete(job.id, set(job.formats) | set(job.stored_sizes))
+        # Batches, and records of jobs this process does not hold, such as
+        # those of an exited process; each goes to one process, which deletes its results
+        orphaned = await store_call(job_store.delete_expired, cutoff.isoformat())
+        for record in orphaned:
+            result_store.delete(record["id"], set(record["formats"]) | set(record["stored_sizes"]))
+        if expired or orphaned:
+            print(f"Cleaned up {len(expired) + len(orphaned)} expired jobs")
+        if SUBTREE_CACHE_DIR:
+            loop = asyncio.get_running_loop()
+            pruned = await loop.run_in_executor(
+                None, prune_cache, SUBTREE_CACHE_DIR, SUBTREE_CACHE_MB * 1024 * 1024
+            )
+            if pruned:
+                print(f"Pruned {pruned} cached subtrees")
+        pruned = await asyncio.get_running_loop().run_in_executor(None, blob_store.prune)
+        if pruned:
+            print(f"Pruned {pruned} project blobs")
+
+
+async def watch_cancellations():
+    """Abort jobs of this process that were cancelled through another process."""
+    while True:
+        await asyncio.sleep(JOB_POLL_SECONDS)
+        unfinished = jobs.with_status(JobStatus.PENDING, JobStatus.PROCESSING)
+        if unfinished:
+            await get_jobs([job.id for job in unfinished])
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Startup and shutdown lifecycle management."""
-    # Start cleanup task
-    cleanup_task = asyncio.create_task(cleanup_expired_jobs())
-    print(f"STEP Converter Service started. Max concurrent jobs: {MAX_CONCURRENT_JOBS}")
-    yield
-    # Cancel cleanup task on shutdown
-    cleanup_task.cancel()
+    global freecad_pool
+    # Start warm FreeCAD workers
+    if FREECAD_POOL_SIZE > 0:
+        pool = FreeCADPool(
+            size=FREECAD_POOL_SIZE,
+            max_jobs_per_worker=FREECAD_WORKER_MAX_JOBS,
+            max_rss_bytes=FREECAD_WORKER_MAX_RSS_MB * 1024 * 1024
+        )
+        try:
+            await pool.start()
+            freecad_pool = pool
+            print(f"Started {FREECAD_POOL_SIZE} FreeCAD workers")
+        except Exception as e:
+            await pool.close()
+            print(f"Warning: FreeCAD worker pool unavailable, using one process per job: {e}")
+
+    # Create the reusable conversion workspaces up front
     try:
-        await cleanup_task
-    except asyncio.CancelledError:
-        pass
+        workspace_pool.prefill()
+        if not workspace_pool.shares_filesystem(BLOB_STORE_DIR):
+            print(
+                "Warning: WORKSPACE_DIR and BLOB_STORE_DIR are on different filesystems; "
+                "project files will be copied into every workspace instead of hard-linked"
+            )
+    except OSError as e:
+        print(f"Warning: Could not create conversion workspaces in {workspace_pool.directory}: {e}")
+
+    if job_store.shared and RESULT_STORE == "memory":
+        print("Warning: RESULT_STORE=memory only serves results from the process that converted them")
+
+    # Start cleanup and resource monitoring tasks
+    tasks = [
+        asyncio.create_task(cleanup_expired_jobs()),
+        asyncio.create_task(scheduler.monitor()),
+    ]
+    if job_store.shared:
+        tasks.append(asyncio.create_task(watch_cancellations()))
+    print(
+        f"STEP Converter Service started. Max concurrent jobs: {MAX_CONCURRENT_JOBS} fast, "
+        f"{HEAVY_CONCURRENT_JOBS} heavy, max queued jobs: {MAX_QUEUED_JOBS}, job store: {JOB_STORE}"
+    )
+    yield
+    # Cancel background tasks on shutdown
+    for task in tasks:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    if freecad_pool is not None:
+        await freecad_pool.close()
+        freecad_pool = None
+    workspace_pool.close()
+    # Let pending status writes finish before the store goes away
+    job_store_executor.shutdown(wait=True)
+    job_store.close()
 
 
 app = FastAPI(
@@ -139,41 +529,834 @@ def verify_auth(authorization: Optional[str]) -> bool:
     return parts[1] == API_SECRET
 
 
-async def process_conversion(job_id: str, scad_code: str):
-    """Background task to process OpenSCAD to STEP conversion."""
-    async with job_semaphore:
+def client_identity(authorization: Optional[str], client_id: Optional[str]) -> str:
+    """
+    Client a submission is queued for: the X-Client-Id header (the user the
+    Supabase edge function forwards), else a hash of the bearer token.
+    """
+    if client_id and client_id.strip():
+        return client_id.strip()[:MAX_CLIENT_ID_LENGTH]
+    if authorization:
+        return "token:" + hashlib.sha256(authorization.encode('utf-8')).hexdigest()[:12]
+    return ANONYMOUS_CLIENT
+
+
+def start_job_task(coro: Coroutine) -> asyncio.Task:
+    """
+    Run a job coroutine in the background.
+
+    Unlike BackgroundTasks this starts before the response is sent, which
+    /convert?wait= relies on, and the returned task can be cancelled.
+    """
+    task = asyncio.create_task(coro)
+    job_tasks.add(task)
+    task.add_done_callback(job_tasks.discard)
+    return task
+
+
+def store_call(method: Callable, *args) -> asyncio.Future:
+    """Call a job_store method on its own thread; await the returned future for the result."""
+    return asyncio.get_running_loop().run_in_executor(job_store_executor, method, *args)
+
+
+def job_record(job: ConversionJob) -> dict:
+    """The shared state of a job, as kept in job_store."""
+    return {
+        "id": job.id,
+        "status": job.status.value,
+        "created_at": job.created_at.isoformat(),
+        "completed_at": job.completed_at.isoformat() if job.completed_at else None,
+        "formats": list(job.formats),
+        "result_sizes": dict(job.result_sizes),
+        "stored_sizes": dict(job.stored_sizes),
+        "error": job.error,
+        "filename": job.filename,
+        "cache_key": job.cache_key,
+        "leader_id": job.leader_id,
+        "peak_rss_bytes": job.peak_rss_bytes,
+        "phase": job.phase,
+        "refine": job.refine,
+        "quality": job.quality,
+        "complexity": job.complexity,
+        "lane": job.lane,
+        "profile": job.profile,
+    }
+
+
+def job_from_record(record: dict) -> ConversionJob:
+    """A read-only snapshot of a job run by another process."""
+    completed_at = record.get("completed_at")
+    return ConversionJob(
+        id=record["id"],
+        status=JobStatus(record["status"]),
+        created_at=datetime.fromisoformat(record["created_at"]),
+        completed_at=datetime.fromisoformat(completed_at) if completed_at else None,
+        formats=record["formats"],
+        result_sizes=record["result_sizes"],
+        stored_sizes=record["stored_sizes"],
+        error=record.get("error"),
+        filename=record["filename"],
+        cache_key=record.get("cache_key"),
+        leader_id=record.get("leader_id"),
+        peak_rss_bytes=record.get("peak_rss_bytes"),
+        phase=record.get("phase"),
+        refine=record.get("refine"),
+        quality=record.get("quality", EXACT),
+        complexity=record.get("complexity"),
+        lane=record.get("lane", FAST_LANE),
+        profile=record.get("profile", False)
+    )
+
+
+async def get_jobs(job_ids: List[str]) -> List[Optional[ConversionJob]]:
+    """
+    Look up jobs, whichever process runs them, with one job_store read.
+
+    Jobs of this process are returned as they are, after picking up a
+    cancellation made through another process; other jobs are loaded from
+    job_store. Jobs that are gone are None.
+    """
+    found: Dict[str, Optional[ConversionJob]] = {}
+    for job_id in job_ids:
         job = jobs.get(job_id)
-        if not job:
-            return
+        if job is not None and (job.status in FINISHED_STATUSES or not job_store.shared):
+            found[job_id] = job
+    unknown = [job_id for job_id in dict.fromkeys(job_ids) if job_id not in found]
+    if unknown:
+        records = await store_call(job_store.get_many, unknown)
+        for job_id, record in zip(unknown, records):
+            job = jobs.get(job_id)
+            if job is None:
+                found[job_id] = job_from_record(record) if record is not None else None
+                continue
+            if (
+                record is not None and record["status"] == JobStatus.CANCELLED.value
+                and job.status not in FINISHED_STATUSES
+            ):
+                abort_job(job)
+            found[job_id] = job
+    return [found[job_id] for job_id in job_ids]
 
-        job.status = JobStatus.PROCESSING
-        print(f"Processing job {job_id}")
 
-        # Run conversion in thread pool (FreeCAD is blocking)
-        loop = asyncio.get_event_loop()
+async def get_job(job_id: str) -> Optional[ConversionJob]:
+    """Look up a job, whichever process runs it; see get_jobs()."""
+    return (await get_jobs([job_id]))[0]
+
+
+def publish_job(job: ConversionJob) -> "asyncio.Future[bool]":
+    """Write a job's state to job_store; the future tells whether the transition applied."""
+    write = job_store.complete if job.status in FINISHED_STATUSES else job_store.update
+    return store_call(write, job.id, job_record(job))
+
+
+async def abort_if_cancelled(job: ConversionJob) -> bool:
+    """
+    Abort a job whose state could not be published because it was cancelled
+    through another process meanwhile; returns whether it was.
+    """
+    record = await store_call(job_store.get, job.id)
+    if record is None or record["status"] != JobStatus.CANCELLED.value:
+        return False
+    if job.status != JobStatus.CANCELLED:
+        abort_job(job)
+    return True
+
+
+def check_published(job: ConversionJob, published: "asyncio.Future[bool]"):
+    """Done callback of a background publish_job()."""
+    if published.cancelled():
+        return
+    error = published.exception()
+    if error is not None:
+        print(f"Warning: Could not publish job {job.id}: {error}")
+    elif not published.result() and job.status != JobStatus.CANCELLED:
+        start_job_task(abort_if_cancelled(job))
+
+
+def notify_job(job: ConversionJob):
+    """
+    Publish a job's state to job_store and wake long-polls and event
+    streams waiting on it after it changed.
+
+    The write happens in the background; a job that turns out to have been
+    cancelled through another process meanwhile is aborted then, instead of
+    overwriting the cancellation.
+    """
+    publish_job(job).add_done_callback(functools.partial(check_published, job))
+    wake_job(job)
+
+
+def wake_job(job: ConversionJob):
+    """Wake long-polls and event streams waiting on a job after it changed."""
+    jobs.update(job)
+    job.changed.set()
+    job.changed = asyncio.Event()
+    if job.status in FINISHED_STATUSES:
+        job.done.set()
+
+
+def report_phase(job_ids: List[str], phase: str):
+    """Record the conversion phase on a running job and the jobs attached to it."""
+    for job_id in job_ids:
+        job = jobs.get(job_id)
+        if job and job.status in (JobStatus.PENDING, JobStatus.PROCESSING):
+            job.status = JobStatus.PROCESSING
+            job.phase = phase
+            notify_job(job)
+
+
+async def wait_for_job(job: ConversionJob, wait: float) -> ConversionJob:
+    """
+    Block until a job has finished, for at most wait seconds (capped).
+
+    Returns the job's latest state; jobs of other processes are re-read
+    from job_store every JOB_POLL_SECONDS.
+    """
+    timeout = min(wait, MAX_WAIT_SECONDS)
+    if timeout <= 0 or job.status in FINISHED_STATUSES:
+        return job
+    if job.id in jobs:
         try:
-            result, error = await loop.run_in_executor(
-                None,
-                convert_scad_to_step,
-                scad_code
+            await asyncio.wait_for(job.done.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return job
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while job.status not in FINISHED_STATUSES and loop.time() < deadline:
+        await asyncio.sleep(min(JOB_POLL_SECONDS, deadline - loop.time()))
+        job = await get_job(job.id) or job
+    return job
+
+
+def job_status(job: ConversionJob) -> StatusResponse:
+    return StatusResponse(
+        jobId=job.id,
+        status=job.status.value,
+        error=job.error,
+        createdAt=job.created_at.isoformat(),
+        completedAt=job.completed_at.isoformat() if job.completed_at else None,
+        queuePosition=scheduler.position(job.leader_id or job.id),
+        peakMemoryBytes=job.peak_rss_bytes,
+        phase=job.phase,
+        formats=job.formats,
+        refine=RefineReport(
+            policy=job.refine["policy"],
+            decision=job.refine["decision"],
+            faces=job.refine["faces"],
+            solids=job.refine["solids"],
+            refinedFaces=job.refine.get("refined_faces"),
+            workers=job.refine.get("workers", 1)
+        ) if job.refine else None,
+        quality=job.quality,
+        complexity=ComplexityReport(**job.complexity) if job.complexity else None,
+        lane=job.lane,
+        profile=job.profile
+    )
+
+
+def batch_record(batch: ConversionBatch) -> dict:
+    return {
+        "id": batch.id,
+        "created_at": batch.created_at.isoformat(),
+        "items": [{"filename": item.filename, "job_id": item.job_id} for item in batch.items],
+    }
+
+
+async def get_batch(batch_id: str) -> Optional[ConversionBatch]:
+    record = await store_call(job_store.get_batch, batch_id)
+    if record is None:
+        return None
+    return ConversionBatch(
+        id=record["id"],
+        created_at=datetime.fromisoformat(record["created_at"]),
+        items=[BatchItem(filename=item["filename"], job_id=item["job_id"]) for item in record["items"]]
+    )
+
+
+async def batch_jobs(batch: ConversionBatch) -> List[ConversionJob]:
+    """The distinct, unexpired jobs of a batch."""
+    job_ids = list(dict.fromkeys(item.job_id for item in batch.items))
+    return [job for job in await get_jobs(job_ids) if job is not None]
+
+
+async def wait_for_batch(batch: ConversionBatch, wait: float):
+    """Block until every job of a batch has finished, for at most wait seconds (capped)."""
+    unfinished = [job for job in await batch_jobs(batch) if job.status not in FINISHED_STATUSES]
+    await asyncio.gather(*(wait_for_job(job, wait) for job in unfinished))
+
+
+async def batch_status(batch: ConversionBatch) -> BatchStatusResponse:
+    items = []
+    completed_at = None
+    batch_items = await get_jobs([item.job_id for item in batch.items])
+    for item, job in zip(batch.items, batch_items):
+        if job is None:
+            items.append(BatchItemStatus(
+                filename=item.filename,
+                jobId=item.job_id,
+                status=JobStatus.FAILED.value,
+                error="Job not found or expired"
+            ))
+            continue
+        items.append(BatchItemStatus(
+            filename=item.filename,
+            jobId=job.id,
+            status=job.status.value,
+            error=job.error
+        ))
+        if job.completed_at and (completed_at is None or job.completed_at > completed_at):
+            completed_at = job.completed_at
+
+    counts = {status: 0 for status in JobStatus}
+    for item in items:
+        counts[JobStatus(item.status)] += 1
+    finished = sum(counts[status] for status in FINISHED_STATUSES)
+    if finished < len(items):
+        status = JobStatus.PENDING if counts[JobStatus.PENDING] == len(items) else JobStatus.PROCESSING
+        completed_at = None
+    elif counts[JobStatus.COMPLETED]:
+        status = JobStatus.COMPLETED
+    elif counts[JobStatus.CANCELLED] == len(items):
+        status = JobStatus.CANCELLED
+    else:
+        status = JobStatus.FAILED
+
+    return BatchStatusResponse(
+        batchId=batch.id,
+        status=status.value,
+        total=len(items),
+        completed=counts[JobStatus.COMPLETED],
+        failed=counts[JobStatus.FAILED],
+        cancelled=counts[JobStatus.CANCELLED],
+        conversions=len({item.job_id for item in batch.items}),
+        createdAt=batch.created_at.isoformat(),
+        completedAt=completed_at.isoformat() if completed_at else None,
+        items=items
+    )
+
+
+def iter_result(job_id: str, fmt: str = STEP):
+    """Yield the uncompressed result of a job in one format, in chunks."""
+    source = result_store.open(job_id, fmt)
+    if source is None:
+        raise RuntimeError(f"{fmt.upper()} result of job {job_id} is missing")
+    with source:
+        yield from iter_decompress(source, result_store.encoding)
+
+
+def check_code(code: str, label: str = "", files: Optional[Dict[str, str]] = None):
+    """
+    Raise a 400 or 413 HTTPException for code that cannot be converted, or
+    check_files' exceptions for its project files. The shapes the code
+    needs may come from the project's .scad files.
+    """
+    if files:
+        check_files(files, label)
+    validation_error = validate_scad_code(code + "\n" + project_sources(files) if files else code)
+    if validation_error:
+        raise HTTPException(status_code=400, detail=label + validation_error)
+
+    code_size_kb = len(code.encode('utf-8')) / 1024
+    if code_size_kb > MAX_CODE_SIZE_KB:
+        raise HTTPException(
+            status_code=413,
+            detail=f"{label}Code size ({code_size_kb:.1f}KB) exceeds maximum of {MAX_CODE_SIZE_KB}KB"
+        )
+
+
+def check_files(files: Dict[str, str], label: str = ""):
+    """
+    Raise a 400 HTTPException for an invalid project manifest, or a 409 one
+    listing the blobs that still have to be uploaded.
+    """
+    if len(files) > MAX_PROJECT_FILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"{label}Projects are limited to {MAX_PROJECT_FILES} files"
+        )
+    for path, digest in files.items():
+        path_error = validate_project_path(path)
+        if path_error:
+            raise HTTPException(status_code=400, detail=label + path_error)
+        if not is_digest(digest):
+            raise HTTPException(
+                status_code=400,
+                detail=f"{label}File {path} must reference a lowercase hex SHA-256 hash"
             )
+    missing = blob_store.missing(files.values())
+    if missing:
+        raise HTTPException(
+            status_code=409,
+            detail=f"{label}Blobs not uploaded: {', '.join(missing)}"
+        )
+    # Keep them from being pruned while the job waits
+    blob_store.touch(files.values())
+
+
+def project_sources(files: Dict[str, str]) -> str:
+    """The .scad files of a project concatenated, for the complexity estimate."""
+    sources = []
+    for path, digest in files.items():
+        if path.endswith(".scad"):
+            with open(blob_store.path(digest), 'r', encoding='utf-8', errors='replace') as f:
+                sources.append(f.read())
+    return "\n".join(sources)
+
+
+def sanitize_filename(filename: Optional[str]) -> str:
+    filename = filename or "model"
+    return "".join(c for c in filename if c.isalnum() or c in "._- ")[:100]
+
+
+def conversion_spec(request: ConvertRequest, label: str = "") -> ConversionSpec:
+    """
+    Resolve a request's output formats, refine policy, solid workers,
+    quality, project files, complexity estimate with its lane and cache
+    keys; raises a 400 HTTPException for unknown formats, refine policies
+    or qualities, or a non-positive mesh deflection or worker count. The
+    project files must have passed check_code.
+
+    STEP-only conversions keep the cache key they had before other formats
+    existed, "always" the one it had before refine became optional and
+    "exact" the one it had before quality levels. Under "auto" the key also
+    covers AUTO_REFINE_FACES and AUTO_REFINE_MAX_FACES, which decide what
+    gets refined, so changing them converts again. Each quality level is
+    cached separately, so resubmitting at a finer level converts again.
+    Every format has its own cache entry, and only mesh formats depend on
+    the deflection. Projects are keyed by their manifest as well as the
+    code; blobs are content-addressed, so the manifest covers their content.
+    A profiled conversion gets a cache key of its own, so that it always
+    runs and no other job attaches to it.
+    """
+    try:
+        formats = normalize_formats(request.formats)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=label + str(e))
+    deflection = request.meshDeflection if request.meshDeflection is not None else MESH_DEFLECTION
+    if deflection <= 0:
+        raise HTTPException(status_code=400, detail=f"{label}meshDeflection must be positive")
+    refine_policy = request.refine or REFINE_POLICY
+    if refine_policy not in REFINE_POLICIES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"{label}refine must be one of: {', '.join(REFINE_POLICIES)}"
+        )
+    solid_workers = request.solidWorkers if request.solidWorkers is not None else SOLID_WORKERS
+    if solid_workers < 1:
+        raise HTTPException(status_code=400, detail=f"{label}solidWorkers must be at least 1")
+    quality = request.quality or QUALITY
+    if quality not in QUALITY_LEVELS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"{label}quality must be one of: {', '.join(QUALITY_LEVELS)}"
+        )
+
+    files = request.files or {}
+    key_options = {"refine_shape": True if refine_policy == REFINE_ALWAYS else refine_policy}
+    if refine_policy == REFINE_AUTO:
+        key_options["auto_refine_faces"] = [AUTO_REFINE_FACES, AUTO_REFINE_MAX_FACES]
+    if quality != EXACT:
+        key_options["quality"] = quality
+    if files:
+        key_options["files"] = files
+    step_key = make_cache_key(request.code, **key_options)
+    artifact_keys = {STEP: step_key}
+    for fmt in formats[1:]:
+        options = {"format": fmt}
+        if fmt in MESH_FORMATS:
+            options["mesh_deflection"] = deflection
+        artifact_keys[fmt] = make_cache_key(request.code, **key_options, **options)
+
+    cache_key = step_key
+    if len(formats) > 1:
+        cache_key = make_cache_key(
+            request.code,
+            **key_options,
+            formats=formats,
+            mesh_deflection=deflection if any(fmt in MESH_FORMATS for fmt in formats) else None
+        )
+    if request.profile:
+        cache_key = f"profile:{uuid.uuid4()}"
+    estimate = estimate_complexity(
+        request.code + "\n" + project_sources(files) if files else request.code, quality
+    )
+    return ConversionSpec(
+        formats=formats,
+        mesh_deflection=deflection,
+        refine_policy=refine_policy,
+        solid_workers=min(solid_workers, MAX_SOLID_WORKERS),
+        quality=quality,
+        complexity={
+            "score": estimate.score,
+            "minkowski": estimate.minkowski,
+            "hull": estimate.hull,
+            "sweeps": estimate.sweeps,
+            "loopIterations": estimate.loop_iterations,
+            "fragments": estimate.fragments,
+        },
+        lane=estimate.lane(HEAVY_COMPLEXITY_SCORE),
+        profile=request.profile,
+        files=files,
+        cache_key=cache_key,
+        artifact_keys=artifact_keys
+    )
+
+
+async def cached_artifacts(spec: ConversionSpec) -> Optional[Dict[str, bytes]]:
+    """
+    Every requested format from the result cache, or None unless all are
+    cached; always None for profiled conversions.
+    """
+    if spec.profile:
+        return None
+    # The disk tier is read off the event loop
+    results = await asyncio.get_running_loop().run_in_executor(
+        None, result_cache.get_many, [spec.artifact_keys[fmt] for fmt in spec.formats]
+    )
+    return dict(zip(spec.formats, results)) if results is not None else None
+
+
+def create_job(
+    filename: str,
+    spec: ConversionSpec,
+    job_id: Optional[str] = None
+) -> Tuple[ConversionJob, asyncio.Future]:
+    """
+    Register a new job with this process and, in the background, job_store.
+
+    Await the returned future before handing the job's id out, so that
+    other processes know it; until then the job can already be started.
+    """
+    job = ConversionJob(
+        id=job_id or str(uuid.uuid4()),
+        status=JobStatus.PENDING,
+        created_at=datetime.utcnow(),
+        formats=spec.formats,
+        filename=filename,
+        cache_key=spec.cache_key,
+        quality=spec.quality,
+        complexity=spec.complexity,
+        lane=spec.lane,
+        profile=spec.profile
+    )
+    jobs.add(job)
+    return job, store_call(job_store.create, job_record(job))
+
+
+def running_conversion(cache_key: str) -> Optional[InflightConversion]:
+    """The conversion of identical code that new jobs can still attach to, if any."""
+    conversion = inflight.get(cache_key)
+    if conversion is None or conversion.future.done():
+        return None
+    return conversion
+
+
+def attach_job(job: ConversionJob, conversion: InflightConversion):
+    """Make a job wait for an identical running conversion instead of starting one."""
+    global coalesced_jobs
+    job.leader_id = conversion.leader_id
+    conversion.followers.append(job.id)
+    leader = jobs.get(job.leader_id)
+    if leader and leader.status == JobStatus.PROCESSING:
+        job.status = JobStatus.PROCESSING
+        job.phase = leader.phase
+    coalesced_jobs += 1
+    job.task = start_job_task(attach_to_conversion(job.id, conversion.future))
+    notify_job(job)
+
+
+def start_conversion(job: ConversionJob, code: str, spec: ConversionSpec):
+    """Start converting for a job whose queue place is already reserved."""
+    job.phase = PHASE_QUEUED
+    inflight[job.cache_key] = InflightConversion(
+        leader_id=job.id,
+        future=asyncio.get_running_loop().create_future()
+    )
+    job.task = start_job_task(process_conversion(job.id, code, spec))
+    notify_job(job)
+
+
+def abort_job(job: ConversionJob):
+    """
+    Mark an unfinished job cancelled and stop the work only it still needs.
+
+    A queued conversion gives up its queue place; a running one is cancelled,
+    which kills its processes and frees its slot.
+    """
+    job.status = JobStatus.CANCELLED
+    job.error = "Job was cancelled"
+    job.phase = None
+    job.completed_at = datetime.utcnow()
+
+    conversion = inflight.get(job.cache_key)
+    if conversion is not None and conversion.leader_id != (job.leader_id or job.id):
+        conversion = None
+    if job.leader_id:
+        # Followers only wait on the shared conversion
+        if conversion is not None and job.id in conversion.followers:
+            conversion.followers.remove(job.id)
+        if job.task is not None:
+            job.task.cancel()
+
+    if conversion is not None:
+        wanted = [
+            other_id for other_id in [conversion.leader_id] + conversion.followers
+            if other_id in jobs and jobs[other_id].status != JobStatus.CANCELLED
+        ]
+        if not wanted:
+            leader = jobs.get(conversion.leader_id)
+            # Drop it now so new submissions start a fresh conversion
+            del inflight[job.cache_key]
+            scheduler.cancel(conversion.leader_id)
+            if leader is not None and leader.task is not None:
+                leader.task.cancel()
+    elif not job.leader_id:
+        scheduler.cancel(job.id)
+        if job.task is not None:
+            job.task.cancel()
+
+    print(f"Job {job.id} cancelled")
+    notify_job(job)
+
+
+async def request_cancel(job: ConversionJob) -> ConversionJob:
+    """
+    Cancel an unfinished job, whichever process runs it.
+
+    The process running another process's job notices the cancellation in
+    job_store and stops the work; returns the job's latest state.
+    """
+    if job.id in jobs:
+        abort_job(job)
+        return job
+    await store_call(job_store.complete, job.id, {
+        "status": JobStatus.CANCELLED.value,
+        "error": "Job was cancelled",
+        "phase": None,
+        "completed_at": datetime.utcnow().isoformat(),
+    })
+    print(f"Job {job.id} cancelled")
+    return await get_job(job.id) or job
+
+
+async def finish_job(
+    job: ConversionJob,
+    artifacts: Dict[str, bytes],
+    error: Optional[str],
+    source_job_id: Optional[str] = None
+):
+    """
+    Record the outcome of a conversion on a job.
+
+    Successful results go to result_store, one per format, before the job is
+    marked completed; with source_job_id the already stored results of that
+    job are shared. Cancelled jobs are left as they are.
+    """
+    if job.status == JobStatus.CANCELLED:
+        return
+    if error:
+        job.status = JobStatus.FAILED
+        job.error = error
+        print(f"Job {job.id} failed: {error}")
+    else:
+        loop = asyncio.get_running_loop()
+        source = jobs.get(source_job_id) if source_job_id else None
+        for fmt in job.formats:
+            data = artifacts[fmt]
+            linked = source is not None and await loop.run_in_executor(
+                None, result_store.link, job.id, source.id, fmt
+            )
+            if linked:
+                job.stored_sizes[fmt] = source.stored_sizes[fmt]
+                job.result_owners[fmt] = source.result_owners.get(fmt, source.id)
+            else:
+                # Compression happens once here, off the event loop
+                job.stored_sizes[fmt] = await loop.run_in_executor(
+                    None, result_store.put, job.id, data, fmt
+                )
+            job.result_sizes[fmt] = len(data)
+        job.status = JobStatus.COMPLETED
+        print(f"Job {job.id} completed: " + ", ".join(
+            f"{fmt} {job.result_sizes[fmt]} bytes ({job.stored_sizes[fmt]} stored)"
+            for fmt in job.formats
+        ))
+    job.completed_at = datetime.utcnow()
+    # Waiters only see the outcome once other processes can, too
+    if await publish_job(job) or not await abort_if_cancelled(job):
+        wake_job(job)
+    await evict_results()
+
+
+async def evict_results():
+    """Drop the oldest completed jobs while stored results exceed RESULT_STORE_MAX_MB."""
+    for job in jobs.evict():
+        await store_call(job_store.delete, job.id)
+        result_store.delete(job.id, set(job.formats) | set(job.stored_sizes))
+        print(f"Evicted job {job.id} to stay within the result budget")
+
+
+async def store_profile(
+    job: ConversionJob,
+    usage: JobUsage,
+    timings: Dict[str, float],
+    measurements: dict,
+    stats: Optional[bytes],
+    error: Optional[str]
+):
+    """Put a profiled job's profile, and FreeCAD's cProfile stats if any, in result_store."""
+    profile = {
+        "jobId": job.id,
+        "error": error,
+        "quality": job.quality,
+        "complexity": job.complexity,
+        "lane": job.lane,
+        "refine": job.refine,
+        "timings": timings,
+        "peakMemoryBytes": usage.peak_rss_bytes or None,
+        "processes": [
+            {"pid": pid, "name": name, "peakRssBytes": usage.process_peaks.get(pid)}
+            for pid, name in usage.process_names.items()
+        ],
+        **measurements,
+    }
+    loop = asyncio.get_running_loop()
+    data = json.dumps(profile).encode('utf-8')
+    job.stored_sizes[PROFILE_FORMAT] = await loop.run_in_executor(
+        None, result_store.put, job.id, data, PROFILE_FORMAT
+    )
+    if stats:
+        job.stored_sizes[PSTATS_FORMAT] = await loop.run_in_executor(
+            None, result_store.put, job.id, stats, PSTATS_FORMAT
+        )
+
+
+async def process_conversion(job_id: str, scad_code: str, spec: ConversionSpec):
+    """Background task to process OpenSCAD to STEP (and other format) conversion."""
+    cache_key = spec.cache_key
+    outcome: Tuple[Dict[str, bytes], Optional[str]] = ({}, "Conversion was abandoned")
+    queued_at = time.monotonic()
+    try:
+        async with scheduler.slot(job_id, spec.lane) as usage:
+            QUEUE_WAIT_SECONDS.observe(time.monotonic() - queued_at, lane=spec.lane)
+            job = jobs.get(job_id)
+            if not job:
+                return
+
+            if job.status != JobStatus.CANCELLED and not await store_call(job_store.claim, job_id):
+                # Cancelled through another process while queued
+                if job.status != JobStatus.CANCELLED:
+                    abort_job(job)
+                if cache_key not in inflight:
+                    return
+            # A cancelled leader still converts for the jobs attached to it
+            if job.status != JobStatus.CANCELLED:
+                job.status = JobStatus.PROCESSING
+                jobs.update(job)
+            print(f"Processing job {job_id}")
+            INPUT_BYTES.observe(len(scad_code.encode('utf-8')))
+            scad_code = apply_quality(scad_code, spec.quality)
+            timings: Dict[str, float] = {}
+
+            def on_phase(phase: str):
+                conversion = inflight.get(cache_key)
+                report_phase([job_id] + (conversion.followers if conversion else []), phase)
+
+            def on_timing(phase: str, seconds: float):
+                timings[phase] = seconds
+                PHASE_SECONDS.observe(seconds, phase=phase)
+
+            def on_refine(report: dict):
+                job.refine = report
+                print(f"Job {job_id} refine: {report}")
 
+            profile: Dict[str, object] = {"measurements": {}, "stats": None}
+            project_files = {
+                path: blob_store.path(digest) for path, digest in spec.files.items()
+            } or None
+
+            def on_profile(measurements: dict, stats: Optional[bytes]):
+                profile["measurements"] = measurements
+                profile["stats"] = stats
+
+            try:
+                if freecad_pool is not None:
+                    outcome = await convert_scad_pooled(
+                        freecad_pool,
+                        scad_code,
+                        spec.formats,
+                        spec.mesh_deflection,
+                        spec.refine_policy,
+                        on_process=usage.track,
+                        on_phase=on_phase,
+                        on_timing=on_timing,
+                        on_refine=on_refine,
+                        solid_workers=spec.solid_workers,
+                        on_profile=on_profile if spec.profile else None,
+                        files=project_files
+                    )
+                else:
+                    outcome = await convert_scad_async(
+                        scad_code,
+                        spec.formats,
+                        spec.mesh_deflection,
+                        spec.refine_policy,
+                        on_process=usage.track,
+                        on_phase=on_phase,
+                        on_timing=on_timing,
+                        on_refine=on_refine,
+                        solid_workers=spec.solid_workers,
+                        on_profile=on_profile if spec.profile else None,
+                        files=project_files
+                    )
+            except asyncio.CancelledError:
+                # The conversion's processes are already killed; the slot is freed on the way out
+                CONVERSIONS.inc(outcome="cancelled")
+                raise
+            except Exception as e:
+                outcome = ({}, str(e))
+            job.peak_rss_bytes = usage.peak_rss_bytes or None
+            if timings:
+                print(f"Job {job_id} timings: " + ", ".join(
+                    f"{phase}={seconds:.2f}s" for phase, seconds in timings.items()
+                ))
+
+            artifacts, error = outcome
             if error:
-                job.status = JobStatus.FAILED
-                job.error = error
-                print(f"Job {job_id} failed: {error}")
+                CONVERSIONS.inc(outcome=classify_error(error))
             else:
-                job.status = JobStatus.COMPLETED
-                job.result = result
-                print(f"Job {job_id} completed: {len(result)} bytes")
+                CONVERSIONS.inc(outcome="success")
+                OUTPUT_BYTES.observe(len(artifacts[STEP]))
+                loop = asyncio.get_running_loop()
+                for fmt, data in artifacts.items():
+                    await loop.run_in_executor(None, result_cache.put, spec.artifact_keys[fmt], data)
+            if spec.profile:
+                await store_profile(
+                    job, usage, timings, profile["measurements"], profile["stats"], error
+                )
+            await finish_job(job, artifacts, error)
+    finally:
+        # Hand the outcome to any jobs that attached while this one ran
+        conversion = inflight.get(cache_key)
+        if conversion is not None and conversion.leader_id == job_id:
+            del inflight[cache_key]
+            if not conversion.future.done():
+                conversion.future.set_result(outcome)
 
-            job.completed_at = datetime.utcnow()
 
-        except Exception as e:
-            job.status = JobStatus.FAILED
-            job.error = str(e)
-            job.completed_at = datetime.utcnow()
-            print(f"Job {job_id} error: {e}")
+async def attach_to_conversion(
+    job_id: str,
+    future: "asyncio.Future[Tuple[Dict[str, bytes], Optional[str]]]"
+):
+    """Background task that waits for an identical in-flight conversion."""
+    artifacts, error = await asyncio.shield(future)
+    job = jobs.get(job_id)
+    if job:
+        leader = jobs.get(job.leader_id)
+        if leader is not None:
+            job.refine = leader.refine
+        await finish_job(job, artifacts, error, source_job_id=job.leader_id)
 
 
 @app.get("/health", response_model=HealthResponse)
@@ -181,64 +1364,391 @@ async def health_check():
     """Health check endpoint."""
     return HealthResponse(
         status="healthy",
-        activeJobs=len([j for j in jobs.values() if j.status in [JobStatus.PENDING, JobStatus.PROCESSING]])
+        activeJobs=jobs.count(JobStatus.PENDING, JobStatus.PROCESSING),
+        cacheHits=result_cache.hits,
+        cacheMisses=result_cache.misses,
+        coalescedJobs=coalesced_jobs,
+        queuedJobs=scheduler.queued,
+        maxConcurrentJobs=scheduler.max_concurrent,
+        resultBytes=jobs.result_bytes,
+        maxResultBytes=jobs.max_result_bytes
+    )
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics in the text exposition format."""
+    return Response(content=REGISTRY.render(), media_type=METRICS_CONTENT_TYPE)
+
+
+@app.get("/clients", response_model=ClientsResponse, responses={401: {"model": ErrorResponse}})
+async def client_queues(authorization: Optional[str] = Header(None)):
+    """Queue depth and wait times of each client this process schedules."""
+    if not verify_auth(authorization):
+        raise HTTPException(status_code=401, detail="Invalid or missing authorization")
+
+    return ClientsResponse(
+        maxClientJobs=MAX_CLIENT_JOBS,
+        clients=[ClientQueueStats(**stats) for stats in scheduler.client_stats()]
     )
 
 
+@app.post(
+    "/blobs/missing",
+    response_model=MissingBlobsResponse,
+    responses={400: {"model": ErrorResponse}, 401: {"model": ErrorResponse}}
+)
+async def missing_blobs(request: BlobsRequest, authorization: Optional[str] = Header(None)):
+    """Which of the given SHA-256 hashes have no stored blob and must be uploaded."""
+    if not verify_auth(authorization):
+        raise HTTPException(status_code=401, detail="Invalid or missing authorization")
+
+    invalid = [digest for digest in request.hashes if not is_digest(digest)]
+    if invalid:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Not lowercase hex SHA-256 hashes: {', '.join(invalid[:10])}"
+        )
+    return MissingBlobsResponse(missing=blob_store.missing(request.hashes))
+
+
+@app.put(
+    "/blobs/{digest}",
+    response_model=BlobResponse,
+    status_code=201,
+    responses={
+        400: {"model": ErrorResponse},
+        401: {"model": ErrorResponse},
+        413: {"model": ErrorResponse}
+    }
+)
+async def upload_blob(
+    digest: str,
+    request: Request,
+    response: Response,
+    authorization: Optional[str] = Header(None)
+):
+    """
+    Store the request body as the blob with the given SHA-256 hash.
+    Responds 201 when stored, 200 when the blob already existed.
+    """
+    if not verify_auth(authorization):
+        raise HTTPException(status_code=401, detail="Invalid or missing authorization")
+
+    if not is_digest(digest):
+        raise HTTPException(status_code=400, detail="Blob name must be a lowercase hex SHA-256 hash")
+
+    max_bytes = MAX_BLOB_SIZE_KB * 1024
+    chunks = []
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > max_bytes:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Blob exceeds maximum of {MAX_BLOB_SIZE_KB}KB"
+            )
+        chunks.append(chunk)
+
+    loop = asyncio.get_running_loop()
+    try:
+        # Hashing and writing large assets happens off the event loop
+        created = await loop.run_in_executor(None, blob_store.put, digest, b"".join(chunks))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not created:
+        response.status_code = 200
+    return BlobResponse(hash=digest, size=size, created=created)
+
+
 @app.post(
     "/convert",
     response_model=ConvertResponse,
     responses={
         400: {"model": ErrorResponse},
         401: {"model": ErrorResponse},
-        413: {"model": ErrorResponse}
+        409: {"model": ErrorResponse},
+        413: {"model": ErrorResponse},
+        503: {"model": ErrorResponse}
     }
 )
 async def submit_conversion(
     request: ConvertRequest,
-    background_tasks: BackgroundTasks,
-    authorization: Optional[str] = Header(None)
+    wait: float = Query(0, ge=0),
+    authorization: Optional[str] = Header(None),
+    x_client_id: Optional[str] = Header(None)
 ):
     """
     Submit OpenSCAD code for conversion to STEP format.
-    Returns a jobId for polling status.
+    Returns a jobId for polling status. With wait=N the response is held
+    for up to N seconds until the job has completed or failed.
     """
     if not verify_auth(authorization):
         raise HTTPException(status_code=401, detail="Invalid or missing authorization")
 
-    # Validate code
-    validation_error = validate_scad_code(request.code)
-    if validation_error:
-        raise HTTPException(status_code=400, detail=validation_error)
+    check_code(request.code, files=request.files)
+    spec = conversion_spec(request)
+    filename = sanitize_filename(request.filename)
+    job, stored = create_job(filename, spec)
+    await stored
 
-    # Check code size
-    code_size_kb = len(request.code.encode('utf-8')) / 1024
-    if code_size_kb > MAX_CODE_SIZE_KB:
+    # Serve identical submissions straight from the result cache
+    cached = await cached_artifacts(spec)
+    if cached is not None:
+        print(f"Job {job.id} served from cache: {len(cached[STEP])} bytes")
+        await finish_job(job, cached, None)
+        return ConvertResponse(jobId=job.id, status=job.status.value)
+
+    # Attach to an identical conversion that is already running
+    conversion = running_conversion(job.cache_key)
+    if conversion is not None:
+        attach_job(job, conversion)
+        print(f"Created job {job.id} for file '{filename}' (attached to {job.leader_id})")
+        await wait_for_job(job, wait)
+        return ConvertResponse(jobId=job.id, status=job.status.value)
+
+    # Fail fast instead of piling up background tasks when the queue is full
+    try:
+        scheduler.reserve(
+            job.id, spec.lane, client_identity(authorization, x_client_id), spec.complexity["score"]
+        )
+    except QueueFullError as e:
+        jobs.remove(job.id)
+        await store_call(job_store.delete, job.id)
+        raise HTTPException(
+            status_code=503,
+            detail="Conversion queue is full, try again later",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+    # Start background conversion
+    start_conversion(job, request.code, spec)
+    print(
+        f"Created job {job.id} for file '{filename}' "
+        f"({job.lane} lane, complexity {job.complexity['score']})"
+    )
+
+    await wait_for_job(job, wait)
+    return ConvertResponse(jobId=job.id, status=job.status.value)
+
+
+@app.post(
+    "/convert/batch",
+    response_model=BatchStatusResponse,
+    responses={
+        400: {"model": ErrorResponse},
+        401: {"model": ErrorResponse},
+        409: {"model": ErrorResponse},
+        413: {"model": ErrorResponse},
+        503: {"model": ErrorResponse}
+    }
+)
+async def submit_batch(
+    request: BatchConvertRequest,
+    wait: float = Query(0, ge=0),
+    authorization: Optional[str] = Header(None),
+    x_client_id: Optional[str] = Header(None)
+):
+    """
+    Submit several OpenSCAD models, e.g. parameter variants, as one batch.
+
+    Items with identical code share one job. The conversions a batch needs
+    are admitted to the queue all at once or not at all. With wait=N the
+    response is held for up to N seconds until every item has finished.
+    """
+    if not verify_auth(authorization):
+        raise HTTPException(status_code=401, detail="Invalid or missing authorization")
+
+    if not request.items:
+        raise HTTPException(status_code=400, detail="Batch has no items")
+    if len(request.items) > MAX_BATCH_ITEMS:
         raise HTTPException(
             status_code=413,
-            detail=f"Code size ({code_size_kb:.1f}KB) exceeds maximum of {MAX_CODE_SIZE_KB}KB"
+            detail=f"Batch has {len(request.items)} items, the maximum is {MAX_BATCH_ITEMS}"
         )
+    specs = []
+    for index, item in enumerate(request.items):
+        check_code(item.code, f"Item {index}: ", item.files)
+        specs.append(conversion_spec(item, f"Item {index}: "))
 
-    # Sanitize filename
-    filename = request.filename or "model"
-    filename = "".join(c for c in filename if c.isalnum() or c in "._- ")[:100]
+    filenames = [sanitize_filename(item.filename) for item in request.items]
+    keys = [spec.cache_key for spec in specs]
+    # First item of each distinct model, in submission order
+    first_items: Dict[str, int] = {}
+    for index, key in enumerate(keys):
+        first_items.setdefault(key, index)
 
-    # Create job
-    job_id = str(uuid.uuid4())
-    job = ConversionJob(
-        id=job_id,
-        status=JobStatus.PENDING,
+    cached: Dict[str, Dict[str, bytes]] = {}
+    conversions: Dict[str, InflightConversion] = {}
+    new_job_ids: Dict[str, str] = {}
+    for key, index in first_items.items():
+        artifacts = await cached_artifacts(specs[index])
+        if artifacts is not None:
+            cached[key] = artifacts
+    # No awaits from here until the conversions are started, so an identical
+    # conversion starting meanwhile cannot be missed and run twice
+    for key in first_items:
+        conversion = running_conversion(key) if key not in cached else None
+        if conversion is not None:
+            conversions[key] = conversion
+        elif key not in cached:
+            new_job_ids[key] = str(uuid.uuid4())
+
+    if len(new_job_ids) > scheduler.max_queue:
+        raise HTTPException(
+            status_code=413,
+            detail=(
+                f"Batch needs {len(new_job_ids)} conversions, "
+                f"the queue holds at most {scheduler.max_queue}"
+            )
+        )
+    try:
+        client = client_identity(authorization, x_client_id)
+        scheduler.reserve_many({
+            job_id: (specs[first_items[key]].lane, client, specs[first_items[key]].complexity["score"])
+            for key, job_id in new_job_ids.items()
+        })
+    except QueueFullError as e:
+        raise HTTPException(
+            status_code=503,
+            detail="Conversion queue is full, try again later",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+    job_ids: Dict[str, str] = {}
+    stored = []
+    for key, index in first_items.items():
+        job, job_stored = create_job(filenames[index], specs[index], new_job_ids.get(key))
+        if key in conversions:
+            attach_job(job, conversions[key])
+        elif key in new_job_ids:
+            start_conversion(job, request.items[index].code, specs[index])
+        job_ids[key] = job.id
+        stored.append(job_stored)
+    await asyncio.gather(*stored)
+
+    batch = ConversionBatch(
+        id=str(uuid.uuid4()),
         created_at=datetime.utcnow(),
-        filename=filename
+        items=[BatchItem(filename=filenames[i], job_id=job_ids[key]) for i, key in enumerate(keys)]
+    )
+    await store_call(job_store.put_batch, batch_record(batch))
+    print(
+        f"Created batch {batch.id}: {len(keys)} items, {len(first_items)} distinct "
+        f"({len(cached)} cached, {len(conversions)} attached, {len(new_job_ids)} queued)"
     )
-    jobs[job_id] = job
 
-    # Start background conversion
-    background_tasks.add_task(process_conversion, job_id, request.code)
+    for key, artifacts in cached.items():
+        await finish_job(jobs[job_ids[key]], artifacts, None)
+
+    await wait_for_batch(batch, wait)
+    return await batch_status(batch)
+
+
+@app.get(
+    "/batch/{batch_id}",
+    response_model=BatchStatusResponse,
+    responses={
+        401: {"model": ErrorResponse},
+        404: {"model": ErrorResponse}
+    }
+)
+async def get_batch_status(
+    batch_id: str,
+    wait: float = Query(0, ge=0),
+    authorization: Optional[str] = Header(None)
+):
+    """
+    Get the aggregate progress of a batch and the status of each item.
+    With wait=N the response is held for up to N seconds until every item
+    has finished.
+    """
+    if not verify_auth(authorization):
+        raise HTTPException(status_code=401, detail="Invalid or missing authorization")
+
+    batch = await get_batch(batch_id)
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found or expired")
+
+    await wait_for_batch(batch, wait)
+    return await batch_status(batch)
+
+
+@app.delete(
+    "/batch/{batch_id}",
+    response_model=BatchStatusResponse,
+    responses={
+        401: {"model": ErrorResponse},
+        404: {"model": ErrorResponse}
+    }
+)
+async def cancel_batch(
+    batch_id: str,
+    authorization: Optional[str] = Header(None)
+):
+    """Cancel every item of a batch that has not finished yet."""
+    if not verify_auth(authorization):
+        raise HTTPException(status_code=401, detail="Invalid or missing authorization")
+
+    batch = await get_batch(batch_id)
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found or expired")
+
+    for job in await batch_jobs(batch):
+        if job.status not in FINISHED_STATUSES:
+            await request_cancel(job)
+    return await batch_status(batch)
+
 
-    print(f"Created job {job_id} for file '{filename}'")
+@app.get(
+    "/batch/{batch_id}/download",
+    responses={
+        401: {"model": ErrorResponse},
+        404: {"model": ErrorResponse},
+        425: {"model": ErrorResponse}
+    }
+)
+async def download_batch(
+    batch_id: str,
+    authorization: Optional[str] = Header(None)
+):
+    """
+    Download a finished batch as a ZIP archive with one STEP file per item.
+
+    The archive is compressed while it streams. Items that did not complete
+    are listed in errors.txt instead.
+    """
+    if not verify_auth(authorization):
+        raise HTTPException(status_code=401, detail="Invalid or missing authorization")
+
+    batch = await get_batch(batch_id)
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found or expired")
 
-    return ConvertResponse(jobId=job_id, status=job.status.value)
+    if any(job.status not in FINISHED_STATUSES for job in await batch_jobs(batch)):
+        raise HTTPException(status_code=425, detail="Batch not yet completed")
+
+    entries: List[ArchiveEntry] = []
+    errors = []
+    names: Set[str] = set()
+    batch_items = await get_jobs([item.job_id for item in batch.items])
+    for item, job in zip(batch.items, batch_items):
+        if job is None or job.status != JobStatus.COMPLETED:
+            error = job.error if job else "Job not found or expired"
+            errors.append(f"{item.filename}: {error}")
+            continue
+        for fmt in job.formats:
+            name = unique_name(f"{item.filename}.{fmt}", names)
+            entries.append((name, functools.partial(iter_result, job.id, fmt)))
+    if errors:
+        report = ("\n".join(errors) + "\n").encode('utf-8')
+        entries.append((unique_name("errors.txt", names), lambda: iter([report])))
+
+    return StreamingResponse(
+        iter_zip(entries),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="batch-{batch.id}.zip"'}
+    )
 
 
 @app.get(
@@ -251,63 +1761,285 @@ async def submit_conversion(
 )
 async def get_status(
     job_id: str,
+    wait: float = Query(0, ge=0),
     authorization: Optional[str] = Header(None)
 ):
-    """Get the status of a conversion job."""
+    """
+    Get the status of a conversion job.
+    With wait=N the response is held for up to N seconds until the job has
+    finished.
+    """
     if not verify_auth(authorization):
         raise HTTPException(status_code=401, detail="Invalid or missing authorization")
 
-    job = jobs.get(job_id)
+    job = await get_job(job_id)
     if not job:
         raise HTTPException(status_code=404, detail="Job not found or expired")
 
-    return StatusResponse(
-        jobId=job.id,
-        status=job.status.value,
-        error=job.error,
-        createdAt=job.created_at.isoformat(),
-        completedAt=job.completed_at.isoformat() if job.completed_at else None
-    )
+    job = await wait_for_job(job, wait)
+    return job_status(job)
 
 
-@app.get(
-    "/download/{job_id}",
+@app.delete(
+    "/jobs/{job_id}",
+    response_model=StatusResponse,
     responses={
-        400: {"model": ErrorResponse},
         401: {"model": ErrorResponse},
         404: {"model": ErrorResponse},
-        425: {"model": ErrorResponse}
+        409: {"model": ErrorResponse}
     }
 )
-async def download_result(
+async def cancel_job(
     job_id: str,
     authorization: Optional[str] = Header(None)
 ):
-    """Download the converted STEP file."""
+    """
+    Cancel a queued or running conversion job.
+
+    A queued job gives up its queue place and a running one has its
+    OpenSCAD/FreeCAD processes killed, freeing its slot straight away. A
+    conversion shared with identical jobs keeps running until all of them
+    are cancelled.
+    """
     if not verify_auth(authorization):
         raise HTTPException(status_code=401, detail="Invalid or missing authorization")
 
-    job = jobs.get(job_id)
+    job = await get_job(job_id)
     if not job:
         raise HTTPException(status_code=404, detail="Job not found or expired")
 
-    if job.status == JobStatus.FAILED:
+    if job.status in FINISHED_STATUSES:
+        raise HTTPException(status_code=409, detail=f"Job has already {job.status.value}")
+
+    return job_status(await request_cancel(job))
+
+
+@app.get(
+    "/events/{job_id}",
+    responses={
+        401: {"model": ErrorResponse},
+        404: {"model": ErrorResponse}
+    }
+)
+async def job_events(
+    job_id: str,
+    authorization: Optional[str] = Header(None)
+):
+    """
+    Stream a job's progress as server-sent events.
+
+    Each change is sent as a "status" event carrying the same JSON as
+    /status; the stream ends once the job has finished.
+    """
+    if not verify_auth(authorization):
+        raise HTTPException(status_code=401, detail="Invalid or missing authorization")
+
+    job = await get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+
+    async def stream():
+        loop = asyncio.get_running_loop()
+        current = job
+        last_payload = None
+        last_sent = loop.time()
+        while current is not None:
+            changed = current.changed
+            payload = json.dumps(jsonable_encoder(job_status(current)))
+            if payload != last_payload:
+                yield f"event: status\ndata: {payload}\n\n"
+                last_payload = payload
+                last_sent = loop.time()
+            if current.status in FINISHED_STATUSES:
+                return
+            if current.id in jobs:
+                try:
+                    await asyncio.wait_for(changed.wait(), EVENT_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    # Also picks up queue position changes, which are not notified
+                    yield ": keepalive\n\n"
+            else:
+                # Jobs of other processes are polled in job_store
+                await asyncio.sleep(JOB_POLL_SECONDS)
+                if loop.time() - last_sent >= EVENT_KEEPALIVE_SECONDS:
+                    yield ": keepalive\n\n"
+                    last_sent = loop.time()
+            current = await get_job(job.id)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+async def result_response(
+    job_id: str,
+    fmt: str,
+    gzip: bool,
+    authorization: Optional[str],
+    accept_encoding: Optional[str]
+) -> Response:
+    """Response carrying one format of a completed job's result."""
+    if not verify_auth(authorization):
+        raise HTTPException(status_code=401, detail="Invalid or missing authorization")
+
+    job = await get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+
+    if fmt not in job.formats:
+        raise HTTPException(status_code=404, detail=f"Format {fmt} was not requested for this job")
+
+    if job.status in (JobStatus.FAILED, JobStatus.CANCELLED):
         raise HTTPException(status_code=400, detail=job.error or "Conversion failed")
 
     if job.status != JobStatus.COMPLETED:
         raise HTTPException(status_code=425, detail="Job not yet completed")
 
-    if not job.result:
+    if gzip:
+        filename = f"{job.filename}.{'stp' if fmt == STEP else fmt}.gz"
+        media_type = "application/gzip"
+        encoding = GZIP
+        headers = {}
+    else:
+        filename = f"{job.filename}.{fmt}"
+        media_type = FORMAT_MEDIA_TYPES[fmt]
+        encoding = negotiate(accept_encoding, result_store.encoding)
+        headers = {"Vary": "Accept-Encoding"}
+        if encoding != IDENTITY:
+            headers["Content-Encoding"] = encoding
+    headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+
+    if encoding == result_store.encoding:
+        # Spooled results are streamed from disk without loading them into memory
+        path = result_store.path(job.id, fmt)
+        if path:
+            return FileResponse(path, media_type=media_type, headers=headers)
+
+        result = result_store.read(job.id, fmt)
+        if not result:
+            if job_store.shared:
+                print(f"Warning: {fmt.upper()} result of job {job.id} is not in {RESULT_SPOOL_DIR}; "
+                      "RESULT_SPOOL_DIR must be shared by every process using the job store")
+            raise HTTPException(status_code=500, detail="Result data missing")
+        return Response(content=result, media_type=media_type, headers=headers)
+
+    # The client cannot take the stored coding; recode it while streaming
+    source = result_store.open(job.id, fmt)
+    if source is None:
         raise HTTPException(status_code=500, detail="Result data missing")
 
-    filename = f"{job.filename}.step"
+    def stream():
+        with source:
+            yield from iter_recode(source, result_store.encoding, encoding)
+
+    return StreamingResponse(stream(), media_type=media_type, headers=headers)
+
+
+DOWNLOAD_RESPONSES = {
+    400: {"model": ErrorResponse},
+    401: {"model": ErrorResponse},
+    404: {"model": ErrorResponse},
+    425: {"model": ErrorResponse}
+}
+
+
+@app.get("/download/{job_id}", responses=DOWNLOAD_RESPONSES)
+async def download_result(
+    job_id: str,
+    gzip: bool = False,
+    authorization: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None)
+):
+    """
+    Download the converted STEP file.
+
+    The response is content-encoded according to Accept-Encoding. With
+    gzip=true the file itself is a gzip archive named <filename>.stp.gz.
+    """
+    return await result_response(job_id, STEP, gzip, authorization, accept_encoding)
+
+
+@app.get("/download/{job_id}/{fmt}", responses=DOWNLOAD_RESPONSES)
+async def download_format(
+    job_id: str,
+    fmt: str,
+    gzip: bool = False,
+    authorization: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None)
+):
+    """
+    Download one of the formats requested for a job (step, brep, stl, 3mf, glb).
+
+    Encoding and gzip=true behave as for /download/{job_id}; the archive is
+    named <filename>.<format>.gz.
+    """
+    return await result_response(job_id, fmt.lower(), gzip, authorization, accept_encoding)
+
 
-    return Response(
-        content=job.result,
-        media_type="application/step",
-        headers={
-            "Content-Disposition": f'attachment; filename="{filename}"'
-        }
+async def profile_response(
+    job_id: str,
+    fmt: str,
+    media_type: str,
+    authorization: Optional[str],
+    attachment: bool = False
+) -> StreamingResponse:
+    """
+    Response streaming one of a profiled job's profile files; as an
+    attachment it is named <filename>.<format>.
+    """
+    if not verify_auth(authorization):
+        raise HTTPException(status_code=401, detail="Invalid or missing authorization")
+
+    job = await get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+
+    if not job.profile:
+        raise HTTPException(status_code=404, detail="Job was not submitted with profile=true")
+
+    if job.status not in FINISHED_STATUSES:
+        raise HTTPException(status_code=425, detail="Job not yet completed")
+
+    if fmt not in job.stored_sizes:
+        raise HTTPException(status_code=404, detail="No profile was recorded for this job")
+
+    headers = {}
+    if attachment:
+        headers["Content-Disposition"] = f'attachment; filename="{job.filename}.{fmt}"'
+    return StreamingResponse(iter_result(job.id, fmt), media_type=media_type, headers=headers)
+
+
+PROFILE_RESPONSES = {
+    401: {"model": ErrorResponse},
+    404: {"model": ErrorResponse},
+    425: {"model": ErrorResponse}
+}
+
+
+@app.get("/profile/{job_id}", responses=PROFILE_RESPONSES)
+async def get_profile(job_id: str, authorization: Optional[str] = Header(None)):
+    """
+    Profile of a job submitted with profile=true, once it has finished.
+
+    Holds the phase timings, the peak RSS of every subprocess, OpenSCAD's
+    output and FreeCAD's measurements: recompute time and size of each
+    imported object, faces before and after refine per shape, seconds per
+    export format and the functions with the most cumulative time.
+    """
+    return await profile_response(job_id, PROFILE_FORMAT, "application/json", authorization)
+
+
+@app.get("/profile/{job_id}/pstats", responses=PROFILE_RESPONSES)
+async def get_profile_stats(job_id: str, authorization: Optional[str] = Header(None)):
+    """
+    FreeCAD's cProfile stats of a profiled job, for pstats or snakeviz.
+
+    Missing when FreeCAD did not get to write them, e.g. after a timeout.
+    """
+    return await profile_response(
+        job_id, PSTATS_FORMAT, "application/octet-stream", authorization, attachment=True
     )
 
 
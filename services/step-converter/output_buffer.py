@@ -0,0 +1,63 @@
+"""
+Bounded capture of OpenSCAD and FreeCAD output. A model that echo()es in a
+loop can print hundreds of megabytes; only the end of the output, where the
+errors and result markers the converter parses are written, is kept.
+"""
+import io
+import codecs
+from collections import deque
+
+
+# Trailing characters kept per captured stream
+MAX_CAPTURED_CHARS = 256 * 1024
+
+
+class OutputBuffer(io.TextIOBase):
+    """
+    Ring buffer holding the last max_chars characters written to it.
+
+    Text is written with write(), e.g. through redirect_stdout, or fed as raw
+    bytes from a pipe with feed(), which decodes UTF-8 across chunk borders.
+    Once output has been dropped, getvalue() starts at the next whole line.
+    """
+
+    def __init__(self, max_chars: int = MAX_CAPTURED_CHARS):
+        super().__init__()
+        self.max_chars = max_chars
+        self.truncated = False
+        self._chunks = deque()
+        self._size = 0
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        if text:
+            self._chunks.append(text)
+            self._size += len(text)
+            self._trim()
+        return len(text)
+
+    def feed(self, data: bytes):
+        self.write(self._decoder.decode(data))
+
+    def _trim(self):
+        while self._size > self.max_chars:
+            self.truncated = True
+            excess = self._size - self.max_chars
+            first = self._chunks[0]
+            if len(first) <= excess:
+                self._chunks.popleft()
+                self._size -= len(first)
+            else:
+                self._chunks[0] = first[excess:]
+                self._size -= excess
+
+    def getvalue(self) -> str:
+        text = "".join(self._chunks)
+        if self.truncated:
+            line_end = text.find('\n')
+            if line_end != -1:
+                text = text[line_end + 1:]
+        return text
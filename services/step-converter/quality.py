@@ -0,0 +1,167 @@
+"""
+Quality levels that bound the resolution of curved OpenSCAD geometry.
+Rewrites every assignment to $fn, $fa and $fs in the submitted code so its
+value is clamped, before OpenSCAD evaluates it. Code pulled in with include
+or use is left as it is.
+"""
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Tuple
+
+
+DRAFT = "draft"
+NORMAL = "normal"
+EXACT = "exact"
+# From coarsest to finest; resubmitting at a later level upgrades a result
+QUALITY_LEVELS = (DRAFT, NORMAL, EXACT)
+
+
+@dataclass(frozen=True)
+class ResolutionLimits:
+    max_fn: int  # Upper bound for $fn (fragments per full circle)
+    min_fa: float  # Lower bound for $fa (minimum fragment angle, degrees)
+    min_fs: float  # Lower bound for $fs (minimum fragment size, mm)
+
+
+# EXACT has no limits; DRAFT allows nothing finer than OpenSCAD's defaults
+QUALITY_LIMITS: Dict[str, ResolutionLimits] = {
+    DRAFT: ResolutionLimits(max_fn=32, min_fa=12, min_fs=2),
+    NORMAL: ResolutionLimits(max_fn=128, min_fa=2, min_fs=0.25),
+}
+
+SPECIAL_VARIABLES = ('$fn', '$fa', '$fs')
+
+
+class _Scanner:
+    """Finds the expressions assigned to special variables, skipping strings and comments."""
+
+    def __init__(self, text: str):
+        self.text = text
+
+    def _skip_string(self, pos: int) -> int:
+        """Return the position after the string literal starting at pos."""
+        text = self.text
+        pos += 1
+        while pos < len(text):
+            if text[pos] == '\\':
+                pos += 2
+                continue
+            if text[pos] == '"':
+                return pos + 1
+            pos += 1
+        return pos
+
+    def _skip_comment(self, pos: int) -> int:
+        """Return the position after a comment starting at pos, or pos if there is none."""
+        text = self.text
+        if text.startswith('//', pos):
+            end = text.find('\n', pos)
+            return len(text) if end == -1 else end + 1
+        if text.startswith('/*', pos):
+            end = text.find('*/', pos + 2)
+            return len(text) if end == -1 else end + 2
+        return pos
+
+    def _skip_space(self, pos: int) -> int:
+        text = self.text
+        while pos < len(text):
+            if text[pos].isspace():
+                pos += 1
+                continue
+            end = self._skip_comment(pos)
+            if end == pos:
+                break
+            pos = end
+        return pos
+
+    def _expression_end(self, pos: int) -> int:
+        """Return where the expression starting at pos ends: at a top-level , ; or closing bracket."""
+        text = self.text
+        depth = 0
+        while pos < len(text):
+            char = text[pos]
+            if char == '"':
+                pos = self._skip_string(pos)
+                continue
+            end = self._skip_comment(pos)
+            if end != pos:
+                pos = end
+                continue
+            if char in '([{':
+                depth += 1
+            elif char in ')]}':
+                if depth == 0:
+                    return pos
+                depth -= 1
+            elif char in ',;' and depth == 0:
+                return pos
+            pos += 1
+        return pos
+
+    def assignments(self) -> Iterator[Tuple[str, int, int]]:
+        """Yield (variable, start, end) for every value assigned to a special variable."""
+        text = self.text
+        pos = 0
+        while pos < len(text):
+            char = text[pos]
+            if char == '"':
+                pos = self._skip_string(pos)
+                continue
+            end = self._skip_comment(pos)
+            if end != pos:
+                pos = end
+                continue
+            if not (char.isalnum() or char in '_$'):
+                pos += 1
+                continue
+
+            start = pos
+            while pos < len(text) and (text[pos].isalnum() or text[pos] in '_$.'):
+                pos += 1
+            name = text[start:pos]
+            if name in ('include', 'use'):
+                # Library paths in <...> may contain anything
+                after = self._skip_space(pos)
+                if after < len(text) and text[after] == '<':
+                    close = text.find('>', after)
+                    pos = len(text) if close == -1 else close + 1
+            elif name in SPECIAL_VARIABLES:
+                after = self._skip_space(pos)
+                if text.startswith('=', after) and not text.startswith('==', after):
+                    value = self._skip_space(after + 1)
+                    yield name, value, self._expression_end(value)
+
+
+def apply_quality(code: str, quality: str) -> str:
+    """
+    Return code with every $fn, $fa and $fs assignment clamped to the
+    limits of quality, e.g. `$fn = 256` becomes `$fn = min(32, (256))`.
+
+    Assignments in module calls, let(), parameter defaults and at top level
+    are all covered. EXACT returns the code unchanged.
+    """
+    limits = QUALITY_LIMITS.get(quality)
+    if limits is None:
+        return code
+    clamps = {
+        '$fn': f"min({limits.max_fn}, (",
+        '$fa': f"max({limits.min_fa:g}, (",
+        '$fs': f"max({limits.min_fs:g}, (",
+    }
+
+    # Only insertions, so nested assignments cannot conflict
+    insertions: List[Tuple[int, str]] = []
+    for name, start, end in _Scanner(code).assignments():
+        insertions.append((start, clamps[name]))
+        insertions.append((end, "))"))
+    if not insertions:
+        return code
+
+    insertions.sort(key=lambda insertion: insertion[0])
+    parts = []
+    previous = 0
+    for position, text in insertions:
+        parts.append(code[previous:position])
+        parts.append(text)
+        previous = position
+    parts.append(code[previous:])
+    return "".join(parts)
@@ -0,0 +1,158 @@
+"""
+Container resource discovery and process memory sampling.
+Reads cgroup (v2, then v1) limits so scheduling follows the container's
+actual CPU and memory allowance rather than the host's.
+"""
+import os
+from typing import Dict, Iterable, Optional
+
+
+# cgroup v1 reports "unlimited" as a huge page-aligned number
+_UNLIMITED_THRESHOLD = 1 << 60
+
+
+def _read_first_line(path: str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return f.readline().strip()
+    except OSError:
+        return None
+
+
+def cpu_limit() -> float:
+    """Return the number of CPUs this container may use."""
+    available = float(len(os.sched_getaffinity(0)))
+
+    # cgroup v2: "<quota> <period>" or "max <period>"
+    cpu_max = _read_first_line("/sys/fs/cgroup/cpu.max")
+    if cpu_max:
+        quota, _, period = cpu_max.partition(" ")
+        if quota != "max" and period:
+            return min(available, int(quota) / int(period))
+        return available
+
+    # cgroup v1
+    quota = _read_first_line("/sys/fs/cgroup/cpu/cpu.cfs_quota_us")
+    period = _read_first_line("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+    if quota and period and int(quota) > 0:
+        return min(available, int(quota) / int(period))
+    return available
+
+
+def memory_limit_bytes() -> Optional[int]:
+    """Return the container memory limit, falling back to physical memory."""
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        value = _read_first_line(path)
+        if value and value != "max" and int(value) < _UNLIMITED_THRESHOLD:
+            return int(value)
+
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemTotal:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def _memory_stat(path: str, key: str) -> int:
+    """Return one counter of a cgroup memory.stat file, or 0 if unavailable."""
+    try:
+        with open(path) as f:
+            for line in f:
+                name, _, value = line.partition(" ")
+                if name == key:
+                    return int(value)
+    except (OSError, ValueError):
+        pass
+    return 0
+
+
+def memory_usage_bytes() -> Optional[int]:
+    """
+    Return the container's working set, or None outside a cgroup.
+
+    Like the kubelet, this is the cgroup's usage minus its inactive file
+    cache: writing results, blobs and workspaces grows the page cache, which
+    the kernel reclaims before it runs out of memory.
+    """
+    for usage_path, stat_path, inactive_key in (
+        ("/sys/fs/cgroup/memory.current", "/sys/fs/cgroup/memory.stat", "inactive_file"),
+        (
+            "/sys/fs/cgroup/memory/memory.usage_in_bytes",
+            "/sys/fs/cgroup/memory/memory.stat",
+            "total_inactive_file",
+        ),
+    ):
+        value = _read_first_line(usage_path)
+        if value:
+            return max(0, int(value) - _memory_stat(stat_path, inactive_key))
+    return None
+
+
+def process_rss_bytes(pid: int) -> int:
+    """Return the resident set size of a process, or 0 if unavailable."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return 0
+
+
+def process_name(pid: int) -> str:
+    """Return the command name of a process, or "" if it is gone."""
+    return _read_first_line(f"/proc/{pid}/comm") or ""
+
+
+def _parent_pids() -> Dict[int, int]:
+    """Map every visible pid to its parent pid."""
+    parents = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        stat = _read_first_line(f"/proc/{entry}/stat")
+        if not stat:
+            continue
+        # The command name may contain spaces; fields resume after the last ')'
+        fields = stat.rsplit(")", 1)[-1].split()
+        if len(fields) > 1:
+            parents[int(entry)] = int(fields[1])
+    return parents
+
+
+def process_tree_rss_by_root(pids: Iterable[int]) -> Dict[int, int]:
+    """
+    Return the RSS of each given process together with its descendants.
+    A process below several of the given ones counts towards the first.
+    """
+    roots = list(dict.fromkeys(pids))
+    if not roots:
+        return {}
+
+    children: Dict[int, list] = {}
+    for pid, parent in _parent_pids().items():
+        children.setdefault(parent, []).append(pid)
+
+    totals = {}
+    seen = set()
+    for root in roots:
+        total = 0
+        stack = [root]
+        while stack:
+            pid = stack.pop()
+            if pid in seen:
+                continue
+            seen.add(pid)
+            total += process_rss_bytes(pid)
+            stack.extend(children.get(pid, []))
+        totals[root] = total
+    return totals
+
+
+def process_tree_rss_bytes(pids: Iterable[int]) -> int:
+    """Return the combined RSS of the given processes and all their descendants."""
+    return sum(process_tree_rss_by_root(pids).values())
@@ -0,0 +1,287 @@
+"""
+Content-addressed cache for conversion results, one entry per output format.
+Keeps a bounded in-memory LRU tier in front of an optional on-disk tier.
+"""
+import os
+import json
+import hashlib
+import tempfile
+import threading
+import subprocess
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+
+from converter import PIPELINE_VERSION
+
+
+OPENSCAD_LIBRARY_DIRS = [
+    "/usr/share/openscad/libraries",
+]
+
+_library_fingerprint: Optional[str] = None
+
+# Disk tier files are <key><DISK_SUFFIX>, whatever the format of the result
+DISK_SUFFIX = ".result"
+# Suffix the disk tier used before, when every entry was named like a STEP file
+LEGACY_DISK_SUFFIX = ".step"
+
+
+def library_fingerprint() -> str:
+    """
+    Identify the OpenSCAD library versions installed in the container.
+
+    Each library directory contributes its git HEAD when it is a checkout,
+    otherwise its newest file modification time. Can be pinned explicitly
+    with the CACHE_LIBRARY_VERSION environment variable.
+    """
+    global _library_fingerprint
+    if _library_fingerprint is not None:
+        return _library_fingerprint
+
+    pinned = os.environ.get("CACHE_LIBRARY_VERSION")
+    if pinned:
+        _library_fingerprint = pinned
+        return _library_fingerprint
+
+    search_dirs = list(OPENSCAD_LIBRARY_DIRS)
+    search_dirs += [p for p in os.environ.get("OPENSCADPATH", "").split(os.pathsep) if p]
+
+    parts = []
+    for base in search_dirs:
+        if not os.path.isdir(base):
+            continue
+        for name in sorted(os.listdir(base)):
+            lib_dir = os.path.join(base, name)
+            if not os.path.isdir(lib_dir):
+                continue
+            parts.append(f"{name}={_library_version(lib_dir)}")
+
+    _library_fingerprint = ";".join(parts) or "none"
+    return _library_fingerprint
+
+
+def _library_version(lib_dir: str) -> str:
+    """Return a version marker for a single library directory."""
+    if os.path.isdir(os.path.join(lib_dir, ".git")):
+        try:
+            result = subprocess.run(
+                ['git', '-C', lib_dir, 'rev-parse', 'HEAD'],
+                capture_output=True,
+                text=True,
+                timeout=10
+            )
+            if result.returncode == 0 and result.stdout.strip():
+                return result.stdout.strip()
+        except (OSError, subprocess.TimeoutExpired):
+            pass
+
+    newest = 0.0
+    for root, _dirs, files in os.walk(lib_dir):
+        for name in files:
+            try:
+                newest = max(newest, os.path.getmtime(os.path.join(root, name)))
+            except OSError:
+                pass
+    return f"mtime:{int(newest)}"
+
+
+def make_cache_key(scad_code: str, **options) -> str:
+    """
+    Build the content hash used to address a conversion result.
+
+    The key covers the SCAD source, every conversion option that affects the
+    output, the installed library versions and the pipeline version.
+    """
+    payload = json.dumps(
+        {
+            "code": scad_code,
+            "options": options,
+            "libraries": library_fingerprint(),
+            "pipeline": PIPELINE_VERSION,
+        },
+        sort_keys=True
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    """
+    Two-tier cache of conversion results keyed by content hash.
+
+    The memory tier is an LRU bounded by total bytes. The disk tier is
+    optional; when enabled, every stored result is also written there and
+    the least recently used files are evicted once the size budget is hit.
+    Disk entries are indexed by one scan on start and tracked from then on.
+    Lookups and puts may read and write files, so the service calls them
+    from executor threads; they are safe to run concurrently.
+    """
+
+    def __init__(
+        self,
+        max_memory_bytes: int,
+        disk_dir: Optional[str] = None,
+        max_disk_bytes: int = 0
+    ):
+        self.max_memory_bytes = max_memory_bytes
+        self.disk_dir = disk_dir or None
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        # Size of each disk entry, least recently used first
+        self._disk: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_bytes = 0
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._index_disk()
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Look up a result, promoting disk hits into the memory tier."""
+        results = self.get_many([key])
+        return results[0] if results is not None else None
+
+    def get_many(self, keys: Sequence[str]) -> Optional[List[bytes]]:
+        """
+        Look up several results that are only useful together, e.g. the
+        output formats of one conversion. Counts as a single hit or miss.
+        """
+        results = []
+        for key in keys:
+            data = self._lookup(key)
+            if data is None:
+                with self._lock:
+                    self.misses += 1
+                return None
+            results.append(data)
+        with self._lock:
+            self.hits += 1
+        return results
+
+    def put(self, key: str, data: bytes):
+        """Store a result in both tiers."""
+        if not data:
+            return
+        self._remember(key, data)
+        self._write_disk(key, data)
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters and tier usage."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "memoryEntries": len(self._memory),
+                "memoryBytes": self._memory_bytes,
+                "diskBytes": self._disk_bytes,
+            }
+
+    def _lookup(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                return data
+
+        data = self._read_disk(key)
+        if data is not None:
+            self._remember(key, data)
+        return data
+
+    def _remember(self, key: str, data: bytes):
+        if len(data) > self.max_memory_bytes:
+            return
+        with self._lock:
+            previous = self._memory.pop(key, None)
+            if previous is not None:
+                self._memory_bytes -= len(previous)
+            self._memory[key] = data
+            self._memory_bytes += len(data)
+            while self._memory_bytes > self.max_memory_bytes and self._memory:
+                _old_key, old_data = self._memory.popitem(last=False)
+                self._memory_bytes -= len(old_data)
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}{DISK_SUFFIX}")
+
+    def _read_disk(self, key: str) -> Optional[bytes]:
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            # Refresh modification time so the next start's index sees this entry as recently used
+            os.utime(path)
+        except OSError:
+            return None
+        self._track_disk(key, len(data))
+        return data
+
+    def _write_disk(self, key: str, data: bytes):
+        if not self.disk_dir or len(data) > self.max_disk_bytes:
+            return
+        with self._lock:
+            if key in self._disk:
+                self._disk.move_to_end(key)
+                return
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # A name of its own, as another thread may be writing the same key
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError as e:
+            print(f"Warning: Failed to write cache entry {key}: {e}")
+            return
+        self._track_disk(key, len(data))
+
+    def _track_disk(self, key: str, size: int):
+        """Record use of a disk entry and evict the least recently used beyond the budget."""
+        evicted = []
+        with self._lock:
+            if key in self._disk:
+                self._disk.move_to_end(key)
+                return
+            self._disk[key] = size
+            self._disk_bytes += size
+            while self._disk_bytes > self.max_disk_bytes and self._disk:
+                old_key, old_size = self._disk.popitem(last=False)
+                self._disk_bytes -= old_size
+                evicted.append(old_key)
+        for old_key in evicted:
+            try:
+                os.remove(self._disk_path(old_key))
+            except OSError:
+                pass
+
+    def _index_disk(self):
+        """Index the disk tier's files, oldest first, dropping those of the old naming."""
+        entries = []
+        for root, _dirs, files in os.walk(self.disk_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                if name.endswith(LEGACY_DISK_SUFFIX):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                    continue
+                if not name.endswith(DISK_SUFFIX):
+                    continue
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, name[:-len(DISK_SUFFIX)], stat.st_size))
+        for _mtime, key, size in sorted(entries):
+            self._track_disk(key, size)
@@ -0,0 +1,152 @@
+"""
+Storage for completed conversion results.
+Keeps result bytes out of the job table: the spool backend writes each
+result to disk and only the job metadata stays in memory. A job has one
+result per output format, all stored compressed with the store's content
+coding.
+"""
+import io
+import os
+import shutil
+from typing import BinaryIO, Dict, Iterable, Optional, Tuple
+
+from compression import FILE_SUFFIXES, IDENTITY, compress
+
+
+DEFAULT_FORMAT = "step"
+
+
+class ResultStore:
+    """Interface for per-job result storage."""
+
+    def __init__(self, encoding: str = IDENTITY):
+        self.encoding = encoding
+
+    def put(self, job_id: str, data: bytes, fmt: str = DEFAULT_FORMAT) -> int:
+        """Compress and store a job's result, returning the stored size in bytes."""
+        raise NotImplementedError
+
+    def link(self, job_id: str, source_job_id: str, fmt: str = DEFAULT_FORMAT) -> bool:
+        """Share another job's stored result; returns False if it is gone."""
+        raise NotImplementedError
+
+    def path(self, job_id: str, fmt: str = DEFAULT_FORMAT) -> Optional[str]:
+        """Filesystem path of a result, if the backend keeps one."""
+        return None
+
+    def read(self, job_id: str, fmt: str = DEFAULT_FORMAT) -> Optional[bytes]:
+        """Stored (compressed) bytes of a result."""
+        raise NotImplementedError
+
+    def open(self, job_id: str, fmt: str = DEFAULT_FORMAT) -> Optional[BinaryIO]:
+        """Binary file object over the stored bytes of a result."""
+        data = self.read(job_id, fmt)
+        return io.BytesIO(data) if data is not None else None
+
+    def delete(self, job_id: str, formats: Iterable[str] = (DEFAULT_FORMAT,)):
+        """Remove a job's results in the given formats."""
+        raise NotImplementedError
+
+
+class MemoryResultStore(ResultStore):
+    """Keeps results in process memory."""
+
+    def __init__(self, encoding: str = IDENTITY):
+        super().__init__(encoding)
+        self._results: Dict[Tuple[str, str], bytes] = {}
+
+    def put(self, job_id: str, data: bytes, fmt: str = DEFAULT_FORMAT) -> int:
+        stored = compress(data, self.encoding)
+        self._results[job_id, fmt] = stored
+        return len(stored)
+
+    def link(self, job_id: str, source_job_id: str, fmt: str = DEFAULT_FORMAT) -> bool:
+        data = self._results.get((source_job_id, fmt))
+        if data is None:
+            return False
+        self._results[job_id, fmt] = data
+        return True
+
+    def read(self, job_id: str, fmt: str = DEFAULT_FORMAT) -> Optional[bytes]:
+        return self._results.get((job_id, fmt))
+
+    def delete(self, job_id: str, formats: Iterable[str] = (DEFAULT_FORMAT,)):
+        for fmt in formats:
+            self._results.pop((job_id, fmt), None)
+
+
+class SpoolResultStore(ResultStore):
+    """
+    Writes each result to a file in a spool directory.
+
+    Jobs sharing one result are hard links to the same file, so deleting
+    one job's result never affects another. With clear the spool is emptied
+    on start, for when job metadata does not survive a restart; a spool
+    shared with other processes is left alone and emptied by job expiry.
+    """
+
+    def __init__(self, spool_dir: str, encoding: str = IDENTITY, clear: bool = True):
+        super().__init__(encoding)
+        self.spool_dir = spool_dir
+        if clear:
+            shutil.rmtree(spool_dir, ignore_errors=True)
+        os.makedirs(spool_dir, exist_ok=True)
+
+    def _path(self, job_id: str, fmt: str) -> str:
+        return os.path.join(self.spool_dir, f"{job_id}.{fmt}{FILE_SUFFIXES[self.encoding]}")
+
+    def put(self, job_id: str, data: bytes, fmt: str = DEFAULT_FORMAT) -> int:
+        path = self._path(job_id, fmt)
+        tmp_path = f"{path}.tmp"
+        stored = compress(data, self.encoding)
+        with open(tmp_path, 'wb') as f:
+            f.write(stored)
+        os.replace(tmp_path, path)
+        return len(stored)
+
+    def link(self, job_id: str, source_job_id: str, fmt: str = DEFAULT_FORMAT) -> bool:
+        try:
+            os.link(self._path(source_job_id, fmt), self._path(job_id, fmt))
+            return True
+        except FileExistsError:
+            return True
+        except OSError:
+            return False
+
+    def path(self, job_id: str, fmt: str = DEFAULT_FORMAT) -> Optional[str]:
+        path = self._path(job_id, fmt)
+        return path if os.path.exists(path) else None
+
+    def read(self, job_id: str, fmt: str = DEFAULT_FORMAT) -> Optional[bytes]:
+        try:
+            with open(self._path(job_id, fmt), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def open(self, job_id: str, fmt: str = DEFAULT_FORMAT) -> Optional[BinaryIO]:
+        try:
+            return open(self._path(job_id, fmt), 'rb')
+        except OSError:
+            return None
+
+    def delete(self, job_id: str, formats: Iterable[str] = (DEFAULT_FORMAT,)):
+        for fmt in formats:
+            try:
+                os.remove(self._path(job_id, fmt))
+            except FileNotFoundError:
+                pass
+
+
+def create_result_store(
+    backend: str,
+    spool_dir: str,
+    encoding: str = IDENTITY,
+    clear: bool = True
+) -> ResultStore:
+    """Build the configured result store backend ("spool" or "memory")."""
+    if backend == "memory":
+        return MemoryResultStore(encoding)
+    if backend == "spool":
+        return SpoolResultStore(spool_dir, encoding, clear)
+    raise ValueError(f"Unknown result store backend: {backend}")
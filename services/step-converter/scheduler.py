@@ -0,0 +1,398 @@
+"""
+Admission control and scheduling for conversion jobs.
+Replaces a fixed semaphore with a bounded queue of lanes, each with its own
+concurrency limit derived from the container's CPU and memory limits, that
+share their slots fairly between clients.
+"""
+import math
+import time
+import asyncio
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+
+from resources import (
+    cpu_limit,
+    memory_limit_bytes,
+    memory_usage_bytes,
+    process_name,
+    process_tree_rss_by_root,
+)
+
+
+# Fraction of the memory limit conversions may use; the rest is left for the API process
+MEMORY_HEADROOM = 0.8
+# Smoothing factor for the learned job duration and memory estimates
+EWMA_ALPHA = 0.2
+# Cost credited to a client each time its turn comes round in a lane; one
+# cube-sized job, so clients submitting simple models alternate job by job
+FAIR_SHARE_QUANTUM = 1.0
+# Clients with nothing queued or running are forgotten after this long
+CLIENT_STATS_TTL_SECONDS = 3600
+ANONYMOUS_CLIENT = "anonymous"
+
+
+class QueueFullError(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__("Conversion queue is full")
+        self.retry_after = retry_after
+
+
+@dataclass
+class JobUsage:
+    """Resource accounting for one running job."""
+    lane: str
+    client: str
+    started_at: float = field(default_factory=time.monotonic)
+    pids: Set[int] = field(default_factory=set)
+    peak_rss_bytes: int = 0
+    # Command name and highest sampled RSS (with descendants) of each tracked process
+    process_names: Dict[int, str] = field(default_factory=dict)
+    process_peaks: Dict[int, int] = field(default_factory=dict)
+
+    def track(self, pid: int):
+        """Register a subprocess whose memory counts towards this job (thread-safe)."""
+        self.process_names[pid] = process_name(pid)
+        self.pids.add(pid)
+
+
+@dataclass
+class _QueuedJob:
+    lane: str
+    client: str
+    cost: float
+    queued_at: float = field(default_factory=time.monotonic)
+    future: Optional[asyncio.Future] = None  # Set once the job waits for its slot
+
+
+@dataclass
+class ClientStats:
+    """Queue wait accounting for one client."""
+    started: int = 0
+    wait_seconds: float = 0.0
+    max_wait_seconds: float = 0.0
+    last_seen: float = field(default_factory=time.monotonic)
+
+
+def default_concurrency(job_memory_bytes: int) -> int:
+    """Number of jobs the container can run at once without oversubscribing."""
+    by_cpu = max(1, math.floor(cpu_limit()))
+    limit = memory_limit_bytes()
+    if not limit:
+        return by_cpu
+    by_memory = max(1, int(limit * MEMORY_HEADROOM // job_memory_bytes))
+    return min(by_cpu, by_memory)
+
+
+class JobScheduler:
+    """
+    Bounded queue in front of a fixed number of execution slots per lane.
+
+    Jobs reserve a queue place in a lane at submission (failing fast when
+    the queue, shared by all lanes, is full) and wait for a slot when they
+    start. Each lane has its own concurrency limit, so jobs in one lane
+    never wait behind another lane's.
+
+    Within a lane, every client has its own FIFO queue and slots go round
+    the clients by deficit round robin: each turn credits a client
+    FAIR_SHARE_QUANTUM, and its next job starts once the credit covers the
+    job's cost. A client submitting many or expensive jobs therefore gets
+    the same share of work as one submitting a single job, and at most
+    max_client_jobs (0 for no limit) of its jobs run at once. A slot is
+    only granted while the container has memory headroom for another job,
+    using the learned per-job peak RSS as the estimate.
+    """
+
+    def __init__(
+        self,
+        lanes: Dict[str, int],
+        max_queue: int,
+        job_memory_bytes: int,
+        max_client_jobs: int = 0,
+        sample_interval: float = 1.0
+    ):
+        # Maximum concurrent jobs per lane, in the order lanes are served
+        self.lanes = dict(lanes)
+        self.max_queue = max_queue
+        self.job_memory_bytes = job_memory_bytes
+        self.max_client_jobs = max_client_jobs
+        self.sample_interval = sample_interval
+        self.memory_limit = memory_limit_bytes()
+        self.avg_job_seconds = 30.0
+        self.rejected = 0
+
+        self._queued: Dict[str, _QueuedJob] = {}
+        # Per lane, each client's queued job ids in FIFO order; the first client has the turn
+        self._clients: Dict[str, "OrderedDict[str, OrderedDict[str, None]]"] = {
+            lane: OrderedDict() for lane in self.lanes
+        }
+        self._deficits: Dict[str, Dict[str, float]] = {lane: {} for lane in self.lanes}
+        self._running: Dict[str, JobUsage] = {}
+        self._client_stats: Dict[str, ClientStats] = {}
+
+    @property
+    def max_concurrent(self) -> int:
+        return sum(self.lanes.values())
+
+    @property
+    def queued(self) -> int:
+        return len(self._queued)
+
+    @property
+    def running(self) -> int:
+        return len(self._running)
+
+    def reserve(self, job_id: str, lane: str, client: str = ANONYMOUS_CLIENT, cost: float = 1.0):
+        """Claim a queue place for a job; raises QueueFullError if none is left."""
+        self.reserve_many({job_id: (lane, client, cost)})
+
+    def reserve_many(self, jobs: Dict[str, Tuple[str, str, float]]):
+        """
+        Claim queue places for all jobs, given as id to (lane, client, cost),
+        or, raising QueueFullError, for none.
+        """
+        if len(self._queued) + len(jobs) > self.max_queue:
+            self.rejected += 1
+            raise QueueFullError(self.retry_after())
+        for job_id, (lane, client, cost) in jobs.items():
+            self._enqueue(job_id, _QueuedJob(lane=lane, client=client, cost=max(cost, 1.0)))
+
+    def position(self, job_id: str) -> Optional[int]:
+        """
+        Estimated 1-based position of a waiting job in its lane, or None if
+        it is not queued. Counts the jobs of every client in the lane that
+        round robin would start first, ignoring differences in cost.
+        """
+        queued = self._queued.get(job_id)
+        if queued is None:
+            return None
+        clients = self._clients[queued.lane]
+        index = list(clients[queued.client]).index(job_id)
+        ahead = sum(
+            min(len(job_ids), index + 1)
+            for client, job_ids in clients.items() if client != queued.client
+        )
+        return index + ahead + 1
+
+    def retry_after(self) -> int:
+        """Rough number of seconds until the queue has room again."""
+        backlog = (len(self._queued) + len(self._running)) / max(1, self.max_concurrent)
+        return max(1, min(300, math.ceil(backlog * self.avg_job_seconds)))
+
+    def cancel(self, job_id: str):
+        """Drop a queued job that will never run."""
+        queued = self._dequeue(job_id)
+        if queued is not None and queued.future is not None and not queued.future.done():
+            queued.future.cancel()
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, job_id: str, lane: str) -> AsyncIterator[JobUsage]:
+        """
+        Wait for an execution slot, yielding the job's usage record.
+        Jobs that did not reserve a place queue in lane as ANONYMOUS_CLIENT.
+        """
+        queued = self._queued.get(job_id)
+        if queued is None:
+            queued = _QueuedJob(lane=lane, client=ANONYMOUS_CLIENT, cost=1.0)
+            self._enqueue(job_id, queued)
+        queued.future = asyncio.get_running_loop().create_future()
+        self._dispatch()
+        try:
+            await queued.future
+        except BaseException:
+            self._dequeue(job_id)
+            self._running.pop(job_id, None)
+            self._dispatch()
+            raise
+
+        usage = self._running[job_id]
+        try:
+            yield usage
+        finally:
+            self._sample(usage)
+            del self._running[job_id]
+            self._learn(usage)
+            self._dispatch()
+
+    async def monitor(self):
+        """Sample running jobs' memory and re-check admission periodically."""
+        while True:
+            await asyncio.sleep(self.sample_interval)
+            for usage in list(self._running.values()):
+                self._sample(usage)
+            self._dispatch()
+            self._forget_idle_clients()
+
+    def _enqueue(self, job_id: str, queued: _QueuedJob):
+        self._queued[job_id] = queued
+        self._clients[queued.lane].setdefault(queued.client, OrderedDict())[job_id] = None
+        self._client_stats.setdefault(queued.client, ClientStats()).last_seen = time.monotonic()
+
+    def _dequeue(self, job_id: str) -> Optional[_QueuedJob]:
+        queued = self._queued.pop(job_id, None)
+        if queued is None:
+            return None
+        clients = self._clients[queued.lane]
+        job_ids = clients[queued.client]
+        del job_ids[job_id]
+        if not job_ids:
+            # An idle client keeps no credit, as in deficit round robin
+            del clients[queued.client]
+            self._deficits[queued.lane].pop(queued.client, None)
+        return queued
+
+    def _has_memory_headroom(self) -> bool:
+        if not self._running:
+            return True  # Always let one job through so the queue cannot stall
+        if not self.memory_limit:
+            return True
+        usage = memory_usage_bytes()
+        if usage is None:
+            usage = sum(job.peak_rss_bytes for job in self._running.values())
+        return usage + self.job_memory_bytes <= self.memory_limit * MEMORY_HEADROOM
+
+    def _lane_running(self, lane: str) -> int:
+        return sum(1 for usage in self._running.values() if usage.lane == lane)
+
+    def _client_running(self, client: str) -> int:
+        return sum(1 for usage in self._running.values() if usage.client == client)
+
+    def _next_job(self, lane: str) -> Optional[str]:
+        """
+        Pick the job to start next in lane by deficit round robin, or None.
+        Its client keeps the turn; the caller charges the job's cost and
+        passes the turn on once the client's credit is used up.
+        """
+        clients = self._clients[lane]
+        deficits = self._deficits[lane]
+        # Each eligible client's first job that is waiting for its slot; jobs
+        # that have reserved a place but not started waiting yet are skipped
+        heads: Dict[str, str] = {}
+        for client, job_ids in clients.items():
+            if self.max_client_jobs and self._client_running(client) >= self.max_client_jobs:
+                continue
+            head = next((job_id for job_id in job_ids if self._queued[job_id].future is not None), None)
+            if head is not None:
+                heads[client] = head
+        if not heads:
+            return None
+
+        # Skip the rounds in which no client could afford its next job
+        rounds = min(
+            math.ceil((self._queued[head].cost - deficits.get(client, 0.0)) / FAIR_SHARE_QUANTUM)
+            for client, head in heads.items()
+        )
+        if rounds > 1:
+            for client in heads:
+                deficits[client] = deficits.get(client, 0.0) + (rounds - 1) * FAIR_SHARE_QUANTUM
+
+        while True:
+            client = next(iter(clients))
+            if client in heads:
+                cost = self._queued[heads[client]].cost
+                if deficits.get(client, 0.0) < cost:
+                    # A new turn for this client
+                    deficits[client] = deficits.get(client, 0.0) + FAIR_SHARE_QUANTUM
+                if deficits[client] >= cost:
+                    return heads[client]
+            clients.move_to_end(client)
+
+    def _end_turn_if_spent(self, lane: str, client: str):
+        """Pass the turn on once client cannot afford its next job in lane."""
+        job_ids = self._clients[lane].get(client)
+        if job_ids and self._deficits[lane].get(client, 0.0) < self._queued[next(iter(job_ids))].cost:
+            self._clients[lane].move_to_end(client)
+
+    def _dispatch(self):
+        """Grant slots to each lane's waiting jobs while capacity allows."""
+        for lane, max_concurrent in self.lanes.items():
+            while self._lane_running(lane) < max_concurrent:
+                job_id = self._next_job(lane)
+                if job_id is None:
+                    break
+                if not self._has_memory_headroom():
+                    return
+                queued = self._queued[job_id]
+                # The client keeps the turn while its credit lasts
+                deficits = self._deficits[lane]
+                deficits[queued.client] = deficits.get(queued.client, 0.0) - queued.cost
+                self._dequeue(job_id)
+                self._end_turn_if_spent(lane, queued.client)
+                if queued.future.done():
+                    continue
+                self._running[job_id] = JobUsage(lane=lane, client=queued.client)
+                self._record_wait(queued)
+                queued.future.set_result(None)
+
+    def _record_wait(self, queued: _QueuedJob):
+        stats = self._client_stats.setdefault(queued.client, ClientStats())
+        wait = time.monotonic() - queued.queued_at
+        stats.started += 1
+        stats.wait_seconds += wait
+        stats.max_wait_seconds = max(stats.max_wait_seconds, wait)
+        stats.last_seen = time.monotonic()
+
+    def _forget_idle_clients(self):
+        cutoff = time.monotonic() - CLIENT_STATS_TTL_SECONDS
+        busy = {queued.client for queued in self._queued.values()}
+        busy.update(usage.client for usage in self._running.values())
+        for client, stats in list(self._client_stats.items()):
+            if client not in busy and stats.last_seen < cutoff:
+                del self._client_stats[client]
+
+    def _sample(self, usage: JobUsage):
+        if usage.pids:
+            by_process = process_tree_rss_by_root(list(usage.pids))
+            for pid, rss in by_process.items():
+                if rss:
+                    usage.process_peaks[pid] = max(usage.process_peaks.get(pid, 0), rss)
+            usage.peak_rss_bytes = max(usage.peak_rss_bytes, sum(by_process.values()))
+
+    def _learn(self, usage: JobUsage):
+        duration = time.monotonic() - usage.started_at
+        self.avg_job_seconds += EWMA_ALPHA * (duration - self.avg_job_seconds)
+        if usage.peak_rss_bytes:
+            self.job_memory_bytes = int(
+                self.job_memory_bytes + EWMA_ALPHA * (usage.peak_rss_bytes - self.job_memory_bytes)
+            )
+
+    def client_stats(self) -> List[dict]:
+        """Queue depth, running jobs and queue wait times per client, busiest first."""
+        now = time.monotonic()
+        clients = []
+        for client, stats in self._client_stats.items():
+            waiting = [queued for queued in self._queued.values() if queued.client == client]
+            clients.append({
+                "client": client,
+                "queued": len(waiting),
+                "running": self._client_running(client),
+                "started": stats.started,
+                "avgWaitSeconds": stats.wait_seconds / stats.started if stats.started else 0.0,
+                "maxWaitSeconds": stats.max_wait_seconds,
+                # Wait of the client's longest queued job so far
+                "oldestQueuedSeconds": max((now - queued.queued_at for queued in waiting), default=0.0),
+            })
+        clients.sort(key=lambda entry: (entry["queued"] + entry["running"], entry["started"]), reverse=True)
+        return clients
+
+    def stats(self) -> dict:
+        return {
+            "maxConcurrent": self.max_concurrent,
+            "running": len(self._running),
+            "queued": self.queued,
+            "lanes": {
+                lane: {
+                    "maxConcurrent": max_concurrent,
+                    "running": self._lane_running(lane),
+                    "queued": sum(len(job_ids) for job_ids in self._clients[lane].values()),
+                    "clients": len(self._clients[lane]),
+                }
+                for lane, max_concurrent in self.lanes.items()
+            },
+            "maxQueue": self.max_queue,
+            "maxClientJobs": self.max_client_jobs,
+            "rejected": self.rejected,
+            "jobMemoryBytes": self.job_memory_bytes,
+        }
@@ -0,0 +1,346 @@
+"""
+Incremental FreeCAD import backed by a cache of subtree B-Reps.
+Each subtree of the CSG tree is addressed by a hash of its canonical text.
+Boolean results are stored as .brep files, so re-converting an edited model
+only recomputes the branches that changed.
+Runs inside FreeCAD (see freecad_job.py); prune_cache() is also used by the service.
+"""
+import os
+import ast
+import hashlib
+from typing import Dict, List, Optional
+
+from csg import NON_RENDERED_MODIFIERS, CsgNode, CsgParseError, node_dimension, parse_csg
+
+
+# Bump whenever assembly changes the shapes it produces, so that older
+# cache entries are not reused
+SUBTREE_CACHE_VERSION = "3"
+
+# Nodes assembled here from their children's shapes; everything else goes
+# through importCSG as a whole subtree. Like importCSG, passthrough nodes hand
+# their children's shapes on to their parent unfused.
+BOOLEAN_NODES = {'union', 'group', 'difference', 'intersection'}
+PASSTHROUGH_NODES = {'color', 'render'}
+ASSEMBLED_NODES = BOOLEAN_NODES | PASSTHROUGH_NODES | {'multmatrix'}
+
+# Imported subtrees that are cheaper to rebuild than to read back
+CHEAP_NODES = {'cube', 'sphere', 'cylinder'}
+# Nodes whose output depends on files outside the CSG text
+FILE_NODES = {'import', 'surface'}
+
+TOLERANCE = 1e-9
+
+
+def _rendered(children: List[CsgNode]) -> List[CsgNode]:
+    return [
+        child for child in children
+        if not any(m in child.modifier for m in NON_RENDERED_MODIFIERS)
+    ]
+
+
+def _matrix(node: CsgNode):
+    """Parse a multmatrix node's 4x4 matrix; None if it is not plain numbers."""
+    try:
+        rows = ast.literal_eval(node.args)
+        values = [float(value) for row in rows for value in row]
+    except (ValueError, TypeError, SyntaxError):
+        return None
+    if len(rows) != 4 or len(values) != 16:
+        return None
+    return values
+
+
+def _is_rigid(values: List[float]) -> bool:
+    """Whether the matrix only rotates and translates, i.e. keeps geometry exact."""
+    columns = [values[i::4][:3] for i in range(3)]
+    for i in range(3):
+        for j in range(3):
+            dot = sum(a * b for a, b in zip(columns[i], columns[j]))
+            if abs(dot - (1.0 if i == j else 0.0)) > TOLERANCE:
+                return False
+    a, b, c = columns
+    determinant = (
+        a[0] * (b[1] * c[2] - b[2] * c[1])
+        - a[1] * (b[0] * c[2] - b[2] * c[0])
+        + a[2] * (b[0] * c[1] - b[1] * c[0])
+    )
+    return determinant > 0
+
+
+class SubtreeCache:
+    """Directory of B-Rep files named after subtree hashes."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.reused = 0
+        self.stored = 0
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.brep")
+
+    def __contains__(self, key: str) -> bool:
+        return os.path.exists(self.path(key))
+
+    def load(self, key: str):
+        import Part
+
+        path = self.path(key)
+        shape = Part.Shape()
+        shape.read(path)
+        # Refresh modification time so prune_cache() sees this entry as recently used
+        os.utime(path)
+        self.reused += 1
+        return shape
+
+    def store(self, key: str, shape):
+        path = self.path(key)
+        if os.path.exists(path):
+            return
+        # Per-process temp name; workers may store the same subtree at once
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            shape.exportBrep(tmp_path)
+            os.replace(tmp_path, path)
+            self.stored += 1
+        except Exception as e:
+            print(f"WARNING: Failed to store subtree {key}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+
+class _Builder:
+    """Builds the shapes of one CSG tree, reusing cached subtrees."""
+
+    def __init__(self, cache: SubtreeCache, salt: str, scratch_dir: str):
+        self.cache = cache
+        self.salt = salt
+        self.scratch_dir = scratch_dir
+        self.keys: Dict[int, str] = {}
+        self._assembled: Dict[int, bool] = {}
+        self._dimensions: Dict[int, Optional[int]] = {}
+        self._reads_files: Dict[int, bool] = {}
+        # Shapes each subtree leaves at its level, as importCSG's object lists
+        self.shapes: Dict[str, list] = {}
+        # Subtrees importCSG has to evaluate, and their shapes once it has
+        self.imports: Dict[str, CsgNode] = {}
+        self.imported: Dict[str, list] = {}
+
+    def key(self, node: CsgNode) -> str:
+        """Hash a subtree from its own text and its children's hashes."""
+        key = self.keys.get(id(node))
+        if key is None:
+            digest = hashlib.sha256(self.salt.encode('utf-8'))
+            digest.update(f"{node.modifier}{node.name}({node.args})".encode('utf-8'))
+            for child in node.children:
+                digest.update(self.key(child).encode('ascii'))
+            key = digest.hexdigest()
+            self.keys[id(node)] = key
+        return key
+
+    def assembled(self, node: CsgNode) -> bool:
+        assembled = self._assembled.get(id(node))
+        if assembled is None:
+            assembled = (
+                node.name in ASSEMBLED_NODES
+                and '!' not in node.modifier
+                and (node.name != 'multmatrix' or _matrix(node) is not None)
+                and all(
+                    node_dimension(child, self._dimensions) == 3 for child in _rendered(node.children)
+                )
+            )
+            self._assembled[id(node)] = assembled
+        return assembled
+
+    def reads_files(self, node: CsgNode) -> bool:
+        """Whether a subtree contains a node reading files outside the CSG text."""
+        reads = self._reads_files.get(id(node))
+        if reads is None:
+            reads = node.name in FILE_NODES or any(self.reads_files(child) for child in node.children)
+            self._reads_files[id(node)] = reads
+        return reads
+
+    def cacheable(self, node: CsgNode) -> bool:
+        if self.assembled(node):
+            return node.name in BOOLEAN_NODES and len(_rendered(node.children)) > 1
+        if node.name in CHEAP_NODES:
+            return False
+        return not self.reads_files(node)
+
+    def plan(self, node: CsgNode):
+        """Find the subtrees that are neither cached nor assembled here."""
+        key = self.key(node)
+        if key in self.shapes or key in self.imports:
+            return
+        if self.cacheable(node) and key in self.cache:
+            self.shapes[key] = [self.cache.load(key)]
+        elif self.assembled(node):
+            for child in _rendered(node.children):
+                self.plan(child)
+        else:
+            self.imports[key] = node
+
+    def build(self, node: CsgNode) -> list:
+        """The shapes a subtree leaves at its level."""
+        key = self.key(node)
+        if key not in self.shapes:
+            if self.assembled(node):
+                children = [shape for child in _rendered(node.children) for shape in self.build(child)]
+                shapes = _combine(node, children)
+            else:
+                shapes = self.imported[key]
+            if len(shapes) == 1 and self.cacheable(node):
+                self.cache.store(key, shapes[0])
+            self.shapes[key] = shapes
+        return self.shapes[key]
+
+    def run_imports(self):
+        """
+        Evaluate every planned subtree with importCSG.
+
+        They are imported together from one file and matched to its root
+        objects in order; if the counts disagree, e.g. because a subtree
+        produced nothing, each is imported on its own.
+        """
+        if not self.imports:
+            return
+        keys = list(self.imports)
+        shapes = _import_subtrees(self.scratch_dir, [self.imports[key] for key in keys])
+        if len(shapes) == len(keys):
+            self.imported = {key: [shape] for key, shape in zip(keys, shapes)}
+            return
+        for key in keys:
+            self.imported[key] = _import_subtrees(self.scratch_dir, [self.imports[key]])
+
+
+def root_shapes(doc) -> list:
+    """
+    Shapes of the objects importCSG left at the top of doc. Their children
+    are already part of them, so every import path exports just these.
+    """
+    return [
+        obj.Shape for obj in doc.Objects
+        if not obj.InList and hasattr(obj, 'Shape') and not obj.Shape.isNull()
+    ]
+
+
+def _import_subtrees(scratch_dir: str, nodes: List[CsgNode]) -> list:
+    """Import nodes as top-level statements of one CSG file; returns the root shapes."""
+    import FreeCAD
+    import importCSG
+
+    path = os.path.join(scratch_dir, "subtrees.csg")
+    with open(path, 'w', encoding='utf-8') as f:
+        for node in nodes:
+            f.write(node.to_csg() + "\n")
+
+    doc = FreeCAD.newDocument("SubtreeDoc")
+    try:
+        importCSG.insert(path, doc.Name)
+        return [shape.copy() for shape in root_shapes(doc)]
+    finally:
+        FreeCAD.closeDocument(doc.Name)
+
+
+def _fuse(shapes: list):
+    return shapes[0] if len(shapes) == 1 else shapes[0].multiFuse(shapes[1:])
+
+
+def _combine(node: CsgNode, shapes: list) -> list:
+    """
+    Apply an assembled node to the shapes its children left, as importCSG
+    does to its list of child objects: passthrough nodes return them as they
+    are, the others combine them into one.
+    """
+    if node.name in PASSTHROUGH_NODES or not shapes:
+        return shapes
+
+    if node.name == 'difference':
+        # The first shape is cut by all others
+        if len(shapes) == 1:
+            return shapes
+        return [shapes[0].cut(_fuse(shapes[1:]))]
+
+    if node.name == 'intersection':
+        result = shapes[0]
+        for shape in shapes[1:]:
+            result = result.common(shape)
+        return [result]
+
+    shape = _fuse(shapes)
+    if node.name == 'multmatrix':
+        values = _matrix(node)
+        if values == [1.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0, 1.0]:
+            return [shape]
+        import FreeCAD
+
+        matrix = FreeCAD.Matrix(*values)
+        if not _is_rigid(values):
+            return [shape.transformGeometry(matrix)]
+        shape = shape.copy()
+        shape.transformShape(matrix)
+    return [shape]
+
+
+def import_shapes(import_path: str, directory: str) -> Optional[list]:
+    """
+    Build the top-level shapes of a CSG file, reusing cached subtrees.
+
+    Returns None if the file cannot be parsed here, leaving the import to
+    importCSG.
+    """
+    import FreeCAD
+
+    try:
+        with open(import_path, encoding='utf-8') as f:
+            nodes = _rendered(parse_csg(f.read()))
+    except (OSError, CsgParseError) as e:
+        print(f"WARNING: Subtree cache skipped: {e}")
+        return None
+    if any('!' in node.to_csg() for node in nodes):
+        # A root modifier changes what the whole file renders
+        return None
+
+    cache = SubtreeCache(directory)
+    salt = f"{SUBTREE_CACHE_VERSION}:{'.'.join(FreeCAD.Version()[:3])}:"
+    builder = _Builder(cache, salt, os.path.dirname(import_path))
+    for node in nodes:
+        builder.plan(node)
+    builder.run_imports()
+    shapes = [shape for node in nodes for shape in builder.build(node)]
+    print(
+        f"Subtree cache: {cache.reused} reused, {len(builder.imports)} imported, "
+        f"{cache.stored} stored"
+    )
+    return shapes
+
+
+def prune_cache(directory: str, max_bytes: int) -> int:
+    """Remove least recently used entries until under max_bytes; returns the number removed."""
+    entries = []
+    for root, _dirs, files in os.walk(directory):
+        for name in files:
+            if not name.endswith(".brep"):
+                continue
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _mtime, size, _path in entries)
+    removed = 0
+    for _mtime, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+            removed += 1
+        except OSError:
+            pass
+    return removed
@@ -0,0 +1,87 @@
+"""
+Streaming ZIP archives: what iter_zip yields, joined, is an archive that
+zipfile reads back with the same names, contents and CRCs, including the
+errors.txt listing the items of a batch that did not complete.
+"""
+import io
+import os
+import zipfile
+import zlib
+
+from archive import iter_zip, unique_name
+
+
+def chunks(*parts: bytes):
+    return lambda: iter(parts)
+
+
+def read_archive(data: bytes) -> zipfile.ZipFile:
+    archive = zipfile.ZipFile(io.BytesIO(data))
+    assert archive.testzip() is None
+    return archive
+
+
+def test_archive_round_trips():
+    step = b"ISO-10303-21;\n" + b"DATA;\n" * 10000 + b"END-ISO-10303-21;\n"
+    noise = os.urandom(300 * 1024)
+    names = set()
+    entries = [
+        (unique_name("part.step", names), chunks(step[:1000], step[1000:])),
+        (unique_name("part.step", names), chunks(step)),
+        (unique_name("part.stl", names), chunks(noise[:100 * 1024], noise[100 * 1024:])),
+        (unique_name("empty.step", names), chunks()),
+        (unique_name("errors.txt", names), chunks(b"broken: Conversion error: syntax error\n")),
+    ]
+
+    archive = read_archive(b"".join(iter_zip(entries)))
+
+    assert archive.namelist() == ["part.step", "part-2.step", "part.stl", "empty.step", "errors.txt"]
+    expected = {
+        "part.step": step,
+        "part-2.step": step,
+        "part.stl": noise,
+        "empty.step": b"",
+        "errors.txt": b"broken: Conversion error: syntax error\n",
+    }
+    for info in archive.infolist():
+        assert info.compress_type == zipfile.ZIP_DEFLATED
+        assert archive.read(info) == expected[info.filename]
+        assert info.CRC == zlib.crc32(expected[info.filename])
+        assert info.file_size == len(expected[info.filename])
+    # Repetitive STEP text compresses well
+    assert archive.getinfo("part.step").compress_size < len(step) // 10
+
+
+def test_archive_streams_entries_lazily():
+    opened = []
+
+    def entry(name: str):
+        def read():
+            opened.append(name)
+            yield name.encode('utf-8') * 1000
+        return read
+
+    stream = iter_zip([(name, entry(name)) for name in ("a.step", "b.step")])
+    first = next(stream)
+
+    assert opened == ["a.step"]
+    archive = read_archive(first + b"".join(stream))
+    assert opened == ["a.step", "b.step"]
+    assert archive.read("b.step") == b"b.step" * 1000
+
+
+def test_errors_only_archive():
+    report = b"first: Job not found or expired\nsecond: Conversion timed out\n"
+
+    archive = read_archive(b"".join(iter_zip([("errors.txt", chunks(report))])))
+
+    assert archive.namelist() == ["errors.txt"]
+    assert archive.read("errors.txt") == report
+
+
+def test_unique_name():
+    names = set()
+
+    assert [unique_name(name, names) for name in ("a.step", "a.step", "a.step", "README", "README")] == [
+        "a.step", "a-2.step", "a-3.step", "README", "README-2"
+    ]
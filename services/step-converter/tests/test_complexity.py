@@ -0,0 +1,58 @@
+"""
+Static complexity estimates and the lane they route representative
+OpenSCAD snippets to: small primitives stay in the fast lane, while high
+resolutions and minkowski or hull nested in loops go to the heavy lane.
+"""
+import pytest
+
+from complexity import FAST_LANE, HEAVY_LANE, estimate_complexity
+from quality import DRAFT
+
+
+# Default HEAVY_COMPLEXITY_SCORE of main.py
+HEAVY_SCORE = 200
+
+
+@pytest.mark.parametrize("code, lane", [
+    ("cube(10);", FAST_LANE),
+    ("cube(10);\ntranslate([20, 0, 0]) sphere(5);\ncylinder(h=10, r=3);", FAST_LANE),
+    ("for (i = [0:4]) translate([i * 10, 0, 0]) cube(5);", FAST_LANE),
+    ("minkowski() { cube(10); sphere(1); }", FAST_LANE),
+    # Resolution costs linearly for cylinders but quadratically for spheres
+    ("cylinder(h=10, r=3, $fn=256);", FAST_LANE),
+    ("sphere(10, $fn=512);", HEAVY_LANE),
+    ("$fa = 1;\nsphere(10);", HEAVY_LANE),
+    ("for (i = [0:99]) hull() { translate([i, 0, 0]) cube(1); sphere(2); }", HEAVY_LANE),
+    ("for (i = [0:9]) for (j = [0:9]) minkowski() { cube(1); sphere(1); }", HEAVY_LANE),
+    ("for (i = [0:9]) {\n  for (j = [0:9]) {\n    minkowski() { cube(1); sphere(1); }\n  }\n}", HEAVY_LANE),
+])
+def test_lane(code, lane):
+    assert estimate_complexity(code).lane(HEAVY_SCORE) == lane
+
+
+@pytest.mark.parametrize("code, expected", [
+    ("cube(10);", dict(score=1.0, loop_iterations=1, fragments=30.0)),
+    ("sphere(10, $fn=512);", dict(fragments=512.0)),
+    ("$fn = 200;\nsphere(10);", dict(fragments=200.0)),
+    ("// $fn = 500;\nsphere(10);", dict(score=2.0, fragments=30.0)),
+    ('echo("$fn = 500");\nsphere(10);', dict(score=2.0, fragments=30.0)),
+    ("for (i = [0:9]) for (j = [0:9]) minkowski() { cube(1); sphere(1); }",
+     dict(minkowski=1, loop_iterations=100)),
+    ("for (i = [0:99]) hull() cube(1);", dict(hull=1, loop_iterations=100)),
+    ("for (i = [0:9]) cube(1);\nsphere(1);", dict(score=12.0, loop_iterations=10)),
+    ("include <BOSL2/std.scad>\npath_sweep(circle(1), [[0, 0, 0], [0, 0, 10]]);", dict(sweeps=1)),
+    # A module body counts once, however often it is instantiated
+    ("module m() { minkowski() { cube(1); sphere(1); } }\nfor (i = [0:99]) m();",
+     dict(score=103.0, minkowski=1)),
+])
+def test_estimate(code, expected):
+    estimate = estimate_complexity(code)
+
+    assert {name: getattr(estimate, name) for name in expected} == expected
+
+
+def test_quality_caps_resolution():
+    estimate = estimate_complexity("sphere(10, $fn=512);", quality=DRAFT)
+
+    assert estimate.fragments == 30.0
+    assert estimate.lane(HEAVY_SCORE) == FAST_LANE
@@ -0,0 +1,65 @@
+"""
+End-to-end conversions through the stand-in openscad and freecadcmd of
+bench/stub, covering both pipelines with multi-file projects.
+"""
+import asyncio
+import os
+
+import pytest
+
+import converter
+
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STUB_BIN_DIR = os.path.join(SERVICE_DIR, "bench", "stub", "bin")
+
+
+@pytest.fixture(autouse=True)
+def stub_toolchain(monkeypatch):
+    monkeypatch.setenv("PATH", STUB_BIN_DIR + os.pathsep + os.environ["PATH"])
+    monkeypatch.setenv("BENCH_STUB_OPENSCAD_SECONDS", "0")
+    monkeypatch.setenv("BENCH_STUB_FREECAD_STARTUP_SECONDS", "0")
+    monkeypatch.setenv("BENCH_STUB_FREECAD_SECONDS", "0")
+
+
+@pytest.fixture
+def project_files(tmp_path):
+    part = tmp_path / "box.scad"
+    part.write_text("module box() { cube([10, 10, 10]); }\n")
+    return {"parts/box.scad": str(part)}
+
+
+@pytest.mark.parametrize("pipeline", ["single", "two_pass"])
+def test_project_include_converts(pipeline, project_files):
+    artifacts, error = asyncio.run(converter.convert_scad_async(
+        "include <parts/box.scad>\nbox();\n", pipeline=pipeline, files=project_files
+    ))
+
+    assert error is None
+    assert artifacts[converter.STEP].startswith(b"ISO-10303-21;")
+
+
+@pytest.mark.parametrize("pipeline", ["single", "two_pass"])
+def test_missing_include_fails(pipeline):
+    artifacts, error = asyncio.run(converter.convert_scad_async(
+        "include <parts/box.scad>\nbox();\n", pipeline=pipeline
+    ))
+
+    assert artifacts == {}
+    assert error
+
+
+def test_profiled_conversion_succeeds():
+    profiles = []
+
+    artifacts, error = asyncio.run(converter.convert_scad_async(
+        "cube(1);\n", on_profile=lambda profile, stats: profiles.append((profile, stats))
+    ))
+
+    assert error is None
+    assert artifacts[converter.STEP].startswith(b"ISO-10303-21;")
+    [(profile, stats)] = profiles
+    objects = profile["freecad"]["objects"]
+    assert objects and all("error" not in entry for entry in objects)
+    assert objects[0]["type"] == "Part::Feature"
+    assert stats
@@ -0,0 +1,52 @@
+"""
+Warm FreeCAD worker pool, run against the stand-in freecadcmd of bench/stub:
+worn-out workers are replaced in the background, without holding up the
+job that wore them out.
+"""
+import asyncio
+import os
+import time
+
+import pytest
+
+import converter
+from freecad_pool import FreeCADPool, convert_scad_pooled
+
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STUB_BIN_DIR = os.path.join(SERVICE_DIR, "bench", "stub", "bin")
+# Start-up time of replacement workers, well above a stub job's run time
+SLOW_STARTUP_SECONDS = 2.0
+
+
+@pytest.fixture(autouse=True)
+def stub_toolchain(monkeypatch):
+    monkeypatch.setenv("PATH", STUB_BIN_DIR + os.pathsep + os.environ["PATH"])
+    monkeypatch.setenv("BENCH_STUB_OPENSCAD_SECONDS", "0")
+    monkeypatch.setenv("BENCH_STUB_FREECAD_STARTUP_SECONDS", "0")
+    monkeypatch.setenv("BENCH_STUB_FREECAD_SECONDS", "0")
+
+
+def test_recycling_does_not_delay_the_result(monkeypatch):
+    async def scenario():
+        pool = FreeCADPool(size=1, max_jobs_per_worker=1, max_rss_bytes=2 ** 40)
+        await pool.start()
+        try:
+            monkeypatch.setenv("BENCH_STUB_FREECAD_STARTUP_SECONDS", str(SLOW_STARTUP_SECONDS))
+            started = time.monotonic()
+            artifacts, error = await convert_scad_pooled(pool, "cube(1);")
+            elapsed = time.monotonic() - started
+
+            assert error is None
+            assert artifacts[converter.STEP]
+            assert elapsed < SLOW_STARTUP_SECONDS
+
+            # The next job gets the replacement once it has started
+            artifacts, error = await convert_scad_pooled(pool, "cube(2);")
+            assert error is None
+            assert pool.recycled == 1
+            assert pool.stats()["size"] == 1
+        finally:
+            await pool.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,77 @@
+"""
+JobRegistry bookkeeping: a result shared by several jobs counts once
+towards the stored bytes until the last of them goes, jobs expire after
+their TTL, and eviction hands out the jobs whose results were stored first.
+"""
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+from job_registry import JobRegistry
+
+
+@dataclass
+class FakeJob:
+    id: str
+    status: str = "pending"
+    stored_sizes: Dict[str, int] = field(default_factory=dict)
+    result_owners: Dict[str, str] = field(default_factory=dict)
+
+
+def complete(registry: JobRegistry, job: FakeJob, sizes: Dict[str, int], owner: Optional[str] = None):
+    job.status = "completed"
+    job.stored_sizes = dict(sizes)
+    if owner:
+        job.result_owners = {fmt: owner for fmt in sizes}
+    registry.update(job)
+
+
+def test_shared_result_counts_once_and_both_jobs_expire():
+    registry = JobRegistry(ttl_seconds=0.05)
+    leader, follower = FakeJob("leader"), FakeJob("follower")
+    registry.add(leader)
+    registry.add(follower)
+
+    complete(registry, leader, {"step": 1000, "stl": 200})
+    complete(registry, follower, {"step": 1000, "stl": 200}, owner="leader")
+
+    assert registry.result_bytes == 1200
+    assert registry.count("completed") == 2
+    assert registry.expire() == []
+
+    time.sleep(0.1)
+    expired = registry.expire()
+
+    assert sorted(job.id for job in expired) == ["follower", "leader"]
+    assert registry.result_bytes == 0
+    assert registry.count("completed") == 0
+    assert "leader" not in registry and "follower" not in registry
+
+
+def test_shared_result_is_counted_until_the_last_job_is_removed():
+    registry = JobRegistry(ttl_seconds=300)
+    leader, follower = FakeJob("leader"), FakeJob("follower")
+    registry.add(leader)
+    registry.add(follower)
+    complete(registry, leader, {"step": 1000})
+    complete(registry, follower, {"step": 1000}, owner="leader")
+
+    registry.remove("leader")
+    assert registry.result_bytes == 1000
+
+    registry.remove("follower")
+    assert registry.result_bytes == 0
+
+
+def test_evict_removes_oldest_results_first():
+    registry = JobRegistry(ttl_seconds=300, max_result_bytes=2500)
+    for job_id in ("a", "b", "c"):
+        job = FakeJob(job_id)
+        registry.add(job)
+        complete(registry, job, {"step": 1000})
+
+    evicted = registry.evict()
+
+    assert [job.id for job in evicted] == ["a"]
+    assert registry.result_bytes == 2000
+    assert registry.evict() == []
@@ -0,0 +1,143 @@
+"""
+Job store behaviour shared by the SQLite and Redis backends: records survive
+a round trip, status transitions only apply to the statuses they expect, and
+expiry hands each expired record out once.
+"""
+import pytest
+
+import job_store
+
+
+CREATED_AT = "2026-01-01T12:00:00"
+EXPIRY_CUTOFF = "2026-01-01T13:00:00"
+LATER = "2026-01-01T14:00:00"
+
+
+@pytest.fixture(params=["sqlite", "redis"])
+def store(request, tmp_path, monkeypatch):
+    if request.param == "sqlite":
+        store = job_store.SqliteJobStore(str(tmp_path / "jobs.sqlite"))
+    else:
+        fakeredis = pytest.importorskip("fakeredis")
+        server = fakeredis.FakeServer()
+        monkeypatch.setattr(
+            job_store.redis.Redis,
+            "from_url",
+            lambda url, **kwargs: fakeredis.FakeRedis(server=server, **kwargs)
+        )
+        store = job_store.RedisJobStore("redis://localhost:6379/0")
+    yield store
+    store.close()
+
+
+def job(job_id: str, created_at: str = CREATED_AT, **fields) -> dict:
+    return {"id": job_id, "status": job_store.PENDING, "created_at": created_at, **fields}
+
+
+def test_create_and_get(store):
+    store.create(job("a", filename="part"))
+
+    assert store.get("a") == job("a", filename="part")
+    assert store.get("missing") is None
+
+
+def test_get_many_keeps_order_and_marks_missing(store):
+    store.create(job("a"))
+    store.create(job("b"))
+
+    records = store.get_many(["b", "missing", "a"])
+
+    assert [record and record["id"] for record in records] == ["b", None, "a"]
+    assert store.get_many([]) == []
+
+
+def test_get_many_reads_beyond_one_query(store):
+    job_ids = [f"job-{index}" for index in range(job_store.SQLITE_MAX_QUERY_IDS + 1)]
+    for job_id in job_ids:
+        store.create(job(job_id))
+
+    assert [record["id"] for record in store.get_many(job_ids)] == job_ids
+
+
+def test_delete(store):
+    store.create(job("a"))
+    store.delete("a")
+
+    assert store.get("a") is None
+
+
+def test_claim_moves_pending_to_processing(store):
+    store.create(job("a"))
+
+    assert store.claim("a")
+    assert store.get("a")["status"] == job_store.PROCESSING
+    # Only one worker may pick a job up
+    assert not store.claim("a")
+
+
+def test_claim_fails_for_cancelled_and_missing_jobs(store):
+    store.create(job("a"))
+    store.complete("a", {"status": "cancelled"})
+
+    assert not store.claim("a")
+    assert store.get("a")["status"] == "cancelled"
+    assert not store.claim("missing")
+
+
+def test_update_applies_until_finished(store):
+    store.create(job("a"))
+    store.claim("a")
+
+    assert store.update("a", {"progress": "exporting"})
+    assert store.get("a")["progress"] == "exporting"
+
+    store.complete("a", {"status": "completed"})
+    assert not store.update("a", {"progress": "late"})
+    assert store.get("a")["progress"] == "exporting"
+
+
+def test_complete_does_not_overwrite_cancelled(store):
+    store.create(job("a"))
+    store.claim("a")
+
+    assert store.complete("a", {"status": "cancelled"})
+    assert not store.complete("a", {"status": "completed", "size": 10})
+
+    record = store.get("a")
+    assert record["status"] == "cancelled"
+    assert "size" not in record
+
+
+def test_batches_round_trip(store):
+    batch = {"id": "b", "created_at": CREATED_AT, "jobs": ["a"]}
+    store.put_batch(batch)
+
+    assert store.get_batch("b") == batch
+    assert store.get_batch("missing") is None
+
+
+def test_delete_expired_removes_old_records_once(store):
+    store.create(job("old"))
+    store.create(job("new", created_at=LATER))
+    store.put_batch({"id": "old-batch", "created_at": CREATED_AT})
+    store.put_batch({"id": "new-batch", "created_at": LATER})
+
+    expired = store.delete_expired(EXPIRY_CUTOFF)
+
+    assert [record["id"] for record in expired] == ["old"]
+    assert store.get("old") is None
+    assert store.get("new") is not None
+    assert store.get_batch("old-batch") is None
+    assert store.get_batch("new-batch") is not None
+    assert store.delete_expired(EXPIRY_CUTOFF) == []
+
+
+def test_delete_expired_returns_final_record(store):
+    store.create(job("a"))
+    store.claim("a")
+    store.complete("a", {"status": "completed", "formats": ["step"]})
+
+    (record,) = store.delete_expired(EXPIRY_CUTOFF)
+
+    assert record["status"] == "completed"
+    assert record["formats"] == ["step"]
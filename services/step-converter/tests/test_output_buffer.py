@@ -0,0 +1,83 @@
+"""
+Bounded output capture: OutputBuffer keeps only the end of what is written
+to it, and run_process_async hands stderr lines longer than the buffer to
+watch_line in pieces without failing the run.
+"""
+import asyncio
+import sys
+
+import converter
+from output_buffer import OutputBuffer
+
+
+def test_line_longer_than_buffer_is_truncated():
+    buffer = OutputBuffer(max_chars=100)
+
+    buffer.write("x" * 1000 + "\n")
+    buffer.write("ERROR: last line\n")
+
+    assert buffer.truncated
+    # The partial first line is dropped, the complete last line is kept
+    assert buffer.getvalue() == "ERROR: last line\n"
+
+
+def test_single_line_longer_than_buffer_keeps_its_end():
+    buffer = OutputBuffer(max_chars=100)
+
+    buffer.write("x" * 1000 + "end")
+
+    assert buffer.truncated
+    assert buffer.getvalue() == "x" * 97 + "end"
+
+
+def test_feed_decodes_across_chunk_borders():
+    buffer = OutputBuffer()
+    data = "größe: 10mm\n".encode('utf-8')
+
+    for index in range(len(data)):
+        buffer.feed(data[index:index + 1])
+
+    assert not buffer.truncated
+    assert buffer.getvalue() == "größe: 10mm\n"
+
+
+def write_stderr(*parts: str) -> list:
+    script = "import sys\n" + "".join(f"sys.stderr.write({part})\n" for part in parts)
+    return [sys.executable, "-c", script]
+
+
+def test_long_stderr_line_does_not_fail_the_run(tmp_path):
+    line_bytes = 3 * converter.MAX_OUTPUT_LINE_BYTES
+    pieces = []
+
+    def watch_line(line: str) -> bool:
+        pieces.append(len(line))
+        return converter.is_openscad_fatal_line(line)
+
+    result = asyncio.run(converter.run_process_async(
+        write_stderr(f"'ECHO: ' + 'x' * {line_bytes} + '\\n'", "'done\\n'"),
+        timeout=30, cwd=str(tmp_path), watch_line=watch_line
+    ))
+
+    assert result.returncode == 0
+    # Only the end of the output is kept, from the first whole line on
+    assert result.stderr == "done\n"
+    # The long line reached watch_line in bounded pieces, all of it
+    assert len(pieces) > 2
+    assert max(pieces) <= converter.MAX_OUTPUT_LINE_BYTES + converter.PIPE_CHUNK_BYTES
+    assert sum(pieces) == len("ECHO: ") + line_bytes + 1 + len("done\n")
+
+
+def test_fatal_line_after_long_line_is_detected(tmp_path):
+    result = asyncio.run(converter.run_process_async(
+        write_stderr(
+            f"'x' * {2 * converter.MAX_OUTPUT_LINE_BYTES} + '\\n'",
+            "'ERROR: Parser error\\n'",
+            "sys.stderr.flush()",
+            "__import__('time').sleep(30)",
+        ),
+        timeout=30, cwd=str(tmp_path), watch_line=converter.is_openscad_fatal_line
+    ))
+
+    assert result.returncode != 0
+    assert result.stderr.endswith("ERROR: Parser error\n")
@@ -0,0 +1,57 @@
+"""
+apply_quality rewrites the $fn, $fa and $fs assignments of submitted code:
+exact leaves code alone, draft and normal clamp every assignment, and text
+in comments, strings and library paths is never touched.
+"""
+import pytest
+
+from quality import DRAFT, EXACT, NORMAL, apply_quality
+
+
+CODE = """\
+$fn = 256;
+module part(r = 5, $fa = 1) {
+    sphere(r, $fn=512);
+}
+part($fs = 0.01);
+"""
+
+
+def test_exact_leaves_code_unchanged():
+    assert apply_quality(CODE, EXACT) == CODE
+
+
+@pytest.mark.parametrize("code, expected", [
+    ("sphere(10, $fn=512);", "sphere(10, $fn=min(32, (512)));"),
+    ("$fn = 256;", "$fn = min(32, (256));"),
+    ("cylinder(r=1, h=2, $fn = 2 * (64 + 1));", "cylinder(r=1, h=2, $fn = min(32, (2 * (64 + 1))));"),
+    ("$fa = 1; $fs = 0.01;", "$fa = max(12, (1)); $fs = max(2, (0.01));"),
+    ("let ($fn = 100) circle(1);", "let ($fn = min(32, (100))) circle(1);"),
+    ("module m(r, $fn = 64) circle(r);", "module m(r, $fn = min(32, (64))) circle(r);"),
+    ("if ($fn == 0) cube(1);", "if ($fn == 0) cube(1);"),
+])
+def test_draft_clamps_assignments(code, expected):
+    assert apply_quality(code, DRAFT) == expected
+
+
+def test_normal_clamps_to_its_own_limits():
+    assert apply_quality("sphere(10, $fn=512);", NORMAL) == "sphere(10, $fn=min(128, (512)));"
+
+
+@pytest.mark.parametrize("code", [
+    "// $fn = 512;\nsphere(10);\n",
+    "/* sphere(10, $fn = 512); */\ncube(1);\n",
+    'echo("$fn = 512");\ncube(1);\n',
+    'text("a \\" $fn = 512");\n',
+    "include <lib/$fn = 512.scad>\ncube(1);\n",
+])
+def test_comments_strings_and_paths_are_not_rewritten(code):
+    assert apply_quality(code, DRAFT) == code
+
+
+def test_assignment_after_comment_is_still_clamped():
+    code = 'echo("$fn = 1"); // $fn = 2\nsphere(1, $fn /* fine */ = 512);'
+
+    assert apply_quality(code, DRAFT) == (
+        'echo("$fn = 1"); // $fn = 2\nsphere(1, $fn /* fine */ = min(32, (512)));'
+    )
@@ -0,0 +1,67 @@
+"""
+Result cache tiers: entries round-trip through memory and disk, the disk
+tier stays within its budget least recently used first, and its index is
+rebuilt from the files on start.
+"""
+import os
+
+import result_cache
+from result_cache import ResultCache
+
+
+def disk_files(directory) -> list:
+    return sorted(name for _root, _dirs, files in os.walk(directory) for name in files)
+
+
+def test_memory_tier_round_trip():
+    cache = ResultCache(max_memory_bytes=1024)
+    cache.put("aa1", b"solid")
+
+    assert cache.get("aa1") == b"solid"
+    assert cache.get("missing") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_get_many_needs_every_key():
+    cache = ResultCache(max_memory_bytes=1024)
+    cache.put("aa1", b"step")
+    cache.put("aa2", b"stl")
+
+    assert cache.get_many(["aa1", "aa2"]) == [b"step", b"stl"]
+    assert cache.get_many(["aa1", "aa3"]) is None
+
+
+def test_disk_entries_use_a_neutral_suffix(tmp_path):
+    cache = ResultCache(max_memory_bytes=0, disk_dir=str(tmp_path), max_disk_bytes=1024)
+    cache.put("aa1", b"glTF")
+
+    assert disk_files(tmp_path) == ["aa1" + result_cache.DISK_SUFFIX]
+    assert cache.get("aa1") == b"glTF"
+
+
+def test_disk_tier_evicts_least_recently_used(tmp_path):
+    cache = ResultCache(max_memory_bytes=0, disk_dir=str(tmp_path), max_disk_bytes=10)
+    cache.put("aa1", b"1234")
+    cache.put("aa2", b"1234")
+    cache.get("aa1")
+    cache.put("aa3", b"1234")
+
+    assert cache.stats()["diskBytes"] == 8
+    assert cache.get("aa2") is None
+    assert cache.get("aa1") == b"1234"
+    assert cache.get("aa3") == b"1234"
+
+
+def test_disk_index_is_rebuilt_on_start(tmp_path):
+    first = ResultCache(max_memory_bytes=0, disk_dir=str(tmp_path), max_disk_bytes=1024)
+    first.put("aa1", b"1234")
+    first.put("bb2", b"123456")
+    legacy = tmp_path / "cc" / "cc3.step"
+    legacy.parent.mkdir()
+    legacy.write_bytes(b"old layout")
+
+    second = ResultCache(max_memory_bytes=0, disk_dir=str(tmp_path), max_disk_bytes=1024)
+
+    assert second.stats()["diskBytes"] == 10
+    assert second.get("bb2") == b"123456"
+    assert not legacy.exists()
@@ -0,0 +1,156 @@
+"""
+JobScheduler admission against a fake resource probe: slots are only
+granted while the container has memory headroom for another job, the queue
+is bounded, and a full queue turns submissions away with a 503 and a
+Retry-After estimate.
+"""
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import scheduler
+
+
+MB = 1024 * 1024
+
+
+class FakeProbe:
+    """Stands in for the cgroup memory readings of resources.py."""
+
+    def __init__(self, limit: int, usage: int):
+        self.limit = limit
+        self.usage = usage
+
+
+@pytest.fixture
+def probe(monkeypatch):
+    probe = FakeProbe(limit=1000 * MB, usage=0)
+    monkeypatch.setattr(scheduler, "memory_limit_bytes", lambda: probe.limit)
+    monkeypatch.setattr(scheduler, "memory_usage_bytes", lambda: probe.usage)
+    return probe
+
+
+async def hold_slot(jobs: scheduler.JobScheduler, job_id: str, started: list, release: asyncio.Event):
+    async with jobs.slot(job_id, "fast"):
+        started.append(job_id)
+        await release.wait()
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_jobs_wait_for_memory_headroom(probe):
+    async def run():
+        # 80% of 1000MB leaves room for 800MB of jobs
+        jobs = scheduler.JobScheduler(
+            {"fast": 4}, max_queue=10, job_memory_bytes=300 * MB, sample_interval=0.01
+        )
+        started = []
+        release = asyncio.Event()
+        probe.usage = 700 * MB
+        monitor = asyncio.create_task(jobs.monitor())
+
+        tasks = [asyncio.create_task(hold_slot(jobs, job_id, started, release)) for job_id in ("a", "b", "c")]
+        await asyncio.sleep(0.05)
+        # The first job always gets through so the queue cannot stall
+        assert started == ["a"]
+        assert jobs.queued == 2
+
+        probe.usage = 100 * MB
+        await asyncio.sleep(0.05)
+        assert started == ["a", "b", "c"]
+
+        release.set()
+        await asyncio.gather(*tasks)
+        monitor.cancel()
+        assert jobs.running == 0
+
+    asyncio.run(run())
+
+
+def test_lane_limit_applies_without_memory_limit(probe):
+    async def run():
+        probe.limit = None
+        jobs = scheduler.JobScheduler({"fast": 2}, max_queue=10, job_memory_bytes=300 * MB)
+        started = []
+        release = asyncio.Event()
+
+        tasks = [asyncio.create_task(hold_slot(jobs, job_id, started, release)) for job_id in ("a", "b", "c")]
+        await settle()
+        assert started == ["a", "b"]
+        assert jobs.position("c") == 1
+
+        release.set()
+        await asyncio.gather(*tasks)
+        assert started == ["a", "b", "c"]
+
+    asyncio.run(run())
+
+
+def test_queue_is_bounded(probe):
+    jobs = scheduler.JobScheduler({"fast": 1}, max_queue=2, job_memory_bytes=300 * MB)
+    jobs.reserve("a", "fast")
+    jobs.reserve("b", "fast")
+
+    with pytest.raises(scheduler.QueueFullError) as excinfo:
+        jobs.reserve("c", "fast")
+
+    # Two queued jobs of 30 seconds each ahead of a single slot
+    assert excinfo.value.retry_after == 60
+    assert jobs.queued == 2
+    assert jobs.rejected == 1
+
+
+def test_reserve_many_is_all_or_nothing(probe):
+    jobs = scheduler.JobScheduler({"fast": 1}, max_queue=3, job_memory_bytes=300 * MB)
+    jobs.reserve("a", "fast")
+
+    with pytest.raises(scheduler.QueueFullError):
+        jobs.reserve_many({job_id: ("fast", "client", 1.0) for job_id in ("b", "c", "d")})
+    assert jobs.queued == 1
+
+    jobs.cancel("a")
+    jobs.reserve_many({job_id: ("fast", "client", 1.0) for job_id in ("b", "c", "d")})
+    assert jobs.queued == 3
+
+
+def test_full_queue_returns_503_with_retry_after(probe, monkeypatch):
+    jobs = scheduler.JobScheduler({"fast": 1, "heavy": 1}, max_queue=1, job_memory_bytes=300 * MB)
+    jobs.reserve("queued", "fast")
+    monkeypatch.setattr(main, "scheduler", jobs)
+
+    response = TestClient(main.app).post("/convert", json={"code": "cube(1);"})
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(jobs.retry_after())
+    assert jobs.queued == 1
+
+
+def test_client_with_one_job_is_served_within_a_round(probe):
+    async def run():
+        jobs = scheduler.JobScheduler({"fast": 1}, max_queue=10, job_memory_bytes=300 * MB)
+        started = []
+        release = asyncio.Event()
+
+        job_ids = [f"a{index}" for index in range(5)]
+        for job_id in job_ids:
+            jobs.reserve(job_id, "fast", client="a")
+        jobs.reserve("b0", "fast", client="b")
+        tasks = [
+            asyncio.create_task(hold_slot(jobs, job_id, started, release))
+            for job_id in job_ids + ["b0"]
+        ]
+        await settle()
+        assert started == ["a0"]
+
+        release.set()
+        await asyncio.gather(*tasks)
+        # b0 takes the slot right after client a's first job, not behind all of them
+        assert started[:2] == ["a0", "b0"]
+        assert started[2:] == job_ids[1:]
+
+    asyncio.run(run())
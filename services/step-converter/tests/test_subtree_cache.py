@@ -0,0 +1,80 @@
+"""
+Assembly of cached subtrees matches importCSG: color and render pass their
+children's shapes through unfused, booleans combine them into one, and
+subtrees reading files are never cached.
+"""
+from csg import parse_csg
+from subtree_cache import _Builder, _combine, SubtreeCache
+
+
+class FakeShape:
+    """Records the operations that produced it."""
+
+    def __init__(self, label: str):
+        self.label = label
+
+    def multiFuse(self, others):
+        return FakeShape("fuse(" + ",".join(s.label for s in [self] + others) + ")")
+
+    def cut(self, tool):
+        return FakeShape(f"cut({self.label},{tool.label})")
+
+    def common(self, other):
+        return FakeShape(f"common({self.label},{other.label})")
+
+    def exportBrep(self, path):
+        with open(path, "w") as f:
+            f.write(self.label)
+
+
+def build(tmp_path, text: str) -> list:
+    """Assemble the roots of a CSG text, importing each cube as a shape named by its size."""
+    builder = _Builder(SubtreeCache(str(tmp_path)), "test:", str(tmp_path))
+    nodes = parse_csg(text)
+    for node in nodes:
+        builder.plan(node)
+    builder.imported = {key: [FakeShape(node.args)] for key, node in builder.imports.items()}
+    return [shape.label for node in nodes for shape in builder.build(node)]
+
+
+def test_color_passes_children_through(tmp_path):
+    assert build(tmp_path, "color([1, 0, 0, 1]) { cube(size = 1); cube(size = 2); }") == [
+        "size = 1", "size = 2"
+    ]
+
+
+def test_render_inside_union_is_fused_with_siblings(tmp_path):
+    shapes = build(
+        tmp_path, "union() { render(convexity = 2) { cube(size = 1); cube(size = 2); } cube(size = 3); }"
+    )
+
+    assert shapes == ["fuse(size = 1,size = 2,size = 3)"]
+
+
+def test_difference_cuts_first_passed_through_shape(tmp_path):
+    shapes = build(tmp_path, "difference() { color(\"red\") { cube(size = 1); cube(size = 2); } }")
+
+    assert shapes == ["cut(size = 1,size = 2)"]
+
+
+def test_combine_single_shape_is_left_alone():
+    shape = FakeShape("a")
+
+    assert _combine(parse_csg("union() {}")[0], [shape]) == [shape]
+    assert _combine(parse_csg("difference() {}")[0], []) == []
+
+
+def test_boolean_results_are_cached(tmp_path):
+    build(tmp_path, "union() { cube(size = 1); cube(size = 2); }")
+
+    assert len(list(tmp_path.rglob("*.brep"))) == 1
+
+
+def test_subtrees_reading_files_are_not_cached(tmp_path):
+    builder = _Builder(SubtreeCache(str(tmp_path)), "test:", str(tmp_path))
+    (plain, reading) = parse_csg(
+        'hull() { cube(size = 1); } hull() { group() { import(file = "a.stl"); } }'
+    )
+
+    assert builder.cacheable(plain)
+    assert not builder.cacheable(reading)
@@ -0,0 +1,95 @@
+"""
+Reusable scratch directories for conversions. Every conversion writes its
+code, CSG tree, FreeCAD script and outputs to a workspace and reads the
+outputs back; pointing the pool at a tmpfs keeps that traffic in memory, and
+handing out emptied directories saves creating and removing one per run.
+"""
+import os
+import shutil
+import tempfile
+import threading
+from typing import List, Optional
+
+
+class WorkspacePool:
+    """
+    Directories below directory, of which up to size are kept for reuse.
+
+    acquire() hands out an empty directory and release() empties it again.
+    When every kept directory is in use a new one is created, and removed
+    once it is released. The pool's directories live in one subdirectory of
+    their own, so processes sharing directory never hand out each other's.
+    """
+
+    def __init__(self, directory: str, size: int):
+        self.directory = directory
+        self.size = size
+        self._root: Optional[str] = None
+        self._idle: List[str] = []
+        self._kept = 0
+        self._lock = threading.Lock()
+
+    def _ensure_root(self) -> str:
+        if self._root is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._root = tempfile.mkdtemp(prefix="scad_workspaces_", dir=self.directory)
+        return self._root
+
+    def prefill(self):
+        """Create the kept directories ahead of the first conversions."""
+        with self._lock:
+            root = self._ensure_root()
+            while self._kept < self.size:
+                self._idle.append(tempfile.mkdtemp(dir=root))
+                self._kept += 1
+
+    def acquire(self) -> str:
+        """An empty directory for one conversion; pass it to release() when done."""
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+            root = self._ensure_root()
+            if self._kept < self.size:
+                self._kept += 1
+            return tempfile.mkdtemp(dir=root)
+
+    def release(self, path: str):
+        """Empty a directory from acquire() and keep it for reuse, or remove it."""
+        emptied = _empty_directory(path)
+        with self._lock:
+            # Fewer idle than kept directories means a kept one is out; this takes its place
+            if len(self._idle) < self._kept:
+                if emptied:
+                    self._idle.append(path)
+                    return
+                # A fresh directory is created in its place on demand
+                self._kept -= 1
+        shutil.rmtree(path, ignore_errors=True)
+
+    def shares_filesystem(self, path: str) -> bool:
+        """Whether files under path can be hard-linked into the pool's directories."""
+        with self._lock:
+            root = self._ensure_root()
+        return os.stat(path).st_dev == os.stat(root).st_dev
+
+    def close(self):
+        """Remove every directory of the pool."""
+        with self._lock:
+            root, self._root = self._root, None
+            self._idle.clear()
+            self._kept = 0
+        if root is not None:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+def _empty_directory(path: str) -> bool:
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    shutil.rmtree(entry.path)
+                else:
+                    os.unlink(entry.path)
+    except OSError:
+        return False
+    return True
@@ -2,9 +2,10 @@ import { useState, useCallback, useRef } from 'react';
 import {
   submitStepConversion,
   checkStepJobStatus,
+  cancelStepJob,
   downloadStepFile,
 } from '@/services/stepExportService';
-import { StepJobStatus } from '@/types/stepExport';
+import { StepJobPhase, StepJobStatus } from '@/types/stepExport';
 import { downloadFile, generateDownloadFilename } from '@/utils/downloadUtils';
 import { Message } from '@shared/types';
 import { toast } from '@/hooks/use-toast';
@@ -26,8 +27,18 @@ interface UseStepExportReturn {
   cancel: () => void;
 }
 
-const POLL_INTERVAL_MS = 1500;
-const MAX_POLL_ATTEMPTS = 120; // 3 minutes max
+// Status requests long-poll on the server, so polls can follow each other
+const STATUS_WAIT_SECONDS = 20;
+const POLL_INTERVAL_MS = 250;
+const MAX_EXPORT_MS = 3 * 60 * 1000; // 3 minutes max
+
+const PHASE_PROGRESS: Record<StepJobPhase, string> = {
+  queued: 'Waiting in queue...',
+  openscad: 'Evaluating OpenSCAD...',
+  freecad_import: 'Building solids...',
+  refine: 'Refining shapes...',
+  export: 'Writing STEP file...',
+};
 
 export function useStepExport(
   options?: UseStepExportOptions,
@@ -38,10 +49,16 @@ export function useStepExport(
   const [error, setError] = useState<Error | null>(null);
 
   const cancelledRef = useRef(false);
+  const jobIdRef = useRef<string | null>(null);
   const pollTimeoutRef = useRef<ReturnType<typeof setTimeout> | null>(null);
 
   const cancel = useCallback(() => {
     cancelledRef.current = true;
+    // Free the server's conversion slot instead of letting the job run on
+    if (jobIdRef.current) {
+      cancelStepJob(jobIdRef.current).catch(() => {});
+      jobIdRef.current = null;
+    }
     if (pollTimeoutRef.current) {
       clearTimeout(pollTimeoutRef.current);
       pollTimeoutRef.current = null;
@@ -55,6 +72,7 @@ export function useStepExport(
     async (code: string, currentMessage?: Message | null) => {
       // Reset state
       cancelledRef.current = false;
+      jobIdRef.current = null;
       setIsExporting(true);
       setError(null);
       setStatus('pending');
@@ -70,32 +88,44 @@ export function useStepExport(
         // Submit job
         const { jobId } = await submitStepConversion(code, baseName);
 
-        if (cancelledRef.current) return;
+        if (cancelledRef.current) {
+          cancelStepJob(jobId).catch(() => {});
+          return;
+        }
+        jobIdRef.current = jobId;
 
         // Poll for completion
-        let attempts = 0;
+        const deadline = Date.now() + MAX_EXPORT_MS;
         const poll = async (): Promise<void> => {
           if (cancelledRef.current) return;
 
-          attempts++;
-          if (attempts > MAX_POLL_ATTEMPTS) {
+          if (Date.now() > deadline) {
             throw new Error('Conversion timed out');
           }
 
-          const statusResponse = await checkStepJobStatus(jobId);
+          const statusResponse = await checkStepJobStatus(
+            jobId,
+            STATUS_WAIT_SECONDS,
+          );
+          if (cancelledRef.current) return;
           setStatus(statusResponse.status);
 
           switch (statusResponse.status) {
             case 'pending':
               setProgress('Waiting in queue...');
               break;
-            case 'processing':
-              setProgress('Converting to STEP...');
+            case 'processing': {
+              const phase = statusResponse.phase;
+              setProgress(
+                (phase && PHASE_PROGRESS[phase]) || 'Converting to STEP...',
+              );
               break;
+            }
             case 'completed': {
               setProgress('Downloading...');
               // Download and trigger browser download
               const stepBlob = await downloadStepFile(jobId);
+              jobIdRef.current = null;
               downloadFile({
                 content: stepBlob,
                 filename: `${baseName}.step`,
@@ -112,7 +142,15 @@ export function useStepExport(
               return;
             }
             case 'failed':
+              jobIdRef.current = null;
               throw new Error(statusResponse.error || 'Conversion failed');
+            case 'cancelled':
+              // Cancelled elsewhere; nothing left to wait for
+              jobIdRef.current = null;
+              setIsExporting(false);
+              setStatus(null);
+              setProgress('');
+              return;
           }
 
           // Continue polling
@@ -121,6 +159,11 @@ export function useStepExport(
 
         await poll();
       } catch (err) {
+        // e.g. timed out: stop the conversion rather than leave it running
+        if (jobIdRef.current) {
+          cancelStepJob(jobIdRef.current).catch(() => {});
+          jobIdRef.current = null;
+        }
         const error = err instanceof Error ? err : new Error('Unknown error');
         setError(error);
         setIsExporting(false);
@@ -2,6 +2,7 @@ import { supabase } from '@/lib/supabase';
 import {
   StepConvertRequest,
   StepConvertResponse,
+  StepOutputFormat,
   StepStatusResponse,
 } from '@/types/stepExport';
 
@@ -23,10 +24,12 @@ async function getAuthHeaders(): Promise<HeadersInit> {
 export async function submitStepConversion(
   code: string,
   filename?: string,
+  formats?: StepOutputFormat[],
 ): Promise<StepConvertResponse> {
   const request: StepConvertRequest = {
     code,
     filename,
+    formats,
   };
 
   const response = await fetch(
@@ -51,13 +54,16 @@ export async function submitStepConversion(
 }
 
 /**
- * Check conversion job status
+ * Check conversion job status. With waitSeconds the server holds the
+ * request until the job finishes or the wait elapses.
  */
 export async function checkStepJobStatus(
   jobId: string,
+  waitSeconds = 0,
 ): Promise<StepStatusResponse> {
+  const query = waitSeconds > 0 ? `?wait=${waitSeconds}` : '';
   const response = await fetch(
-    `${SUPABASE_URL}/functions/v1/step-converter/status/${jobId}`,
+    `${SUPABASE_URL}/functions/v1/step-converter/status/${jobId}${query}`,
     {
       method: 'GET',
       headers: await getAuthHeaders(),
@@ -75,11 +81,36 @@ export async function checkStepJobStatus(
 }
 
 /**
- * Download completed STEP file
+ * Cancel a queued or running conversion job
  */
-export async function downloadStepFile(jobId: string): Promise<Blob> {
+export async function cancelStepJob(jobId: string): Promise<void> {
   const response = await fetch(
-    `${SUPABASE_URL}/functions/v1/step-converter/download/${jobId}`,
+    `${SUPABASE_URL}/functions/v1/step-converter/jobs/${jobId}`,
+    {
+      method: 'DELETE',
+      headers: await getAuthHeaders(),
+    },
+  );
+
+  // 409 means the job finished before it could be cancelled
+  if (!response.ok && response.status !== 409) {
+    const error = await response
+      .json()
+      .catch(() => ({ error: 'Unknown error' }));
+    throw new Error(error.error || error.detail || 'Failed to cancel job');
+  }
+}
+
+/**
+ * Download a completed file; format must have been requested at submission
+ */
+export async function downloadStepFile(
+  jobId: string,
+  format: StepOutputFormat = 'step',
+): Promise<Blob> {
+  const path = format === 'step' ? jobId : `${jobId}/${format}`;
+  const response = await fetch(
+    `${SUPABASE_URL}/functions/v1/step-converter/download/${path}`,
     {
       method: 'GET',
       headers: await getAuthHeaders(),
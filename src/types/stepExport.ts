@@ -2,11 +2,65 @@
  * Types for STEP export functionality
  */
 
-export type StepJobStatus = 'pending' | 'processing' | 'completed' | 'failed';
+export type StepJobStatus =
+  | 'pending'
+  | 'processing'
+  | 'completed'
+  | 'failed'
+  | 'cancelled';
+
+export type StepJobPhase =
+  | 'queued'
+  | 'openscad'
+  | 'freecad_import'
+  | 'refine'
+  | 'export';
+
+export type StepOutputFormat = 'step' | 'brep' | 'stl' | '3mf' | 'glb';
+
+export type StepRefinePolicy = 'always' | 'never' | 'auto';
+
+// Clamps $fn/$fa/$fs; each level is cached separately
+export type StepQuality = 'draft' | 'normal' | 'exact';
+
+export interface StepRefineReport {
+  policy: StepRefinePolicy;
+  decision: 'full' | 'per_solid' | 'skipped';
+  // Face and solid counts before refine
+  faces: number;
+  solids: number;
+  refinedFaces?: number;
+  // Processes the solids were refined in
+  workers?: number;
+}
+
+export type StepLane = 'fast' | 'heavy';
+
+// Static cost estimate of the code; a lone cube scores 1
+export interface StepComplexity {
+  score: number;
+  minkowski: number;
+  hull: number;
+  sweeps: number;
+  loopIterations: number;
+  fragments: number;
+}
 
 export interface StepConvertRequest {
   code: string;
   filename?: string;
+  // STEP is always produced; list extra formats to export alongside it
+  formats?: StepOutputFormat[];
+  meshDeflection?: number;
+  refine?: StepRefinePolicy;
+  // Processes to refine independent solids in; capped by the service
+  solidWorkers?: number;
+  quality?: StepQuality;
+  // Record a profile, served by the service's GET /profile/{jobId}
+  profile?: boolean;
+  // Files the code includes, uses or imports: project path -> SHA-256 of a
+  // blob uploaded beforehand
+  files?: Record<string, string>;
 }
 
 export interface StepConvertResponse {
@@ -20,6 +74,14 @@ export interface StepStatusResponse {
   error?: string;
   createdAt: string;
   completedAt?: string;
+  phase?: StepJobPhase;
+  queuePosition?: number;
+  formats?: StepOutputFormat[];
+  refine?: StepRefineReport;
+  quality?: StepQuality;
+  complexity?: StepComplexity;
+  lane?: StepLane;
+  profile?: boolean;
 }
 
 export interface StepExportState {
@@ -12,38 +12,64 @@ const STEP_CONVERTER_SECRET = Deno.env.get('STEP_CONVERTER_API_SECRET') ?? '';
 // Extended CORS headers for GET requests
 const extendedCorsHeaders = {
   ...corsHeaders,
-  'Access-Control-Allow-Methods': 'POST, GET, OPTIONS',
+  'Access-Control-Allow-Methods': 'POST, GET, PUT, DELETE, OPTIONS',
 };
 
 // Request/Response types
+type OutputFormat = 'step' | 'brep' | 'stl' | '3mf' | 'glb';
+
 interface ConvertRequest {
   code: string;
   filename?: string;
+  formats?: OutputFormat[];
+  meshDeflection?: number;
+  refine?: 'always' | 'never' | 'auto';
+  solidWorkers?: number;
+  quality?: 'draft' | 'normal' | 'exact';
+  profile?: boolean;
+  // Project path -> SHA-256 of a blob uploaded through /blobs/{hash}
+  files?: Record<string, string>;
 }
 
+type JobStatus =
+  | 'pending'
+  | 'processing'
+  | 'completed'
+  | 'failed'
+  | 'cancelled';
+
 interface ConvertResponse {
   jobId: string;
-  status: 'pending' | 'processing' | 'completed' | 'failed';
+  status: JobStatus;
 }
 
 interface StatusResponse {
   jobId: string;
-  status: 'pending' | 'processing' | 'completed' | 'failed';
+  status: JobStatus;
   error?: string;
   createdAt: string;
   completedAt?: string;
+  phase?: string;
+  queuePosition?: number;
 }
 
-// Helper to make authenticated requests to FreeCAD service
+// Helper to make authenticated requests to FreeCAD service; clientId is the
+// user the service shares its queue fairly between
 function converterRequest(
   path: string,
   options: RequestInit = {},
+  clientId?: string,
 ): Promise<Response> {
   const headers = new Headers(options.headers);
   if (STEP_CONVERTER_SECRET) {
     headers.set('Authorization', `Bearer ${STEP_CONVERTER_SECRET}`);
   }
-  headers.set('Content-Type', 'application/json');
+  if (clientId) {
+    headers.set('X-Client-Id', clientId);
+  }
+  if (!headers.has('Content-Type')) {
+    headers.set('Content-Type', 'application/json');
+  }
 
   return fetch(`${STEP_CONVERTER_URL}${path}`, {
     ...options,
@@ -58,11 +84,20 @@ Deno.serve(async (req) => {
   }
 
   const url = new URL(req.url);
-  // Parse path: /step-converter/convert, /step-converter/status/{id}, /step-converter/download/{id}
+  // Parse path: /step-converter/convert, /step-converter/status/{id},
+  // /step-converter/events/{id}, /step-converter/download/{id},
+  // /step-converter/download/{id}/{format}, /step-converter/jobs/{id},
+  // /step-converter/blobs/missing, /step-converter/blobs/{hash}
   const pathParts = url.pathname.split('/').filter(Boolean);
   // pathParts[0] is 'step-converter', pathParts[1] is action, pathParts[2] is jobId (if present)
-  const action = pathParts[1]; // 'convert', 'status', or 'download'
+  // 'convert', 'status', 'events', 'download', 'jobs' or 'blobs'
+  const action = pathParts[1];
   const jobId = pathParts[2];
+  // Output format of a download; absent means STEP
+  const format = pathParts[3];
+  // Long-poll seconds for convert and status, passed through unchanged
+  const wait = url.searchParams.get('wait');
+  const waitQuery = wait ? `?wait=${encodeURIComponent(wait)}` : '';
 
   const isGodMode = Deno.env.get('GOD_MODE') === 'true';
 
@@ -74,6 +109,7 @@ Deno.serve(async (req) => {
   });
 
   // In god mode, skip auth check
+  let userId: string | undefined;
   if (!isGodMode) {
     const { data: userData, error: userError } =
       await supabaseClient.auth.getUser();
@@ -84,6 +120,7 @@ Deno.serve(async (req) => {
         headers: { ...extendedCorsHeaders, 'Content-Type': 'application/json' },
       });
     }
+    userId = userData.user.id;
   }
 
   try {
@@ -105,18 +142,31 @@ Deno.serve(async (req) => {
       }
 
       // Forward to FreeCAD service
-      const response = await converterRequest('/convert', {
-        method: 'POST',
-        body: JSON.stringify({
-          code: body.code,
-          filename: body.filename || 'model',
-        }),
-      });
+      const response = await converterRequest(
+        `/convert${waitQuery}`,
+        {
+          method: 'POST',
+          body: JSON.stringify({
+            code: body.code,
+            filename: body.filename || 'model',
+            formats: body.formats,
+            meshDeflection: body.meshDeflection,
+            refine: body.refine,
+            solidWorkers: body.solidWorkers,
+            quality: body.quality,
+            profile: body.profile,
+            files: body.files,
+          }),
+        },
+        userId,
+      );
 
       if (!response.ok) {
         const errorData = await response
           .json()
           .catch(() => ({ detail: 'Conversion service error' }));
+        // Pass through back-off hints when the conversion queue is full
+        const retryAfter = response.headers.get('Retry-After');
         return new Response(
           JSON.stringify({ error: errorData.detail || 'Conversion failed' }),
           {
@@ -124,6 +174,7 @@ Deno.serve(async (req) => {
             headers: {
               ...extendedCorsHeaders,
               'Content-Type': 'application/json',
+              ...(retryAfter ? { 'Retry-After': retryAfter } : {}),
             },
           },
         );
@@ -144,9 +195,44 @@ Deno.serve(async (req) => {
       });
     }
 
+    // POST /step-converter/blobs/missing - Which project files to upload
+    // PUT /step-converter/blobs/{hash} - Upload one project file
+    if (
+      action === 'blobs' &&
+      jobId &&
+      ((req.method === 'POST' && jobId === 'missing') || req.method === 'PUT')
+    ) {
+      const response = await converterRequest(
+        `/blobs/${encodeURIComponent(jobId)}`,
+        req.method === 'PUT'
+          ? {
+              method: 'PUT',
+              headers: { 'Content-Type': 'application/octet-stream' },
+              body: await req.arrayBuffer(),
+            }
+          : { method: 'POST', body: await req.text() },
+      );
+
+      const data = await response
+        .json()
+        .catch(() => ({ detail: 'Blob request failed' }));
+      return new Response(
+        JSON.stringify(
+          response.ok ? data : { error: data.detail || 'Blob request failed' },
+        ),
+        {
+          status: response.status,
+          headers: {
+            ...extendedCorsHeaders,
+            'Content-Type': 'application/json',
+          },
+        },
+      );
+    }
+
     // GET /step-converter/status/{jobId} - Check job status
     if (req.method === 'GET' && action === 'status' && jobId) {
-      const response = await converterRequest(`/status/${jobId}`);
+      const response = await converterRequest(`/status/${jobId}${waitQuery}`);
 
       if (!response.ok) {
         const errorData = await response
@@ -171,6 +257,8 @@ Deno.serve(async (req) => {
         error: data.error,
         createdAt: data.createdAt,
         completedAt: data.completedAt,
+        phase: data.phase,
+        queuePosition: data.queuePosition,
       };
 
       return new Response(JSON.stringify(result), {
@@ -182,9 +270,84 @@ Deno.serve(async (req) => {
       });
     }
 
-    // GET /step-converter/download/{jobId} - Download converted file
+    // DELETE /step-converter/jobs/{jobId} - Cancel a queued or running job
+    if (req.method === 'DELETE' && action === 'jobs' && jobId) {
+      const response = await converterRequest(`/jobs/${jobId}`, {
+        method: 'DELETE',
+      });
+
+      if (!response.ok) {
+        const errorData = await response
+          .json()
+          .catch(() => ({ detail: 'Cancellation failed' }));
+        return new Response(
+          JSON.stringify({ error: errorData.detail || 'Cancellation failed' }),
+          {
+            status: response.status,
+            headers: {
+              ...extendedCorsHeaders,
+              'Content-Type': 'application/json',
+            },
+          },
+        );
+      }
+
+      const data = await response.json();
+      const result: StatusResponse = {
+        jobId: data.jobId,
+        status: data.status,
+        error: data.error,
+        createdAt: data.createdAt,
+        completedAt: data.completedAt,
+      };
+
+      return new Response(JSON.stringify(result), {
+        status: 200,
+        headers: {
+          ...extendedCorsHeaders,
+          'Content-Type': 'application/json',
+        },
+      });
+    }
+
+    // GET /step-converter/events/{jobId} - Server-sent progress events
+    if (req.method === 'GET' && action === 'events' && jobId) {
+      const response = await converterRequest(`/events/${jobId}`);
+
+      if (!response.ok) {
+        const errorData = await response
+          .json()
+          .catch(() => ({ detail: 'Event stream failed' }));
+        return new Response(
+          JSON.stringify({ error: errorData.detail || 'Event stream failed' }),
+          {
+            status: response.status,
+            headers: {
+              ...extendedCorsHeaders,
+              'Content-Type': 'application/json',
+            },
+          },
+        );
+      }
+
+      return new Response(response.body, {
+        status: 200,
+        headers: {
+          ...extendedCorsHeaders,
+          'Content-Type': 'text/event-stream',
+          'Cache-Control': 'no-cache',
+        },
+      });
+    }
+
+    // GET /step-converter/download/{jobId}[/{format}] - Download converted
+    // file (?gzip=true downloads a .gz archive instead)
     if (req.method === 'GET' && action === 'download' && jobId) {
-      const response = await converterRequest(`/download/${jobId}`);
+      const gzip = url.searchParams.get('gzip') === 'true';
+      const formatPath = format ? `/${encodeURIComponent(format)}` : '';
+      const response = await converterRequest(
+        `/download/${jobId}${formatPath}${gzip ? '?gzip=true' : ''}`,
+      );
 
       if (!response.ok) {
         const errorData = await response
@@ -202,17 +365,17 @@ Deno.serve(async (req) => {
         );
       }
 
-      // Forward the STEP file with appropriate headers
-      const stepContent = await response.arrayBuffer();
+      // Stream the file through; fetch has already undone any Content-Encoding
       const contentDisposition =
         response.headers.get('Content-Disposition') ||
         'attachment; filename="model.step"';
 
-      return new Response(stepContent, {
+      return new Response(response.body, {
         status: 200,
         headers: {
           ...extendedCorsHeaders,
-          'Content-Type': 'application/step',
+          'Content-Type':
+            response.headers.get('Content-Type') || 'application/step',
           'Content-Disposition': contentDisposition,
         },
       });